@@ -0,0 +1,252 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import humanize
+
+# asyncio's default of 64KiB per line is too little for a pretty-printed lshw
+STREAM_LINE_LIMIT = 16 * 1024 * 1024
+MEMORY_SAMPLE_SECONDS = 2
+
+
+async def exec_capture(
+    args: List[str], cwd: str = None, env: Dict[str, str] = None
+) -> Tuple[int, bytes, bytes]:
+    p = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        env=env,
+    )
+    stdout, stderr = await p.communicate()
+    return p.returncode, stdout, stderr
+
+
+async def exec_status(
+    args: List[str], cwd: str = None, env: Dict[str, str] = None
+) -> int:
+    # output discarded, for children that background themselves (ssh -f) and would hold a pipe open
+    p = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+        cwd=cwd,
+        env=env,
+    )
+    return await p.wait()
+
+
+async def exec_lines(
+    args: List[str],
+    on_stdout: Callable[[str], None],
+    on_stderr: Callable[[str], None],
+    cwd: str = None,
+    env: Dict[str, str] = None,
+) -> int:
+    # both pipes drained at once so neither can fill up and stall the child
+    p = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        env=env,
+        limit=STREAM_LINE_LIMIT,
+    )
+
+    async def pump(stream, callback):
+        while True:
+            raw = await stream.readline()
+            if not raw:
+                break
+            callback(raw.decode("utf-8", errors="replace"))
+
+    await asyncio.gather(pump(p.stdout, on_stdout), pump(p.stderr, on_stderr))
+    return await p.wait()
+
+
+class SubprocessBridge(object):
+    # lets the synchronous run phases (terraform, ssh benchmarks) running on threads hand their child
+    # processes to the orchestrator's event loop, one loop then spawns and reaps every child of every run
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    def _submit(self, coro):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            coro.close()
+            raise RuntimeError("the event loop can't wait on itself, await it instead")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def capture(
+        self, args: List[str], cwd: str = None, env: Dict[str, str] = None
+    ) -> Tuple[int, bytes, bytes]:
+        return self._submit(exec_capture(args, cwd, env)).result()
+
+    def status(
+        self, args: List[str], cwd: str = None, env: Dict[str, str] = None
+    ) -> int:
+        return self._submit(exec_status(args, cwd, env)).result()
+
+    def stream(
+        self,
+        args: List[str],
+        on_stdout: Callable[[str], None],
+        on_stderr: Callable[[str], None],
+        cwd: str = None,
+        env: Dict[str, str] = None,
+    ) -> int:
+        # the loop only queues lines, the callbacks run on the calling thread same as with Popen,
+        # so one is free to block (e.g. adaptive iperf sending its SIGINT over ssh)
+        lines = queue.SimpleQueue()
+        future = self._submit(
+            exec_lines(
+                args,
+                lambda line: lines.put((on_stdout, line)),
+                lambda line: lines.put((on_stderr, line)),
+                cwd,
+                env,
+            )
+        )
+        future.add_done_callback(lambda f: lines.put((None, None)))
+        while True:
+            callback, line = lines.get()
+            if callback is None:
+                break
+            callback(line)
+        return future.result()
+
+
+def _proc_children() -> Dict[int, List[int]]:
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as fp:
+                stat = fp.read()
+        except OSError:
+            continue
+        # comm may contain spaces, ppid is the second field after it
+        ppid = int(stat[stat.rindex(")") + 2 :].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+def process_tree_rss(pid: int = None) -> Optional[Tuple[int, int, int]]:
+    # (python bytes, other bytes, python processes) for pid and all its descendants,
+    # python is the orchestrator itself plus any pool workers, other is terraform/providers/ssh
+    # None where there's no /proc
+    if not os.path.exists("/proc/self/statm"):
+        return None
+    pid = os.getpid() if pid is None else pid
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    children = _proc_children()
+    python_bytes, other_bytes, python_processes = 0, 0, 0
+    pending = [pid]
+    while len(pending) > 0:
+        p = pending.pop()
+        pending.extend(children.get(p, []))
+        try:
+            with open(f"/proc/{p}/statm", "r") as fp:
+                rss = int(fp.read().split()[1]) * page_size
+            with open(f"/proc/{p}/comm", "r") as fp:
+                comm = fp.read().strip()
+        except OSError:
+            continue
+        if "python" in comm:
+            python_bytes += rss
+            python_processes += 1
+        else:
+            other_bytes += rss
+    return python_bytes, other_bytes, python_processes
+
+
+class MemorySampler(object):
+    # samples the orchestrator's process tree in the background while runs are in flight,
+    # per run is how much the python side grew over its idle baseline divided by the most runs in flight
+    def __init__(
+        self,
+        mode: str,
+        in_flight: Callable[[], int],
+        interval: float = MEMORY_SAMPLE_SECONDS,
+    ):
+        self.mode = mode
+        self.in_flight = in_flight
+        self.interval = interval
+        self.baseline = None
+        self.peak_python = 0
+        self.peak_other = 0
+        self.peak_in_flight = 0
+        self.peak_python_processes = 0
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._sample_loop, daemon=True)
+
+    def _sample(self):
+        rss = process_tree_rss()
+        if rss is None:
+            return
+        python_bytes, other_bytes, python_processes = rss
+        if self.baseline is None:
+            self.baseline = python_bytes
+        self.peak_python = max(self.peak_python, python_bytes)
+        self.peak_other = max(self.peak_other, other_bytes)
+        self.peak_python_processes = max(self.peak_python_processes, python_processes)
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight())
+        self.samples += 1
+
+    def _sample_loop(self):
+        while not self.stopped.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+    def report(self) -> Dict:
+        per_run = None
+        if self.baseline is not None and self.peak_in_flight > 0:
+            per_run = (self.peak_python - self.baseline) / self.peak_in_flight
+        return {
+            "mode": self.mode,
+            "at": time.time(),
+            "samples": self.samples,
+            "baseline_bytes": self.baseline,
+            "peak_python_bytes": self.peak_python,
+            "peak_python_processes": self.peak_python_processes,
+            "peak_other_bytes": self.peak_other,
+            "peak_in_flight": self.peak_in_flight,
+            "per_run_bytes": per_run,
+        }
+
+
+def record_memory_report(report: Dict, report_file: str):
+    # one line per orchestrator run, so process pool and asyncio runs of a cohort can be compared later
+    os.makedirs(os.path.dirname(report_file), exist_ok=True)
+    with open(report_file, "a", encoding="utf-8") as fp:
+        fp.write(json.dumps(report) + "\n")
+
+
+def print_memory_report(report: Dict):
+    if report["per_run_bytes"] is None:
+        return
+    print(
+        f"[*] Memory ({report['mode']}): {humanize.naturalsize(report['per_run_bytes'])} per in-flight run, "
+        f"{humanize.naturalsize(report['peak_python_bytes'])} peak over {report['peak_python_processes']} python processes "
+        f"for {report['peak_in_flight']} runs (idle {humanize.naturalsize(report['baseline_bytes'])}), "
+        f"terraform/ssh children peak {humanize.naturalsize(report['peak_other_bytes'])}",
+        flush=True,
+    )
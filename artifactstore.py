@@ -0,0 +1,235 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import zipfile
+import zlib
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+from logstream import SECTION_INDEX_SUFFIX, split_sections
+
+# artifacts/<cohort>/<combo>/<uuid>.zip, one archive per run holding its index and the files unique to it
+RUN_ARCHIVE_SUFFIX = ".zip"
+RUN_INDEX = "index.json"
+# artifacts/<cohort>/blobs/<aa>/<sha256>.z, content seen in more than one run (demographics, identical stderr, ...)
+BLOB_DIR = "blobs"
+BLOB_DB = "blobs.sqlite"
+# files in the cohort dir that aren't combos
+COHORT_ENTRIES = [BLOB_DIR]
+
+
+class PackStats(NamedTuple):
+    files: int
+    bytes_before: int
+    bytes_after: int
+    shared: int
+
+
+def logical_name(filename: str) -> str:
+    # gzip headers carry an mtime, so identical logs only dedupe once decompressed
+    return filename[: -len(".gz")] if filename.endswith(".log.gz") else filename
+
+
+def list_runs(cohort_dir: str) -> Iterator[Tuple[str, str, str]]:
+    # (combo, uuid, path) for unpacked run dirs and packed archives alike
+    for combo in sorted(os.listdir(cohort_dir)):
+        combo_dir = os.path.join(cohort_dir, combo)
+        if combo in COHORT_ENTRIES or not os.path.isdir(combo_dir):
+            continue
+        for entry in sorted(os.listdir(combo_dir)):
+            path = os.path.join(combo_dir, entry)
+            if os.path.isdir(path):
+                yield combo, entry, path
+            elif entry.endswith(RUN_ARCHIVE_SUFFIX):
+                yield combo, entry[: -len(RUN_ARCHIVE_SUFFIX)], path
+
+
+def disk_usage(path: str) -> Tuple[int, int]:
+    # (files, bytes)
+    files, size = 0, 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            files += 1
+            size += os.path.getsize(os.path.join(root, filename))
+    return files, size
+
+
+class RunDir(object):
+    # read API over an unpacked run, same as RunArchive
+    def __init__(self, path: str):
+        self.path = path
+        self.files = {
+            logical_name(f): f
+            for f in sorted(os.listdir(path))
+            if os.path.isfile(os.path.join(path, f))
+        }
+
+    def names(self) -> List[str]:
+        return list(self.files.keys())
+
+    def read_bytes(self, name: str) -> bytes:
+        filename = self.files[name]
+        opener = gzip.open if filename.endswith(".gz") else open
+        with opener(os.path.join(self.path, filename), "rb") as fp:
+            return fp.read()
+
+    def read_text(self, name: str) -> str:
+        return self.read_bytes(name).decode("utf-8", errors="replace")
+
+    def has_log(self, name: str, stream: str = "stdout") -> bool:
+        return f"{name}.{stream}.log" in self.files
+
+    def read_log(self, name: str, stream: str = "stdout") -> str:
+        return self.read_text(f"{name}.{stream}.log")
+
+    def read_log_sections(
+        self, name: str, stream: str = "stdout"
+    ) -> List[Tuple[str, str]]:
+        # empty for logs written before sections were indexed
+        if f"{name}{SECTION_INDEX_SUFFIX}" not in self.files:
+            return []
+        index = json.loads(self.read_text(f"{name}{SECTION_INDEX_SUFFIX}"))
+        return split_sections(self.read_bytes(f"{name}.{stream}.log"), index, stream)
+
+
+class RunArchive(RunDir):
+    # reads straight out of the zip (or the shared blobs), nothing is unpacked to disk
+    def __init__(self, path: str, blob_dir: str = None):
+        self.path = path
+        if blob_dir is None:
+            blob_dir = os.path.join(os.path.dirname(os.path.dirname(path)), BLOB_DIR)
+        self.blob_dir = blob_dir
+        with zipfile.ZipFile(path, "r") as zf:
+            self.index = json.loads(zf.read(RUN_INDEX))
+        self.files = {name: name for name in self.index}
+
+    def read_bytes(self, name: str) -> bytes:
+        entry = self.index[name]
+        if entry["shared"]:
+            with open(blob_path(self.blob_dir, entry["sha256"]), "rb") as fp:
+                return zlib.decompress(fp.read())
+        with zipfile.ZipFile(self.path, "r") as zf:
+            return zf.read(name)
+
+
+def open_run(path: str):
+    if path.endswith(RUN_ARCHIVE_SUFFIX):
+        return RunArchive(path)
+    return RunDir(path)
+
+
+def blob_path(blob_dir: str, sha256: str) -> str:
+    return os.path.join(blob_dir, sha256[:2], f"{sha256}.z")
+
+
+class ArtifactStore(object):
+    # a hash is inlined in the first run that has it, the second run to produce the same bytes
+    # moves it to the shared blobs, so each distinct blob is stored at most twice no matter how many runs repeat it
+    def __init__(self, cohort_dir: str):
+        self.cohort_dir = cohort_dir
+        self.blob_dir = os.path.join(cohort_dir, BLOB_DIR)
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.db = sqlite3.connect(
+            os.path.join(cohort_dir, BLOB_DB), timeout=60, isolation_level=None
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                first_run TEXT NOT NULL,
+                shared INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+
+    def _write_blob(self, sha256: str, data: bytes):
+        path = blob_path(self.blob_dir, sha256)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.{os.getpid()}.tmp", "wb") as fp:
+            fp.write(zlib.compress(data, 6))
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+    def _claim(self, sha256: str, run_id: str, data: bytes) -> bool:
+        # True if the blob lives in the shared store (now or from before)
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute(
+                "SELECT first_run, shared FROM blobs WHERE sha256 = ?", (sha256,)
+            ).fetchone()
+            if row is None:
+                self.db.execute(
+                    "INSERT INTO blobs (sha256, first_run) VALUES (?, ?)",
+                    (sha256, run_id),
+                )
+                shared = False
+            elif row[1] or row[0] != run_id:
+                if not row[1]:
+                    self._write_blob(sha256, data)
+                    self.db.execute(
+                        "UPDATE blobs SET shared = 1 WHERE sha256 = ?", (sha256,)
+                    )
+                shared = True
+            else:
+                # repacking the run that first had it
+                shared = False
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        return shared
+
+    def pack_run(self, run_dir: str, remove: bool = True) -> PackStats:
+        run_dir = run_dir.rstrip(os.sep)
+        combo = os.path.basename(os.path.dirname(run_dir))
+        run_id = f"{combo}/{os.path.basename(run_dir)}"
+        archive_path = run_dir + RUN_ARCHIVE_SUFFIX
+        _, bytes_before = disk_usage(run_dir)
+
+        run = RunDir(run_dir)
+        index = {}
+        shared = 0
+        with zipfile.ZipFile(
+            archive_path + ".tmp", "w", compression=zipfile.ZIP_DEFLATED
+        ) as zf:
+            for name in run.names():
+                data = run.read_bytes(name)
+                sha256 = hashlib.sha256(data).hexdigest()
+                is_shared = self._claim(sha256, run_id, data)
+                index[name] = {
+                    "sha256": sha256,
+                    "size": len(data),
+                    "mtime": os.path.getmtime(os.path.join(run_dir, run.files[name])),
+                    "shared": is_shared,
+                }
+                if is_shared:
+                    shared += 1
+                else:
+                    zf.writestr(name, data)
+            zf.writestr(RUN_INDEX, json.dumps(index))
+        os.replace(archive_path + ".tmp", archive_path)
+
+        if remove:
+            shutil.rmtree(run_dir, ignore_errors=True)
+        return PackStats(
+            len(index), bytes_before, os.path.getsize(archive_path), shared
+        )
+
+
+def pack_run_dir(args) -> PackStats:
+    # runs in a worker process, one store (and sqlite connection) per call
+    cohort_dir, run_dir = args
+    return ArtifactStore(cohort_dir).pack_run(run_dir)
+
+
+def print_disk_usage(label: str, cohort_dir: str) -> Dict[str, int]:
+    files, size = disk_usage(cohort_dir)
+    blob_files, blob_size = disk_usage(os.path.join(cohort_dir, BLOB_DIR))
+    print(
+        f"[*] {label}: {files} files, {size / 1024 ** 2:0.1f} MiB "
+        f"({blob_files} shared blobs, {blob_size / 1024 ** 2:0.1f} MiB)",
+        flush=True,
+    )
+    return {"files": files, "bytes": size}
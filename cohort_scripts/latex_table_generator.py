@@ -0,0 +1,274 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+from typing import Dict, List
+
+import numpy as np
+from jinja2 import Environment, FileSystemLoader
+
+# cohort_scripts/ is run directly by CI, make the repo modules importable
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from pivot import METRICS, PivotEngine, alphabetical_order, geographic_order
+from pyterra import COHORT, RESULTS_DIR
+from results import ResultStore
+
+PAPER_DIR = "paper"
+# templates are rendered in chunks straight to disk instead of into one big string
+STREAM_BUFFER_SIZE = 64
+
+
+def latex_env() -> Environment:
+    # same delimiters the latex templates already use, so they still read as latex in an editor
+    env = Environment(
+        loader=FileSystemLoader(os.path.join(REPO_DIR, "templates")),
+        block_start_string=r"\BLOCK{",
+        block_end_string="}",
+        variable_start_string=r"\VAR{",
+        variable_end_string="}",
+        comment_start_string=r"\#{",
+        comment_end_string="}",
+        line_statement_prefix="%%",
+        line_comment_prefix="%#",
+        trim_blocks=True,
+        autoescape=False,
+    )
+    return env
+
+
+def html_env() -> Environment:
+    return Environment(
+        loader=FileSystemLoader(os.path.join(REPO_DIR, "templates")), autoescape=True
+    )
+
+
+def latex_escape(s: str) -> str:
+    for c in ["\\", "&", "%", "$", "#", "_", "{", "}"]:
+        s = s.replace(c, f"\\{c}")
+    return s
+
+
+class FragmentCache(object):
+    # rendered fragments are keyed by the hash of their template + input data,
+    # adding a handful of runs only re-renders the tiles those runs touch
+    def __init__(self, fragments_dir: str):
+        self.fragments_dir = fragments_dir
+        os.makedirs(fragments_dir, exist_ok=True)
+        self.rendered = 0
+        self.reused = 0
+        self.used = set()
+
+    def render(
+        self, env: Environment, template_name: str, context: Dict, ext: str
+    ) -> str:
+        key = hashlib.sha256(
+            json.dumps([template_name, context], sort_keys=True, default=str).encode(
+                "utf-8"
+            )
+        ).hexdigest()[:20]
+        path = os.path.join(self.fragments_dir, f"{key}.{ext}")
+        self.used.add(os.path.basename(path))
+        if os.path.exists(path):
+            self.reused += 1
+            return path
+
+        stream = env.get_template(template_name).stream(**context)
+        stream.enable_buffering(STREAM_BUFFER_SIZE)
+        stream.dump(path + ".tmp", encoding="utf-8")
+        os.replace(path + ".tmp", path)
+        self.rendered += 1
+        return path
+
+    def prune(self):
+        # drop fragments no longer referenced by any document
+        for filename in os.listdir(self.fragments_dir):
+            if filename not in self.used:
+                os.remove(os.path.join(self.fragments_dir, filename))
+
+
+def group_regions(
+    regions: List[str], tile_by: str, continents: Dict[str, str]
+) -> Dict[str, List[str]]:
+    groups = {}
+    for region in regions:
+        if tile_by == "continent":
+            group = continents.get(region, "unknown")
+        else:
+            group = region.split("+")[0]
+        groups.setdefault(group, []).append(region)
+    return groups
+
+
+def tiles(order: List[str], tile_by: str, continents: Dict[str, str], max_columns: int):
+    # (row group, col group) blocks of the full matrix, wide blocks split further by column count
+    # split parts are numbered within their own col group, so a new region elsewhere doesn't renumber them
+    groups = group_regions(order, tile_by, continents)
+    for row_group in sorted(groups):
+        for col_group in sorted(groups):
+            cols = groups[col_group]
+            parts = (len(cols) + max_columns - 1) // max_columns
+            for part, i in enumerate(range(0, len(cols), max_columns)):
+                chunk = cols[i : i + max_columns]
+                yield row_group, col_group, groups[row_group], chunk, (part + 1, parts)
+
+
+def latex_tile_context(
+    engine: PivotEngine, metric: str, row_group, col_group, rows, cols, part
+) -> Dict:
+    spec = engine.metrics[metric]
+    values = engine.values(metric)
+    row_ids = [engine.region_ids[r] for r in rows]
+    col_ids = [engine.region_ids[c] for c in cols]
+    block = values[np.ix_(row_ids, col_ids)]
+    text = np.where(np.isnan(block), "--", np.char.mod(spec.fmt, block))
+
+    headers = ["src \\textbackslash{} dst"] + [latex_escape(c) for c in cols]
+    title = f"{metric} {row_group} to {col_group}"
+    label = f"tab:{metric}-{row_group}-{col_group}"
+    index, parts = part
+    if parts > 1:
+        title += f" ({index} of {parts})"
+        label += f"-{index}"
+    return {
+        "title": latex_escape(title),
+        "label": label,
+        "column_str": "|".join(["l"] + ["c"] * len(cols)),
+        "headers": headers,
+        "header_str": " & ".join(headers),
+        "data_strs": [
+            " & ".join([latex_escape(r)] + list(text[i])) + r" \\"
+            for i, r in enumerate(rows)
+        ],
+        "footnote": None,
+    }
+
+
+def html_tile_context(engine: PivotEngine, metric: str, rows, cols) -> Dict:
+    return {
+        "render_headers": True,
+        "col_regions": cols,
+        # materialized so the cache key covers the actual cell values
+        "rows": [
+            {"region": r.region, "cells": [c._asdict() for c in r.cells]}
+            for r in engine.rows(metric, rows, cols)
+        ],
+    }
+
+
+def write_document(
+    path: str, fragment_paths: List[str], include: bool, head_path: str = None
+):
+    # latex documents just \input their fragments, html ones are concatenated chunk by chunk
+    # after the shared head, so the <style>/<h1> block isn't repeated in every tile
+    with open(path + ".tmp", "w", encoding="utf-8") as out:
+        if head_path is not None:
+            with open(head_path, "r", encoding="utf-8") as fp:
+                shutil.copyfileobj(fp, out)
+        for fragment_path in fragment_paths:
+            if include:
+                rel = os.path.relpath(fragment_path, PAPER_DIR).replace(os.sep, "/")
+                out.write(f"\\input{{{rel}}}\n")
+            else:
+                with open(fragment_path, "r", encoding="utf-8") as fp:
+                    shutil.copyfileobj(fp, out)
+    os.replace(path + ".tmp", path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render cohort tables for the paper")
+    parser.add_argument(
+        "--metrics",
+        nargs="+",
+        choices=list(METRICS.keys()),
+        default=list(METRICS.keys()),
+    )
+    parser.add_argument(
+        "--tile-by", choices=["provider", "continent"], default="provider"
+    )
+    parser.add_argument("--continents", help="json of region -> continent")
+    parser.add_argument("--coordinates", help="json of region -> [lat, lon]")
+    parser.add_argument("--max-columns", type=int, default=12)
+    parser.add_argument("--by-geography", action="store_true", default=False)
+    args = parser.parse_args()
+
+    continents = {}
+    if args.continents is not None:
+        with open(args.continents, "r") as fp:
+            continents = json.load(fp)
+    coordinates = {}
+    if args.coordinates is not None:
+        with open(args.coordinates, "r") as fp:
+            coordinates = {r: tuple(c) for r, c in json.load(fp).items()}
+
+    store = ResultStore(os.path.join(RESULTS_DIR, COHORT))
+    engine_path = os.path.join(store.root, "pivot.npz")
+    engine = PivotEngine.load(engine_path)
+    engine.update_from_store(store)
+    if os.path.exists(store.root):
+        engine.save(engine_path)
+
+    if args.by_geography:
+        order = geographic_order(engine.regions, coordinates)
+    else:
+        order = alphabetical_order(engine.regions)
+
+    tables_dir = os.path.join(PAPER_DIR, "tables")
+    html_dir = os.path.join(PAPER_DIR, "html")
+    latex_cache = FragmentCache(os.path.join(tables_dir, "fragments"))
+    html_cache = FragmentCache(os.path.join(html_dir, "fragments"))
+    os.makedirs(tables_dir, exist_ok=True)
+    os.makedirs(html_dir, exist_ok=True)
+
+    latex = latex_env()
+    html = html_env()
+    html_head = html_cache.render(
+        html, "pivot_head.html.jinja2", {"by_geography": args.by_geography}, "html"
+    )
+    for metric in args.metrics:
+        latex_fragments = []
+        html_fragments = []
+        for row_group, col_group, rows, cols, part in tiles(
+            order, args.tile_by, continents, args.max_columns
+        ):
+            latex_fragments.append(
+                latex_cache.render(
+                    latex,
+                    "latex_tables.tex.jinja2",
+                    latex_tile_context(
+                        engine, metric, row_group, col_group, rows, cols, part
+                    ),
+                    "tex",
+                )
+            )
+            html_fragments.append(
+                html_cache.render(
+                    html,
+                    "pivot_tables.html.jinja2",
+                    html_tile_context(engine, metric, rows, cols),
+                    "html",
+                )
+            )
+        write_document(
+            os.path.join(tables_dir, f"{metric}.tex"), latex_fragments, include=True
+        )
+        write_document(
+            os.path.join(html_dir, f"{metric}.html"),
+            html_fragments,
+            include=False,
+            head_path=html_head,
+        )
+
+    latex_cache.prune()
+    html_cache.prune()
+    for name, cache in [("latex", latex_cache), ("html", html_cache)]:
+        print(
+            f"[*] {name}: rendered {cache.rendered} fragments, reused {cache.reused} unchanged"
+        )
+
+
+if __name__ == "__main__":
+    main()
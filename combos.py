@@ -0,0 +1,277 @@
+import argparse
+import hashlib
+import itertools
+import json
+import random
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# (provider, region)
+Region = Tuple[str, str]
+
+# work queue puts are batched so a 45k combo cohort isn't 45k transactions
+QUEUE_BATCH_SIZE = 1000
+
+
+def region_id(region: Region) -> str:
+    return f"{region[0]}+{region[1]}"
+
+
+def combo_str(src: Region, dst: Region) -> str:
+    # same format as str(BenchmarkConfig) for zoneless hosts
+    return f"{region_id(src)}_{region_id(dst)}"
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    # "i/n", 0 <= i < n
+    try:
+        index, count = [int(v) for v in value.split("/")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/n, got {value}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be in [0, {count})")
+    return index, count
+
+
+def shard_of(combo: str, count: int) -> int:
+    # by content rather than position, so orchestrators with differently ordered
+    # (or slightly different) region lists still agree on who owns a combo
+    return int(hashlib.sha1(combo.encode("utf-8")).hexdigest()[:8], 16) % count
+
+
+def parse_provider_pairs(pairs: List[str]) -> Set[Tuple[str, str]]:
+    # "aws:gcp" matches either direction
+    parsed = set()
+    for pair in pairs:
+        a, b = pair.split(":")
+        parsed.add(tuple(sorted([a, b])))
+    return parsed
+
+
+def iter_region_pairs(
+    regions: List[Region], round_robin: bool = True
+) -> Iterator[Tuple[Region, Region]]:
+    # intra-region pairs first, then every unordered inter-region pair, nothing materialized
+    for region in regions:
+        yield region, region
+    if round_robin:
+        yield from itertools.combinations(regions, 2)
+
+
+def count_region_pairs(num_regions: int, round_robin: bool = True) -> int:
+    if round_robin:
+        return num_regions + num_regions * (num_regions - 1) // 2
+    return num_regions
+
+
+def iter_pairs(
+    regions: List[Region],
+    round_robin: bool = True,
+    provider_pairs: Optional[Set[Tuple[str, str]]] = None,
+    continents: Optional[Set[str]] = None,
+    region_continents: Optional[Dict[str, str]] = None,
+) -> Iterator[Tuple[Region, Region]]:
+    for src, dst in iter_region_pairs(regions, round_robin):
+        if (
+            provider_pairs is not None
+            and tuple(sorted([src[0], dst[0]])) not in provider_pairs
+        ):
+            continue
+        if continents is not None:
+            if region_continents.get(region_id(src)) not in continents:
+                continue
+            if region_continents.get(region_id(dst)) not in continents:
+                continue
+        yield src, dst
+
+
+def iter_combos(
+    pairs: Iterable[Tuple[Region, Region]], shard: Optional[Tuple[int, int]] = None
+) -> Iterator[str]:
+    for src, dst in pairs:
+        combo = combo_str(src, dst)
+        if shard is not None and shard_of(combo, shard[1]) != shard[0]:
+            continue
+        yield combo
+
+
+# upper edges of the great-circle distance bands, the last band is open ended
+DISTANCE_BANDS_KM = [50, 500, 2000, 5000, 10000]
+
+
+def distance_band(km: Optional[float]) -> str:
+    if km is None:
+        return "unknown"
+    lower = 0
+    for upper in DISTANCE_BANDS_KM:
+        if km < upper:
+            return f"{lower}-{upper}km"
+        lower = upper
+    return f">={lower}km"
+
+
+def pair_stratum(
+    src: Region, dst: Region, coordinates: Dict[str, Tuple[float, float]]
+) -> Tuple[str, str]:
+    from geopy.distance import great_circle
+
+    km = None
+    if region_id(src) in coordinates and region_id(dst) in coordinates:
+        km = great_circle(coordinates[region_id(src)], coordinates[region_id(dst)]).km
+    return ":".join(sorted([src[0], dst[0]])), distance_band(km)
+
+
+def sample_pairs(
+    pairs: Iterable[Tuple[Region, Region]],
+    coordinates: Dict[str, Tuple[float, float]],
+    budget: int,
+    seed: int = 0,
+) -> Tuple[List[Tuple[Region, Region]], Dict]:
+    # budgeted subset stratified by (provider pair, distance band):
+    #   1. one pair from every stratum
+    #   2. one pair for every region still missing, pairing up missing regions where possible
+    #   3. the rest of the budget split across strata in proportion to their size
+    # coverage wins over the budget, a too-small budget is reported rather than silently undercut
+    # deterministic for a given seed, so sharded orchestrators all draw the same sample
+    rng = random.Random(seed)
+    pairs = list(pairs)
+    strata = {}
+    region_pairs = {}
+    for i, (src, dst) in enumerate(pairs):
+        strata.setdefault(pair_stratum(src, dst, coordinates), []).append(i)
+        region_pairs.setdefault(src, []).append(i)
+        if dst != src:
+            region_pairs.setdefault(dst, []).append(i)
+
+    chosen = set()
+    covered = set()
+
+    def choose(i):
+        chosen.add(i)
+        covered.update(pairs[i])
+
+    for stratum in sorted(strata):
+        choose(rng.choice(strata[stratum]))
+
+    for region in sorted(region_pairs):
+        if region in covered:
+            continue
+        candidates = region_pairs[region]
+        pairing_up = [
+            i
+            for i in candidates
+            if pairs[i][0] not in covered and pairs[i][1] not in covered
+        ]
+        choose(rng.choice(pairing_up if len(pairing_up) > 0 else candidates))
+
+    remaining = budget - len(chosen)
+    if remaining > 0:
+        unchosen = {
+            stratum: [i for i in members if i not in chosen]
+            for stratum, members in strata.items()
+        }
+        total = sum(len(members) for members in unchosen.values())
+        if total > 0:
+            # largest remainder so the allocations add up to exactly the budget
+            shares = {
+                s: min(len(m), remaining * len(m) / total) for s, m in unchosen.items()
+            }
+            allocation = {s: int(share) for s, share in shares.items()}
+            leftover = min(remaining, total) - sum(allocation.values())
+            for s in sorted(
+                shares, key=lambda s: shares[s] - allocation[s], reverse=True
+            ):
+                if leftover <= 0:
+                    break
+                if allocation[s] < len(unchosen[s]):
+                    allocation[s] += 1
+                    leftover -= 1
+            for s in sorted(unchosen):
+                for i in rng.sample(unchosen[s], allocation[s]):
+                    choose(i)
+
+    sample = [pairs[i] for i in sorted(chosen)]
+    return sample, coverage_report(pairs, sample, strata, budget)
+
+
+def coverage_report(
+    pairs: List[Tuple[Region, Region]],
+    sample: List[Tuple[Region, Region]],
+    strata: Dict[Tuple[str, str], List[int]],
+    budget: int,
+) -> Dict:
+    sampled = set(sample)
+    regions = set(r for pair in pairs for r in pair)
+    sampled_regions = set(r for pair in sample for r in pair)
+    report = {
+        "budget": budget,
+        "full": len(pairs),
+        "sampled": len(sample),
+        "over_budget": max(0, len(sample) - budget),
+        "regions": {"total": len(regions), "covered": len(sampled_regions)},
+        "bands": {},
+        "provider_pairs": {},
+    }
+    for (provider_pair, band), members in sorted(strata.items()):
+        hits = sum(1 for i in members if pairs[i] in sampled)
+        for key, name in [("bands", band), ("provider_pairs", provider_pair)]:
+            entry = report[key].setdefault(name, {"full": 0, "sampled": 0})
+            entry["full"] += len(members)
+            entry["sampled"] += hits
+    # nearest band first rather than alphabetical
+    labels = [distance_band(0)] + [distance_band(km) for km in DISTANCE_BANDS_KM]
+    report["bands"] = {
+        b: report["bands"][b] for b in labels + ["unknown"] if b in report["bands"]
+    }
+    return report
+
+
+def print_coverage_report(report: Dict, fp=None):
+    print(
+        f"[*] Sampled {report['sampled']} of {report['full']} combos "
+        f"({100.0 * report['sampled'] / max(report['full'], 1):.1f}%), budget {report['budget']}",
+        file=fp,
+    )
+    if report["over_budget"] > 0:
+        print(
+            f"[!] covering every stratum and region took {report['over_budget']} combos over budget",
+            file=fp,
+        )
+    print(
+        f"[*] Regions covered: {report['regions']['covered']}/{report['regions']['total']}",
+        file=fp,
+    )
+    for key in ["bands", "provider_pairs"]:
+        print(f"[*] {key.replace('_', ' ')}:", file=fp)
+        for name, entry in report[key].items():
+            print(
+                f"    {name:>20} {entry['sampled']:>6}/{entry['full']:<6} "
+                f"({100.0 * entry['sampled'] / entry['full']:.1f}%)",
+                file=fp,
+            )
+
+
+def write_combos(combos: Iterable[str], fp) -> int:
+    written = 0
+    for combo in combos:
+        fp.write(combo + "\n")
+        written += 1
+    return written
+
+
+def put_combos(combos: Iterable[str], work_queue) -> int:
+    added = 0
+    batch = []
+    for combo in combos:
+        batch.append(combo)
+        if len(batch) >= QUEUE_BATCH_SIZE:
+            added += work_queue.put(batch)
+            batch = []
+    if len(batch) > 0:
+        added += work_queue.put(batch)
+    return added
+
+
+def load_region_continents(path: str) -> Dict[str, str]:
+    # json of "provider+region" -> continent
+    with open(path, "r") as fp:
+        return json.load(fp)
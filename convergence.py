@@ -0,0 +1,87 @@
+import math
+from typing import List, NamedTuple, Optional, Tuple
+
+from results import IPERF_INTERVAL_RE, UNIT_SCALE
+
+# two-sided 95% t critical values by degrees of freedom, normal beyond the table
+# fmt: off
+T_95 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]
+# fmt: on
+Z_95 = 1.96
+
+
+class IperfSettings(NamedTuple):
+    # adaptive runs stop once the mean throughput's 95% confidence interval is within
+    # +-tolerance of it, but never before min_seconds and never past max_seconds
+    adaptive: bool = False
+    tolerance: float = 0.05
+    min_seconds: float = 10
+    max_seconds: float = 60
+    # --parallel stream counts, each one is a full src->dst/dst->src pass
+    parallel: Tuple[int, ...] = (1,)
+    # slow start, not representative of the link
+    warmup_seconds: float = 2
+    interval_seconds: float = 1
+
+
+def t_critical(dof: int) -> float:
+    if dof < 1:
+        return math.inf
+    return T_95[dof - 1] if dof <= len(T_95) else Z_95
+
+
+class ConvergenceMonitor(object):
+    # fed iperf's per-interval report lines as they stream, one monitor per direction per pass
+    def __init__(self, settings: IperfSettings, parallel: int = 1):
+        self.settings = settings
+        self.parallel = parallel
+        self.samples: List[float] = []
+        self.elapsed = 0.0
+        self.stopped_at: Optional[float] = None
+
+    def feed(self, line: str) -> bool:
+        # True the first time the run has converged
+        m = IPERF_INTERVAL_RE.match(line.strip())
+        if m is None or self.stopped_at is not None:
+            return False
+        stream, start, end = m.group(1), float(m.group(2)), float(m.group(3))
+        # with several streams only the [SUM] lines describe the link
+        if self.parallel > 1 and not stream.startswith("SUM"):
+            return False
+        # the 0.00-<end> summary iperf prints when it's done isn't an interval
+        if abs((end - start) - self.settings.interval_seconds) > 0.5:
+            return False
+        self.elapsed = end
+        if start >= self.settings.warmup_seconds:
+            self.samples.append(float(m.group(6)) * UNIT_SCALE.get(m.group(7), 1.0))
+        if self.converged():
+            self.stopped_at = end
+            return True
+        return False
+
+    def relative_half_width(self) -> float:
+        n = len(self.samples)
+        if n < 2:
+            return math.inf
+        mean = sum(self.samples) / n
+        if mean <= 0:
+            return math.inf
+        std = math.sqrt(sum((s - mean) ** 2 for s in self.samples) / (n - 1))
+        return t_critical(n - 1) * std / math.sqrt(n) / mean
+
+    def converged(self) -> bool:
+        if self.elapsed < self.settings.min_seconds:
+            return False
+        return self.relative_half_width() <= self.settings.tolerance
+
+    def summary(self) -> str:
+        n = len(self.samples)
+        mean = sum(self.samples) / n if n > 0 else 0.0
+        return (
+            f"[adaptive] stopped at {self.elapsed:0.1f}s of {self.settings.max_seconds:0.0f}s, "
+            f"+-{100.0 * self.relative_half_width():0.1f}% of {mean:0.1f} Mbits/sec over {n} intervals"
+        )
@@ -0,0 +1,272 @@
+import glob
+import json
+import math
+import os
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+import numpy as np
+
+from results import ResultStore
+from simulation import is_simulated_cohort
+from tracing import load_spans
+
+TRACES_ROOT = os.path.join("artifacts", "traces")
+RESULTS_ROOT = os.path.join("artifacts", "results")
+PRICES_FILE = "prices.json"
+
+# the phases a run is split into, in order. benchmarks is whatever the run span holds beyond the
+# others (stages overlap, so the individual benchmark spans don't add up). destroy happens on the
+# teardown pool after the run span ends: it keeps the VMs billed but not the worker busy
+PHASES = ["init_tf", "plan", "apply", "ready", "demographics", "benchmarks", "destroy"]
+WORKER_PHASES = PHASES[:-1]
+VM_PHASES = ["apply", "ready", "demographics", "benchmarks", "destroy"]
+# only used until there's history, any past run beats these
+DEFAULT_MEASURES = {
+    "init_tf": 5.0,
+    "plan": 20.0,
+    "apply": 120.0,
+    "ready": 60.0,
+    "demographics": 10.0,
+    "benchmarks": 300.0,
+    "destroy": 90.0,
+    # both iperf directions, a 60s run at about 500 Mbits/sec each way
+    "egress_gb": 7.5,
+}
+
+# on-demand $/hour for the instance types in terraform/modules, $/GB of internet egress beyond the
+# included transfer (digitalocean/linode/vultr include a TB per node) and the billing granularity,
+# as listed at the time of writing. prices.json overrides any of it per provider
+PRICES = {
+    "aws": {"hourly": 0.0116, "egress_gb": 0.09, "billing_seconds": 60},
+    "azure": {"hourly": 0.0104, "egress_gb": 0.087, "billing_seconds": 60},
+    "gcp": {"hourly": 0.0376, "egress_gb": 0.12, "billing_seconds": 60},
+    "digitalocean": {"hourly": 0.00744, "egress_gb": 0.0, "billing_seconds": 3600},
+    "linode": {"hourly": 0.0075, "egress_gb": 0.0, "billing_seconds": 3600},
+    "vultr": {"hourly": 0.007, "egress_gb": 0.0, "billing_seconds": 3600},
+}
+FREE = {"hourly": 0.0, "egress_gb": 0.0, "billing_seconds": 1}
+
+# most specific first, a level is only trusted once it has this many runs behind it
+LEVELS = [("pair", 1), ("providers", 3), ("provider", 3), ("all", 1)]
+ORDERS = ["longest", "cheapest", "given"]
+
+Host = Tuple[str, str]
+
+
+class RunTiming(NamedTuple):
+    # (provider, region) for src and dst
+    hosts: Tuple[Host, ...]
+    # seconds per phase, plus egress_gb
+    measures: Dict[str, float]
+
+
+class RunEstimate(NamedTuple):
+    combo: str
+    # how long a worker is busy with it
+    seconds: float
+    # how long its VMs are billed for, per host after rounding up to the provider's granularity
+    vm_seconds: float
+    vm_cost: float
+    egress_cost: float
+    measures: Dict[str, float]
+    # the least specific level any phase had to fall back to, egress has its own history
+    # (only runs with iperf results) and doesn't count
+    basis: str
+
+    @property
+    def cost(self) -> float:
+        return self.vm_cost + self.egress_cost
+
+
+def load_prices(prices_file: str = PRICES_FILE) -> Dict[str, Dict[str, float]]:
+    prices = {provider: dict(p) for provider, p in PRICES.items()}
+    if prices_file is not None and os.path.exists(prices_file):
+        with open(prices_file, "r") as fp:
+            for provider, p in json.load(fp).items():
+                prices.setdefault(provider, dict(FREE)).update(p)
+    return prices
+
+
+def level_keys(hosts: Tuple[Host, ...]) -> Dict[str, List[Tuple]]:
+    # the keys a run is filed under at every level, a pair is the same either way round
+    providers = tuple(sorted(p for p, _ in hosts))
+    return {
+        "pair": [tuple(sorted(hosts))],
+        "providers": [providers],
+        "provider": [(p,) for p in sorted(set(providers))],
+        "all": [()],
+    }
+
+
+def run_timings(spans: Iterator[Dict]) -> Iterator[Tuple[str, RunTiming]]:
+    # one (uuid, RunTiming) per run that finished ok, spans from a single trace file or many
+    by_uuid = {}
+    for span in spans:
+        uuid = span["tags"].get("uuid")
+        if uuid is not None:
+            by_uuid.setdefault(uuid, []).append(span)
+
+    for uuid, spans in by_uuid.items():
+        runs = [s for s in spans if s["name"] == "run"]
+        if len(runs) == 0 or runs[0]["status"] != "ok":
+            continue
+        run = runs[0]
+        tags = run["tags"]
+        if len(tags.get("providers", [])) == 0:
+            continue
+        hosts = (
+            (tags["providers"][0], tags["src_region"]),
+            (tags["providers"][-1], tags["dst_region"]),
+        )
+
+        measures = {}
+        for name in ["init_tf", "plan", "apply", "demographics", "destroy"]:
+            seconds = [s["seconds"] for s in spans if s["name"] == name]
+            if len(seconds) > 0:
+                measures[name] = sum(seconds)
+        # both nodes get ready at the same time
+        ready = [s["seconds"] for s in spans if s["name"] == "ready"]
+        if len(ready) > 0:
+            measures["ready"] = max(ready)
+        measures["benchmarks"] = max(
+            run["seconds"]
+            - sum(measures.get(name, 0.0) for name in WORKER_PHASES[:-1]),
+            0.0,
+        )
+        yield uuid, RunTiming(hosts, measures)
+
+
+def combo_hosts(combo: str) -> Tuple[Host, ...]:
+    # "aws+us-east-1[us-east-1a]_gcp+us-west1" (or its dirname) -> (("aws", "us-east-1"), ("gcp", "us-west1"))
+    hosts = []
+    for h in combo.split("_"):
+        provider, region = h.split("+", 1)
+        hosts.append((provider, region.split("[")[0]))
+    return tuple(hosts)
+
+
+def run_egress_gb(results_root: str) -> Dict[str, float]:
+    # uuid -> GB iperf pushed over the internet (both directions, every --parallel pass), private runs are free
+    egress = {}
+    for cohort_root in glob.glob(os.path.join(results_root, "*")):
+        if is_simulated_cohort(os.path.basename(cohort_root)):
+            continue
+        iperf = ResultStore(cohort_root).load("iperf")
+        if len(iperf) == 0:
+            continue
+        rows = iperf[(iperf["benchmark"] == "iperf") & iperf["is_summary"]]
+        for uuid, mbytes in zip(rows["uuid"], rows["transfer_mbytes"]):
+            egress[str(uuid)] = egress.get(str(uuid), 0.0) + float(mbytes) / 1024.0
+    return egress
+
+
+class DurationModel(object):
+    # medians of every measure at every level of the pair -> provider pair -> provider -> everything hierarchy,
+    # an estimate takes each measure from the most specific level that has enough history
+    def __init__(
+        self, timings: List[RunTiming], prices: Dict[str, Dict[str, float]] = None
+    ):
+        self.runs = len(timings)
+        self.prices = prices if prices is not None else load_prices()
+        samples = {}
+        for timing in timings:
+            for level, keys in level_keys(timing.hosts).items():
+                for key in keys:
+                    for name, value in timing.measures.items():
+                        samples.setdefault((level, key, name), []).append(value)
+        self.medians = {
+            k: (float(np.median(v)), len(v)) for k, v in samples.items() if len(v) > 0
+        }
+
+    @staticmethod
+    def from_history(
+        traces_root: str = TRACES_ROOT,
+        results_root: str = RESULTS_ROOT,
+        prices_file: str = PRICES_FILE,
+    ) -> "DurationModel":
+        # every cohort counts, a provider's apply doesn't get faster because the cohort name changed
+        egress = run_egress_gb(results_root)
+        timings = []
+        for trace_dir in glob.glob(os.path.join(traces_root, "*")):
+            # simulated runs would teach it the simulation's own latencies
+            if is_simulated_cohort(os.path.basename(trace_dir)):
+                continue
+            for uuid, timing in run_timings(load_spans(trace_dir)):
+                if uuid in egress:
+                    timing.measures["egress_gb"] = egress[uuid]
+                timings.append(timing)
+        return DurationModel(timings, load_prices(prices_file))
+
+    def measure(self, hosts: Tuple[Host, ...], name: str) -> Tuple[float, str]:
+        keys = level_keys(hosts)
+        for level, min_runs in LEVELS:
+            found = [self.medians.get((level, key, name)) for key in keys[level]]
+            found = [f for f in found if f is not None and f[1] >= min_runs]
+            # with two providers to go by, the slower one holds the run up
+            if len(found) == len(keys[level]):
+                return max(median for median, _ in found), level
+        return DEFAULT_MEASURES[name], "default"
+
+    def estimate(self, combo: str, hosts: Tuple[Host, ...] = None) -> RunEstimate:
+        if hosts is None:
+            hosts = combo_hosts(combo)
+        measures = {}
+        levels = []
+        for name in DEFAULT_MEASURES:
+            measures[name], level = self.measure(hosts, name)
+            if name in PHASES:
+                levels.append(level)
+        order = [level for level, _ in LEVELS] + ["default"]
+        basis = max(levels, key=order.index)
+
+        seconds = sum(measures[name] for name in WORKER_PHASES)
+        vm_seconds = sum(measures[name] for name in VM_PHASES)
+        vm_cost = 0.0
+        egress_cost = 0.0
+        for provider, _ in hosts:
+            price = self.prices.get(provider, FREE)
+            billed = (
+                math.ceil(vm_seconds / price["billing_seconds"])
+                * price["billing_seconds"]
+            )
+            vm_cost += billed / 3600.0 * price["hourly"]
+            # each direction leaves from one of the two, split evenly
+            egress_cost += measures["egress_gb"] / len(hosts) * price["egress_gb"]
+        return RunEstimate(
+            combo, seconds, vm_seconds, vm_cost, egress_cost, measures, basis
+        )
+
+
+def order_estimates(
+    estimates: List[RunEstimate], order: str = "longest", budget: float = None
+) -> Tuple[List[RunEstimate], List[RunEstimate]]:
+    # (dispatched, over budget)
+    # longest first keeps a long azure/cross-continent run from starting last and stretching the tail,
+    # cheapest first gets the most combos out of a budget
+    if order == "longest":
+        ordered = sorted(estimates, key=lambda e: -e.seconds)
+    elif order == "cheapest":
+        ordered = sorted(estimates, key=lambda e: e.cost)
+    elif order == "given":
+        ordered = list(estimates)
+    else:
+        raise ValueError(f"unknown order {order}, expected one of {ORDERS}")
+
+    if budget is None:
+        return ordered, []
+    dispatched, dropped = [], []
+    spent = 0.0
+    for estimate in ordered:
+        if spent + estimate.cost <= budget:
+            dispatched.append(estimate)
+            spent += estimate.cost
+        else:
+            dropped.append(estimate)
+    return dispatched, dropped
+
+
+def estimate_basis_counts(estimates: List[RunEstimate]) -> Dict[str, int]:
+    counts = {}
+    for estimate in estimates:
+        counts[estimate.basis] = counts.get(estimate.basis, 0) + 1
+    return counts
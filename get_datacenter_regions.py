@@ -1,143 +1,277 @@
-import itertools
+import argparse
+import asyncio
 import json
 import locale
 import os
 import re
+import time
 from pprint import pprint
+from typing import Dict, List
 
+import aiohttp
 import humanize
-import requests
 from bs4 import BeautifulSoup
 
+from combos import count_region_pairs, iter_region_pairs
+from durationmodel import DurationModel
+
 
 WORKDIR = os.path.join("artifacts", "regions")
+# raw provider responses plus their validators, parsed on every run since parsing is cheap
+HTTP_CACHE_DIR = os.path.join(WORKDIR, "http")
+# within the ttl a cached response is used as-is, after it the provider is asked if it changed
+CACHE_TTL_SECONDS = 24 * 60 * 60
+REQUEST_TIMEOUT_SECONDS = 60
+# describe_availability_zones calls in flight at once
+ZONE_LOOKUP_CONCURRENCY = 8
+
+PROVIDER_URLS = {
+    "linode": "https://api.linode.com/v4/regions",
+    "digitalocean": "https://api.digitalocean.com/v2/regions",
+    "googlecloud": "https://cloud.google.com/compute/docs/regions-zones/",
+    "aws": "https://docs.aws.amazon.com/general/latest/gr/rande.html",
+    "vultr": "https://api.vultr.com/v2/plans",
+}
+
+
+def write_atomic(path, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as fp:
+        fp.write(data)
+    os.replace(path + ".tmp", path)
+
+
+async def fetch_cached(
+    session: aiohttp.ClientSession,
+    name: str,
+    url: str,
+    headers: Dict[str, str] = None,
+    ttl: float = CACHE_TTL_SECONDS,
+) -> bytes:
+    body_path = os.path.join(HTTP_CACHE_DIR, f"{name}.body")
+    meta_path = os.path.join(HTTP_CACHE_DIR, f"{name}.meta.json")
+    meta = None
+    if os.path.exists(body_path) and os.path.exists(meta_path):
+        with open(meta_path, "r") as fp:
+            meta = json.load(fp)
+        if meta.get("url") != url:
+            meta = None
+        elif time.time() - meta["fetched_at"] < ttl:
+            with open(body_path, "rb") as fp:
+                return fp.read()
+
+    request_headers = dict(headers or {})
+    if meta is not None:
+        if meta.get("etag"):
+            request_headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            request_headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        async with session.get(url, headers=request_headers) as resp:
+            if resp.status == 304 and meta is not None:
+                # unchanged, only the ttl restarts
+                meta["fetched_at"] = time.time()
+                write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+                print(f"[*] {name}: not modified", flush=True)
+                with open(body_path, "rb") as fp:
+                    return fp.read()
+            resp.raise_for_status()
+            body = await resp.read()
+            meta = {
+                "url": url,
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "fetched_at": time.time(),
+            }
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        if meta is None:
+            raise
+        # a stale list beats no list, the next run revalidates again
+        print(f"[!] {name}: {e}, using stale cache", flush=True)
+        with open(body_path, "rb") as fp:
+            return fp.read()
+
+    write_atomic(body_path, body)
+    write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+    print(f"[*] {name}: fetched {humanize.naturalsize(len(body))}", flush=True)
+    return body
+
+
+def parse_linode_regions(body: bytes):
+    return json.loads(body)["data"]
+
+
+def parse_digitalocean_regions(body: bytes):
+    return [r for r in json.loads(body)["regions"] if r["available"]]
+
+
+def parse_googlecloud_zones(body: bytes):
+    # TODO: Error: Error creating instance: googleapi: Error 400: Standard network tier is not supported for region asia-northeast2., badRequest
+    soup = BeautifulSoup(body, features="html.parser")
+    zones = []
+    trs = soup.find(class_="devsite-article-body").find("tbody").find_all("tr")
+    for tr in trs:
+        tds = tr.find_all("td")
+        zone_id = tds[0].find("code").text
+        location = tds[1].text
+
+        # does not allow standard networking tier which explodes bandwidth costs
+        if zone_id.startswith(
+            "asia-northeast2"
+        ):  # or zone_id.startswith('asia-south1'):
+            continue
+
+        zones.append({"id": zone_id, "location": location})
+    return zones
+
+
+def parse_aws_regions(body: bytes):
+    soup = BeautifulSoup(body, features="html.parser")
+    regions = []
+    th = soup.find("th", text=re.compile(r"Region Name"))
+    table = th.find_parent("table")
+    for tr in table.find_all("tr"):
+        tds = tr.find_all("td")
+        if len(tds) == 0:
+            continue
+
+        region_name = tds[1].text
+        if region_name.startswith("cn-"):
+            continue
+        # does not allow t2.micro, which means free-tier is t3.micro but has 5gbps connection which explodes bandwidth costs
+        if region_name in [
+            "ap-northeast-3",
+            "af-south-1",
+            "ap-east-1",
+            "eu-north-1",
+            "eu-south-1",
+            "me-south-1",
+        ]:
+            continue
+
+        regions.append(region_name)
+    return regions
 
 
-def get_aws_zones():
-    import boto3
+def parse_vultr_regions(body: bytes):
+    vultr_regions = set()
+    for plan in json.loads(body)["plans"]:
+        if plan["id"] != "vc2-1c-1gb":
+            continue
+        for r in plan["locations"]:
+            vultr_regions.add(r)
+    return sorted(list(vultr_regions))
 
-    ec2 = boto3.client("ec2", region_name="us-west-2")
 
-    # Retrieves all regions/endpoints that work with EC2
-    aws_regions = ec2.describe_regions()
+PARSERS = {
+    "linode": parse_linode_regions,
+    "digitalocean": parse_digitalocean_regions,
+    "googlecloud": parse_googlecloud_zones,
+    "aws": parse_aws_regions,
+    "vultr": parse_vultr_regions,
+}
 
-    # Get a list of regions and then instantiate a new ec2 client for each region in order to get list of AZs for the region
-    zones = []
-    for region in aws_regions["Regions"]:
-        my_region_name = region["RegionName"]
-        ec2_region = boto3.client("ec2", region_name=my_region_name)
-        my_region = [{"Name": "region-name", "Values": [my_region_name]}]
-        # print("Current Region is %s" % my_region_name)
-        aws_azs = ec2_region.describe_availability_zones(Filters=my_region)
-        for az in aws_azs["AvailabilityZones"]:
-            zone = az["ZoneName"]
-            # print(zone)
-            zones.append(zone)
-    pprint({z: None for z in zones})
 
+def provider_headers(provider: str) -> Dict[str, str]:
+    if provider == "digitalocean":
+        return {
+            "Authorization": "Bearer " + os.environ.get("DIGITALOCEAN_API_TOKEN", "")
+        }
+    return {}
+
+
+async def discover_regions(
+    providers: List[str] = None, ttl: float = CACHE_TTL_SECONDS
+) -> Dict[str, list]:
+    # every provider is fetched concurrently, azure has no usable listing and stays hardcoded
+    if providers is None:
+        providers = list(PROVIDER_URLS.keys()) + ["azure"]
+
+    async def discover(session, provider):
+        if provider == "azure":
+            return get_azure_regions()
+        body = await fetch_cached(
+            session,
+            provider,
+            PROVIDER_URLS[provider],
+            headers=provider_headers(provider),
+            ttl=ttl,
+        )
+        return PARSERS[provider](body)
+
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        results = await asyncio.gather(*[discover(session, p) for p in providers])
+    return dict(zip(providers, results))
+
+
+async def discover_aws_zones(
+    regions: List[str] = None,
+    ttl: float = CACHE_TTL_SECONDS,
+    concurrency: int = ZONE_LOOKUP_CONCURRENCY,
+) -> Dict[str, List[str]]:
+    import boto3
 
-def get_linode_regions():
-    cached_filename = os.path.join(WORKDIR, "linode.json")
-    if not os.path.exists(cached_filename):
-        if not os.path.exists(os.path.dirname(cached_filename)):
-            os.makedirs(os.path.dirname(cached_filename))
+    # boto3 is blocking, the lookups run on the default executor with at most `concurrency` at once
+    loop = asyncio.get_event_loop()
+    if regions is None:
+        ec2 = boto3.client("ec2", region_name="us-west-2")
+        # Retrieves all regions/endpoints that work with EC2
+        aws_regions = await loop.run_in_executor(None, ec2.describe_regions)
+        regions = [r["RegionName"] for r in aws_regions["Regions"]]
+
+    cached_filename = os.path.join(WORKDIR, "aws_zones.json")
+    cached = {}
+    if os.path.exists(cached_filename):
+        with open(cached_filename, "r") as fp:
+            cached = json.load(fp)
+
+    def describe_zones(region_name):
+        ec2_region = boto3.client("ec2", region_name=region_name)
+        my_region = [{"Name": "region-name", "Values": [region_name]}]
+        aws_azs = ec2_region.describe_availability_zones(Filters=my_region)
+        return [az["ZoneName"] for az in aws_azs["AvailabilityZones"]]
 
-        linode = requests.get("https://api.linode.com/v4/regions")
-        json.dump(linode.json(), open(cached_filename, "w"))
-        linode_regions = linode.json()["data"]
-    else:
-        linode_regions = json.load(open(cached_filename, "r"))["data"]
+    semaphore = asyncio.Semaphore(concurrency)
 
-    return linode_regions
+    async def lookup(region_name):
+        entry = cached.get(region_name)
+        if entry is not None and time.time() - entry["fetched_at"] < ttl:
+            return
+        async with semaphore:
+            zones = await loop.run_in_executor(None, describe_zones, region_name)
+        cached[region_name] = {"zones": zones, "fetched_at": time.time()}
 
+    await asyncio.gather(*[lookup(r) for r in regions])
+    write_atomic(cached_filename, json.dumps(cached).encode("utf-8"))
+    return {r: cached[r]["zones"] for r in regions}
 
-def get_digitalocean_regions():
-    cached_filename = os.path.join(WORKDIR, "digitalocean.json")
-    if not os.path.exists(cached_filename):
-        headers = {
-            "Authorization": "Bearer " + os.environ.get("DIGITALOCEAN_API_TOKEN")
-        }
-        if not os.path.exists(os.path.dirname(cached_filename)):
-            os.makedirs(os.path.dirname(cached_filename))
 
-        resp = requests.get("https://api.digitalocean.com/v2/regions", headers=headers)
-        digitalocean = {"regions": []}
-        for r in resp.json()["regions"]:
-            if r["available"]:
-                digitalocean["regions"].append(r)
-        json.dump(digitalocean, open(cached_filename, "w"))
-        digitalocean_regions = digitalocean["regions"]
-    else:
-        digitalocean_regions = json.load(open(cached_filename, "r"))["regions"]
+def get_aws_zones():
+    zones = asyncio.run(discover_aws_zones())
+    pprint({z: None for region_zones in zones.values() for z in region_zones})
 
-    return digitalocean_regions
 
+def get_linode_regions():
+    return asyncio.run(discover_regions(["linode"]))["linode"]
 
-def get_googlecloud_zones():
-    # TODO: Error: Error creating instance: googleapi: Error 400: Standard network tier is not supported for region asia-northeast2., badRequest
-    cached_filename = os.path.join(WORKDIR, "googlecloud.json")
-    if not os.path.exists(cached_filename):
-        if not os.path.exists(os.path.dirname(cached_filename)):
-            os.makedirs(os.path.dirname(cached_filename))
 
-        gcp = requests.get("https://cloud.google.com/compute/docs/regions-zones/")
-        soup = BeautifulSoup(gcp.content, features="html.parser")
-        zones = []
-        trs = soup.find(class_="devsite-article-body").find("tbody").find_all("tr")
-        for tr in trs:
-            tds = tr.find_all("td")
-            zone_id = tds[0].find("code").text
-            location = tds[1].text
-
-            # does not allow standard networking tier which explodes bandwidth costs
-            if zone_id.startswith(
-                "asia-northeast2"
-            ):  # or zone_id.startswith('asia-south1'):
-                continue
-
-            zones.append({"id": zone_id, "location": location})
-        json.dump(zones, open(cached_filename, "w"))
-        gcp_zones = zones
-    else:
-        gcp_zones = json.load(open(cached_filename, "r"))
+def get_digitalocean_regions():
+    return asyncio.run(discover_regions(["digitalocean"]))["digitalocean"]
 
-    return gcp_zones
+
+def get_googlecloud_zones():
+    return asyncio.run(discover_regions(["googlecloud"]))["googlecloud"]
 
 
 def get_aws_regions():
-    cached_filename = os.path.join(WORKDIR, "aws.json")
-    if not os.path.exists(cached_filename):
-        aws = requests.get("https://docs.aws.amazon.com/general/latest/gr/rande.html")
-        soup = BeautifulSoup(aws.content, features="html.parser")
-        regions = []
-        # pprint(soup.find_all('table'))
-        th = soup.find("th", text=re.compile(r"Region Name"))
-        table = th.find_parent("table")
-        for tr in table.find_all("tr"):
-            tds = tr.find_all("td")
-            if len(tds) == 0:
-                continue
-
-            region_name = tds[1].text
-            if region_name.startswith("cn-"):
-                continue
-            # does not allow t2.micro, which means free-tier is t3.micro but has 5gbps connection which explodes bandwidth costs
-            if region_name in [
-                "ap-northeast-3",
-                "af-south-1",
-                "ap-east-1",
-                "eu-north-1",
-                "eu-south-1",
-                "me-south-1",
-            ]:
-                continue
-
-            regions.append(region_name)
-        json.dump(regions, open(cached_filename, "w"))
-    else:
-        regions = json.load(open(cached_filename, "r"))
+    return asyncio.run(discover_regions(["aws"]))["aws"]
 
-    return regions
+
+def get_vultr_regions():
+    # https://api.vultr.com/v2/plans
+    return asyncio.run(discover_regions(["vultr"]))["vultr"]
 
 
 def get_azure_regions():
@@ -211,40 +345,23 @@ def get_azure_regions():
     return azure_regions
 
 
-def get_vultr_regions():
-    # https://api.vultr.com/v2/plans
-    cached_filename = os.path.join(WORKDIR, "vultr.json")
-    if not os.path.exists(cached_filename):
-        if not os.path.exists(os.path.dirname(cached_filename)):
-            os.makedirs(os.path.dirname(cached_filename))
-
-        # Azure IP Ranges and Service Tags – Public Cloud
-        # https://www.microsoft.com/en-us/download/details.aspx?id=56519
-        vultr = requests.get("https://api.vultr.com/v2/plans").json()
-        vultr_regions = set()
-        for plan in vultr["plans"]:
-            if plan["id"] != "vc2-1c-1gb":
-                continue
-            for r in plan["locations"]:
-                vultr_regions.add(r)
-        vultr_regions = sorted(list(vultr_regions))
-
-        json.dump(vultr_regions, open(cached_filename, "w"))
-        vultr_regions = vultr_regions
-    else:
-        vultr_regions = json.load(open(cached_filename, "r"))
-
-    return vultr_regions
-    pass
-
-
 if __name__ == "__main__":
-    aws_regions = get_aws_regions()
-    linode_regions = get_linode_regions()
-    digitalocean_regions = get_digitalocean_regions()
-    googlecloud_zones = get_googlecloud_zones()
-    azure_zones = get_azure_regions()
-    vultr_regions = get_vultr_regions()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--ttl-hours",
+        type=float,
+        default=CACHE_TTL_SECONDS / 3600,
+        help="0 revalidates every cached provider response",
+    )
+    args = parser.parse_args()
+
+    discovered = asyncio.run(discover_regions(ttl=args.ttl_hours * 3600))
+    aws_regions = discovered["aws"]
+    linode_regions = discovered["linode"]
+    digitalocean_regions = discovered["digitalocean"]
+    googlecloud_zones = discovered["googlecloud"]
+    azure_zones = discovered["azure"]
+    vultr_regions = discovered["vultr"]
 
     gcp_zones = list(googlecloud_zones)
     gcp_regions = sorted(
@@ -266,15 +383,31 @@ if __name__ == "__main__":
         json.dump(all_regions_by_provider, fp)
 
     all_regions = []
+    region_providers = {}
     for provider, regions in all_regions_by_provider.items():
         all_regions.extend(regions)
-    interregion_combos = list(itertools.combinations(all_regions, 2))
-    intraregion_combos = list(zip(all_regions, all_regions))
-    all_region_combos = intraregion_combos + interregion_combos
-    # pprint(all_region_combos)
-    num_combos = len(all_region_combos)
+        for region in regions:
+            region_providers.setdefault(region, provider)
+    # counted, not built, the pair list grows quadratically with every provider added
+    num_combos = count_region_pairs(len(all_regions))
     print(humanize.intcomma(num_combos))
-    locale.setlocale(locale.LC_ALL, "English_United States.1252")
-    print(locale.currency(num_combos * 0.02, grouping=True))
+    # priced pair by pair from past runs' phase timings instead of a flat rate per combo
+    model = DurationModel.from_history()
+    run_seconds = 0.0
+    cost = 0.0
+    # same json list of [src, dst] pairs as before, written a pair at a time
     with open(os.path.join("artifacts", "all-region-combos.json"), "w") as fp:
-        json.dump(all_region_combos, fp)
+        fp.write("[")
+        for i, pair in enumerate(iter_region_pairs(all_regions)):
+            fp.write((", " if i > 0 else "") + json.dumps(list(pair)))
+            estimate = model.estimate(
+                "_".join(f"{region_providers[r]}+{r}" for r in pair)
+            )
+            run_seconds += estimate.seconds
+            cost += estimate.cost
+        fp.write("]")
+    print(
+        f"{humanize.intcomma(int(run_seconds / 3600))} run-hours from {model.runs} past runs"
+    )
+    locale.setlocale(locale.LC_ALL, "English_United States.1252")
+    print(locale.currency(cost, grouping=True))
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from python_terraform import Terraform
+
+from tfworkdir import file_lock
+
+IMAGE_CATALOG_FILE = os.path.join("artifacts", "images", "image-catalog.json")
+PROVISION_SCRIPT = os.path.join("terraform", "provision-benchmark-node.sh")
+# providers whose module has a `golden` resource, azure needs a generalized VM so it always provisions from scratch
+BAKEABLE_PROVIDERS = ["aws", "gcp", "digitalocean", "linode", "vultr"]
+# resources with this name are the images themselves, they leave the state before destroy so they outlive the bake
+GOLDEN_RESOURCE_NAME = "golden"
+
+# usable means ssh answers, cloud-init is done, nobody holds the dpkg lock and the tools are on the path
+READINESS_PROBE = (
+    "(cloud-init status --wait > /dev/null 2>&1 || true)"
+    " && ! sudo fuser /var/lib/dpkg/lock-frontend > /dev/null 2>&1"
+    " && which iperf traceroute tcptraceroute cryptsetup > /dev/null"
+)
+READINESS_TIMEOUT_SECONDS = 600
+READINESS_POLL_SECONDS = 2
+
+# apply errors that mean a golden image is gone (deleted, expired, never copied to the region)
+# `image_id` is the image the error names, providers whose error doesn't name one blame every image of theirs the run booted
+IMAGE_NOT_FOUND_PATTERNS = [
+    (
+        "aws",
+        re.compile(
+            r"InvalidAMIID\.(?:NotFound|Unavailable)\b[^\n]*?(?P<image_id>ami-[0-9a-f]+)"
+        ),
+    ),
+    (
+        "gcp",
+        re.compile(
+            r"(?:The resource '|Could not find image or family )(?:\S*/compute/v1/)?(?P<image_id>projects/[^/\s']+/global/images/[^'\s,]+)"
+        ),
+    ),
+    (
+        "digitalocean",
+        re.compile(r"You specified an invalid image for Droplet creation"),
+    ),
+    ("linode", re.compile(r"\[(?:400|404)\] \[image\] ")),
+    ("vultr", re.compile(r"Invalid snapshot_id")),
+]
+
+
+class BakedImage(NamedTuple):
+    provider: str
+    region: str
+    image_id: str
+
+
+def missing_images(apply_output: str) -> List[Tuple[str, Optional[str]]]:
+    # (provider, image id or None if the error doesn't say which)
+    missing = []
+    for provider, pattern in IMAGE_NOT_FOUND_PATTERNS:
+        for m in pattern.finditer(apply_output):
+            missing.append((provider, m.groupdict().get("image_id")))
+    return missing
+
+
+def same_image(image_id: str, named: str) -> bool:
+    # gcp errors name `projects/<p>/global/images/<name>`, the catalog has the full self_link
+    return image_id == named or image_id.endswith(f"/{named}")
+
+
+def script_hash(script_path: str = PROVISION_SCRIPT) -> str:
+    # same as `sha256sum | cut -c1-12` in the script's image marker
+    with open(script_path, "rb") as fp:
+        return hashlib.sha256(fp.read()).hexdigest()[:12]
+
+
+class ImageCatalog(object):
+    # provider -> region -> golden image, only images baked from the current provision script count
+    def __init__(
+        self,
+        catalog_file: str = IMAGE_CATALOG_FILE,
+        script_path: str = PROVISION_SCRIPT,
+    ):
+        self.catalog_file = catalog_file
+        self.script_path = script_path
+        self._images = {}
+        self._images_mtime = None
+        self._script_hash = None
+
+    @property
+    def script_hash(self) -> str:
+        if self._script_hash is None:
+            self._script_hash = script_hash(self.script_path)
+        return self._script_hash
+
+    @property
+    def images(self) -> Dict[str, Dict[str, dict]]:
+        # bakes and invalidations come from other processes, re-read when the file changed
+        try:
+            mtime = os.path.getmtime(self.catalog_file)
+        except OSError:
+            return self._images
+        if mtime != self._images_mtime:
+            with open(self.catalog_file, "r") as fp:
+                self._images = json.load(fp)
+            self._images_mtime = mtime
+        return self._images
+
+    def lookup(self, provider: str, region: str) -> Optional[str]:
+        entry = self.images.get(provider, {}).get(region)
+        if entry is None or entry["script_hash"] != self.script_hash:
+            return None
+        return entry["image_id"]
+
+    def missing(self, regions: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        return [
+            (provider, region)
+            for provider, region in regions
+            if provider in BAKEABLE_PROVIDERS and self.lookup(provider, region) is None
+        ]
+
+    def _update(self, update):
+        os.makedirs(os.path.dirname(self.catalog_file), exist_ok=True)
+        with file_lock(self.catalog_file + ".lock"):
+            images = {}
+            if os.path.exists(self.catalog_file):
+                with open(self.catalog_file, "r") as fp:
+                    images = json.load(fp)
+            update(images)
+            with open(self.catalog_file + ".tmp", "w") as fp:
+                json.dump(images, fp, indent=2)
+            os.replace(self.catalog_file + ".tmp", self.catalog_file)
+        self._images_mtime = None
+
+    def record(self, images: List[BakedImage]):
+        def update(catalog):
+            for image in images:
+                catalog.setdefault(image.provider, {})[image.region] = {
+                    "image_id": image.image_id,
+                    "script_hash": self.script_hash,
+                    "baked_at": time.time(),
+                }
+
+        if len(images) > 0:
+            self._update(update)
+
+    def forget_missing(
+        self, apply_output: str, booted: List[BakedImage]
+    ) -> List[BakedImage]:
+        # only an image-not-found error about an image the run booted from drops it, any other failure
+        # that happens to print an image id (quota, capacity, a bad zone) leaves the catalog alone
+        # dropping it falls back to the provision script until it's baked again
+        forgotten = []
+        for provider, named in missing_images(apply_output):
+            for image in booted:
+                if image.provider != provider or image in forgotten:
+                    continue
+                if named is None or same_image(image.image_id, named):
+                    forgotten.append(image)
+
+        def update(catalog):
+            for image in forgotten:
+                entry = catalog.get(image.provider, {}).get(image.region)
+                # rebaked by someone else in the meantime
+                if entry is not None and entry["image_id"] == image.image_id:
+                    del catalog[image.provider][image.region]
+
+        if len(forgotten) > 0:
+            self._update(update)
+        return forgotten
+
+
+def bake_pairs(regions: List[Tuple[str, str]]) -> List[Tuple[Tuple[str, str], ...]]:
+    # every bake run boots two nodes (src and dst), so bake two regions of the same provider at once
+    by_provider = {}
+    for provider, region in regions:
+        by_provider.setdefault(provider, []).append((provider, region))
+    pairs = []
+    for provider_regions in by_provider.values():
+        for i in range(0, len(provider_regions), 2):
+            pair = provider_regions[i : i + 2]
+            # an odd one out gets baked twice in the same region, the second image is discarded
+            pairs.append((pair[0], pair[-1]))
+    return pairs
+
+
+def golden_addresses(state_list: str) -> List[str]:
+    # `terraform state list` lines like module.src.aws_ami_from_instance.golden[0]
+    return [
+        address
+        for address in state_list.split()
+        if address.split("[")[0].split(".")[-1] == GOLDEN_RESOURCE_NAME
+    ]
+
+
+def keep_golden_images(tf: Terraform) -> List[str]:
+    # forget the image resources so the following destroy only takes the builder nodes
+    return_code, stdout, stderr = tf.cmd("state list")
+    addresses = golden_addresses(stdout)
+    if len(addresses) > 0:
+        return_code, stdout, stderr = tf.cmd("state rm", *addresses)
+        if return_code != 0:
+            raise Exception(f"terraform state rm {addresses} failed: {stderr}")
+    return addresses
@@ -0,0 +1,139 @@
+import gzip
+import json
+import os
+import shutil
+import struct
+import threading
+from typing import Dict, List, Tuple
+
+COMPRESS_LEVEL = 6
+STREAMS = ["stdout", "stderr"]
+# <name>.sections.json next to the logs, the label and uncompressed length of every section in order,
+# parsers tell directions/hosts apart by it while the logs themselves stay exactly what the commands printed
+SECTION_INDEX_SUFFIX = ".sections.json"
+
+
+def open_log(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def read_log(path: str) -> str:
+    with open_log(path) as fp:
+        return fp.read()
+
+
+def read_log_bytes(path: str) -> bytes:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as fp:
+        return fp.read()
+
+
+def member_size(path: str) -> int:
+    # ISIZE, the last 4 bytes of a gzip member, is its uncompressed length (mod 2**32)
+    with open(path, "rb") as fp:
+        fp.seek(-4, os.SEEK_END)
+        return struct.unpack("<I", fp.read(4))[0]
+
+
+def split_sections(
+    data: bytes, index: List[Dict], stream: str = "stdout"
+) -> List[Tuple[str, str]]:
+    # (label, text) per labelled section of an uncompressed log, cut at the lengths its index recorded
+    sections = []
+    offset = 0
+    for entry in index:
+        end = offset + entry[stream]
+        if entry["label"]:
+            sections.append(
+                (entry["label"], data[offset:end].decode("utf-8", errors="replace"))
+            )
+        offset = end
+    return sections
+
+
+class LogSection(object):
+    # one command's (or direction's) slice of a benchmark log, streamed line by line into its own
+    # gzip member so concurrent directions never interleave in the final file
+    def __init__(self, log, index: int, label: str):
+        self.log = log
+        self.label = label
+        self.paths = {
+            stream: f"{log.paths[stream]}.part{index:03d}" for stream in STREAMS
+        }
+        self.files = {
+            stream: gzip.open(
+                path, "wt", encoding="utf-8", compresslevel=COMPRESS_LEVEL
+            )
+            for stream, path in self.paths.items()
+        }
+
+    def write_stdout(self, line: str):
+        self.files["stdout"].write(line.rstrip("\n") + "\n")
+        if self.log.tee:
+            print(f"[{self.log.name} {self.label}] {line.rstrip()}", flush=True)
+
+    def write_stderr(self, line: str):
+        self.files["stderr"].write(line.rstrip("\n") + "\n")
+        # always print errors
+        print(f"[{self.log.name} {self.label}] {line.rstrip()}", flush=True)
+
+    def write(self, stdout: str, stderr: str):
+        # for outputs that already arrived as one string (terraform, small json blobs)
+        for line in stdout.splitlines():
+            self.write_stdout(line)
+        for line in stderr.splitlines():
+            self.write_stderr(line)
+
+    def close(self):
+        for fp in self.files.values():
+            fp.close()
+
+
+class BenchmarkLog(object):
+    # <name>.stdout.log.gz / <name>.stderr.log.gz, assembled from sections in the order they were opened
+    def __init__(self, log_dir: str, name: str, tee: bool = False):
+        self.name = name
+        self.tee = tee
+        self.paths = {
+            stream: os.path.join(log_dir, f"{name}.{stream}.log.gz")
+            for stream in STREAMS
+        }
+        self.index_path = os.path.join(log_dir, f"{name}{SECTION_INDEX_SUFFIX}")
+        self.sections = []
+        # filled in by close()
+        self.index = []
+        self.lock = threading.Lock()
+
+    def section(self, label: str = "") -> LogSection:
+        # open sections before starting threads so their order doesn't depend on who finishes first
+        with self.lock:
+            section = LogSection(self, len(self.sections), label)
+            self.sections.append(section)
+        return section
+
+    def close(self) -> List[str]:
+        # concatenated gzip members are a valid gzip file, so joining never decompresses anything
+        for section in self.sections:
+            section.close()
+        self.index = [
+            {
+                "label": section.label,
+                **{stream: member_size(section.paths[stream]) for stream in STREAMS},
+            }
+            for section in self.sections
+        ]
+        # unlabelled logs (terraform output, skip reasons) have nothing to tell apart
+        if any(entry["label"] for entry in self.index):
+            with open(self.index_path + ".tmp", "w", encoding="utf-8") as fp:
+                json.dump(self.index, fp)
+            os.replace(self.index_path + ".tmp", self.index_path)
+        for stream, path in self.paths.items():
+            with open(path + ".tmp", "wb") as out:
+                for section in self.sections:
+                    with open(section.paths[stream], "rb") as fp:
+                        shutil.copyfileobj(fp, out)
+                    os.remove(section.paths[stream])
+            os.replace(path + ".tmp", path)
+        return list(self.paths.values())
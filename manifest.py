@@ -0,0 +1,149 @@
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from artifactstore import list_runs, open_run
+
+# the log names that count as a finished benchmark, everything else (apply, demographics, ...) is bookkeeping
+# new runs record whatever pyterra's BENCHMARKS ran, this is only for backfilling runs from before the manifest
+BENCHMARK_LOGS = [
+    "ping",
+    "traceroute",
+    "traceroute.icmp",
+    "traceroute.private",
+    "traceroute.private.icmp",
+    "iperf",
+    "iperf.private",
+    "cryptsetup_benchmark",
+]
+# a run only counts as complete once it got through iperf, same as the old artifacts walk
+COMPLETION_BENCHMARK = "iperf"
+
+
+class ComboStatus(NamedTuple):
+    combo: str
+    runs: int
+    last_completed_at: Optional[float]
+    last_completed_uuid: Optional[str]
+
+
+def combo_dirname(config_str: str) -> str:
+    return config_str.replace("|", "_").replace(":", "-")
+
+
+class CohortManifest(object):
+    # one row per run, written as each BenchmarkRunner.run finishes so resume/refresh
+    # never has to walk artifacts/<COHORT>
+    def __init__(self, cohort_dir: str):
+        self.cohort_dir = cohort_dir
+        if not os.path.exists(cohort_dir):
+            os.makedirs(cohort_dir, exist_ok=True)
+        self.path = os.path.join(cohort_dir, "manifest.sqlite")
+        self.db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS runs (
+                uuid TEXT PRIMARY KEY,
+                combo TEXT NOT NULL,
+                status TEXT NOT NULL,
+                benchmarks TEXT NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )"""
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS runs_combo ON runs (combo, status, finished_at)"
+        )
+
+    def record_run(
+        self,
+        combo: str,
+        run_uuid: str,
+        benchmarks: List[str],
+        started_at: float,
+        finished_at: float,
+        run_status: str = None,
+    ):
+        # run_status is BenchmarkRunner.run's "ok"/"error", runs backfilled from before it was recorded
+        # only have their logs to go by
+        if run_status is not None:
+            complete = run_status == "ok"
+        else:
+            complete = COMPLETION_BENCHMARK in benchmarks
+        status = "complete" if complete else "incomplete"
+        self.db.execute(
+            "INSERT OR REPLACE INTO runs (uuid, combo, status, benchmarks, started_at, finished_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                run_uuid,
+                combo_dirname(combo),
+                status,
+                json.dumps(sorted(benchmarks)),
+                started_at,
+                finished_at,
+            ),
+        )
+
+    def is_empty(self) -> bool:
+        return self.db.execute("SELECT COUNT(*) FROM runs").fetchone()[0] == 0
+
+    def backfill(self) -> int:
+        # one-time walk for cohorts that were run before the manifest existed
+        recorded = 0
+        for combo, run_uuid, run_path in list_runs(self.cohort_dir):
+            run = open_run(run_path)
+            benchmarks = [b for b in BENCHMARK_LOGS if run.has_log(b)]
+            finished_at = os.path.getmtime(run_path)
+            self.record_run(combo, run_uuid, benchmarks, None, finished_at)
+            recorded += 1
+        return recorded
+
+    def rebuild(self) -> int:
+        # drop every row and backfill from the artifacts in one transaction, readers (and other
+        # workers recording runs) see either the old manifest or the rebuilt one, never an empty one
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.execute("DELETE FROM runs")
+            recorded = self.backfill()
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+        return recorded
+
+    def combo_statuses(self) -> Dict[str, ComboStatus]:
+        statuses = {}
+        for combo, runs, last_completed_at in self.db.execute(
+            "SELECT combo, COUNT(*), MAX(CASE WHEN status = 'complete' THEN finished_at END) "
+            "FROM runs GROUP BY combo"
+        ):
+            statuses[combo] = ComboStatus(combo, runs, last_completed_at, None)
+        for combo, run_uuid, finished_at in self.db.execute(
+            "SELECT combo, uuid, finished_at FROM runs WHERE status = 'complete'"
+        ):
+            if statuses[combo].last_completed_at == finished_at:
+                statuses[combo] = statuses[combo]._replace(last_completed_uuid=run_uuid)
+        return statuses
+
+    def combos_needing_run(
+        self, combos: List[str] = None, max_age_days: float = None
+    ) -> List[str]:
+        # missing (never completed) or, with max_age_days, completed too long ago to trust
+        # when no combo list is given the manifest's own combos are the cohort
+        statuses = self.combo_statuses()
+        if combos is None:
+            combos = sorted(statuses.keys())
+        cutoff = None
+        if max_age_days is not None:
+            cutoff = time.time() - max_age_days * 24 * 60 * 60
+
+        needing_run = []
+        for combo in combos:
+            status = statuses.get(combo_dirname(combo))
+            if status is None or status.last_completed_at is None:
+                needing_run.append(combo)
+            elif cutoff is not None and status.last_completed_at < cutoff:
+                needing_run.append(combo)
+        return needing_run
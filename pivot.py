@@ -0,0 +1,279 @@
+import glob
+import os
+import re
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+import numpy as np
+
+from results import ResultStore
+
+ZONE_RE = re.compile(r"\[[^\]]*\]")
+
+
+class PivotMetric(NamedTuple):
+    table: str
+    column: str
+    # (field, value) rows must match to count, e.g. only iperf summary lines
+    where: Tuple[Tuple[str, object], ...] = ()
+    # low values are good (latency) vs high values are good (bandwidth)
+    lower_is_better: bool = True
+    fmt: str = "%.1f"
+    # what shards written before a `where` field existed had in it
+    legacy: Tuple[Tuple[str, object], ...] = ()
+
+
+def iperf_metric(parallel: int) -> PivotMetric:
+    # one --parallel count per metric, 1 and N stream throughput averaged together means nothing
+    return PivotMetric(
+        "iperf",
+        "mbits_per_sec",
+        where=(("is_summary", True), ("benchmark", "iperf"), ("parallel", parallel)),
+        lower_is_better=False,
+        fmt="%.0f",
+        # every run before the --iperf-parallel sweep was single stream
+        legacy=(("parallel", 1),),
+    )
+
+
+METRICS = {
+    "ping_rtt_avg": PivotMetric("ping", "rtt_avg"),
+    "ping_loss_pct": PivotMetric("ping", "loss_pct"),
+    "iperf_mbits": iperf_metric(1),
+    **{f"iperf_mbits_p{n}": iperf_metric(n) for n in [2, 4, 8]},
+}
+
+# good -> middling -> bad
+COLOR_STOPS = np.array([[99, 190, 123], [255, 235, 132], [248, 105, 107]], dtype=float)
+EMPTY_COLOR = "#ffffff"
+
+
+def combo_regions(combo: str) -> List[str]:
+    # "aws+us-east-1[us-east-1a]_gcp+us-west1" -> ["aws+us-east-1", "gcp+us-west1"]
+    return [ZONE_RE.sub("", h) for h in combo.split("_")]
+
+
+def colors_for(values: np.ndarray, lower_is_better: bool = True) -> np.ndarray:
+    # vectorized value -> "#rrggbb", scaled between the min and max of the values given
+    colors = np.full(values.shape, EMPTY_COLOR, dtype="U7")
+    filled = ~np.isnan(values)
+    if not filled.any():
+        return colors
+    v = values[filled]
+    lo, hi = v.min(), v.max()
+    t = (v - lo) / (hi - lo) if hi > lo else np.zeros_like(v)
+    if not lower_is_better:
+        t = 1.0 - t
+    # piecewise linear across the color stops
+    segment = np.minimum((t * (len(COLOR_STOPS) - 1)).astype(int), len(COLOR_STOPS) - 2)
+    local_t = (t * (len(COLOR_STOPS) - 1) - segment)[:, None]
+    rgb = (
+        COLOR_STOPS[segment] * (1.0 - local_t) + COLOR_STOPS[segment + 1] * local_t
+    ).astype(int)
+    packed = (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+    colors[filled] = np.char.add("#", np.char.zfill(np.char.mod("%x", packed), 6))
+    return colors
+
+
+class PivotCell(NamedTuple):
+    col: str
+    color: str
+    text: str
+
+
+class PivotRow(NamedTuple):
+    region: str
+    cells: List[PivotCell]
+
+
+class PivotEngine(object):
+    # dense region x region running sums/counts per metric, [src, dst] indexed by region id
+    # updates only touch the shards of runs that haven't been folded in yet
+    regions: List[str]
+    region_ids: Dict[str, int]
+    sums: Dict[str, np.ndarray]
+    counts: Dict[str, np.ndarray]
+
+    def __init__(self, metrics: Dict[str, PivotMetric] = None):
+        self.metrics = metrics if metrics is not None else METRICS
+        self.regions = []
+        self.region_ids = {}
+        self.sums = {m: np.zeros((0, 0)) for m in self.metrics}
+        self.counts = {m: np.zeros((0, 0), dtype=np.int64) for m in self.metrics}
+        self.seen_shards = set()
+        self._cache = {}
+
+    def region_id(self, region: str) -> int:
+        if region not in self.region_ids:
+            self.region_ids[region] = len(self.regions)
+            self.regions.append(region)
+        return self.region_ids[region]
+
+    def _grow(self):
+        n = len(self.regions)
+        for m in self.metrics:
+            pad = n - self.sums[m].shape[0]
+            if pad > 0:
+                self.sums[m] = np.pad(self.sums[m], ((0, pad), (0, pad)))
+                self.counts[m] = np.pad(self.counts[m], ((0, pad), (0, pad)))
+
+    def add_records(self, metric: str, records: np.ndarray):
+        spec = self.metrics[metric]
+        mask = np.ones(len(records), dtype=bool)
+        legacy = dict(spec.legacy)
+        for field, value in spec.where:
+            if field not in records.dtype.names:
+                if field in legacy and legacy[field] != value:
+                    return
+                continue
+            mask &= records[field] == value
+        records = records[mask]
+        if len(records) == 0:
+            return
+
+        src_ids = np.empty(len(records), dtype=np.int64)
+        dst_ids = np.empty(len(records), dtype=np.int64)
+        for i, (combo, direction) in enumerate(
+            zip(records["combo"], records["direction"])
+        ):
+            src, dst = combo_regions(combo)
+            if direction == "dst->src":
+                src, dst = dst, src
+            src_ids[i] = self.region_id(src)
+            dst_ids[i] = self.region_id(dst)
+        self._grow()
+
+        values = records[spec.column].astype(float)
+        ok = ~np.isnan(values)
+        np.add.at(self.sums[metric], (src_ids[ok], dst_ids[ok]), values[ok])
+        np.add.at(self.counts[metric], (src_ids[ok], dst_ids[ok]), 1)
+        self._cache.pop(metric, None)
+
+    def update_from_store(self, store: ResultStore) -> int:
+        new_shards = 0
+        for metric, spec in self.metrics.items():
+            shards = sorted(
+                glob.glob(os.path.join(store.root, spec.table, "*", "*.npy"))
+            )
+            for shard in shards:
+                key = (metric, shard)
+                if key in self.seen_shards:
+                    continue
+                self.add_records(metric, np.load(shard))
+                self.seen_shards.add(key)
+                new_shards += 1
+        return new_shards
+
+    def values(self, metric: str) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(
+                self.counts[metric] > 0,
+                self.sums[metric] / np.maximum(self.counts[metric], 1),
+                np.nan,
+            )
+
+    def cells(self, metric: str) -> Tuple[np.ndarray, np.ndarray]:
+        # precomputed values and display text for the whole matrix, only redone when the metric changes
+        # padded with an empty last row/col so unknown regions can index it as -1
+        if metric not in self._cache:
+            spec = self.metrics[metric]
+            values = self.values(metric)
+            text = np.where(np.isnan(values), "", np.char.mod(spec.fmt, values))
+            self._cache[metric] = (
+                np.pad(values, ((0, 1), (0, 1)), constant_values=np.nan),
+                np.pad(text, ((0, 1), (0, 1)), constant_values=""),
+            )
+        return self._cache[metric]
+
+    def rows(
+        self, metric: str, row_regions: List[str], col_regions: List[str]
+    ) -> Iterator[PivotRow]:
+        # generator so the template can stream rows without the whole table in memory at once
+        # colors are scaled within the requested block, a tile only changes when its own values do
+        values, text = self.cells(metric)
+        row_ids = [self.region_ids.get(r, -1) for r in row_regions]
+        col_ids = [self.region_ids.get(c, -1) for c in col_regions]
+        block = np.ix_(row_ids, col_ids)
+        colors = colors_for(values[block], self.metrics[metric].lower_is_better)
+        text = text[block]
+        for i, row in enumerate(row_regions):
+            cells = [
+                PivotCell(col, colors[i, j], text[i, j])
+                for j, col in enumerate(col_regions)
+            ]
+            yield PivotRow(row, cells)
+
+    def save(self, path: str):
+        np.savez_compressed(
+            path,
+            regions=np.array(self.regions, dtype=str),
+            seen_shards=np.array(
+                [f"{m}|{s}" for m, s in sorted(self.seen_shards)], dtype=str
+            ),
+            **{f"sums_{m}": self.sums[m] for m in self.metrics},
+            **{f"counts_{m}": self.counts[m] for m in self.metrics},
+            **{f"spec_{m}": np.array(repr(self.metrics[m])) for m in self.metrics},
+        )
+
+    @staticmethod
+    def load(path: str, metrics: Dict[str, PivotMetric] = None):
+        engine = PivotEngine(metrics)
+        if not os.path.exists(path):
+            return engine
+        data = np.load(path)
+        for region in data["regions"]:
+            engine.region_id(str(region))
+        # a metric whose definition changed since it was saved is folded again from scratch
+        current = set()
+        for m in engine.metrics:
+            spec_key = f"spec_{m}"
+            if spec_key in data and str(data[spec_key]) == repr(engine.metrics[m]):
+                engine.sums[m] = data[f"sums_{m}"]
+                engine.counts[m] = data[f"counts_{m}"]
+                current.add(m)
+        engine._grow()
+        engine.seen_shards = set(
+            key
+            for key in (tuple(str(s).split("|", 1)) for s in data["seen_shards"])
+            if key[0] in current
+        )
+        return engine
+
+
+def alphabetical_order(regions: List[str]) -> List[str]:
+    return sorted(regions)
+
+
+def geographic_order(
+    regions: List[str], coordinates: Dict[str, Tuple[float, float]]
+) -> List[str]:
+    # west -> east, then north -> south, regions without coordinates at the end alphabetically
+    located = [r for r in regions if r in coordinates]
+    unlocated = sorted(r for r in regions if r not in coordinates)
+    located.sort(key=lambda r: (round(coordinates[r][1] / 15.0), -coordinates[r][0]))
+    return located + unlocated
+
+
+def render_pivot_html(
+    engine: PivotEngine,
+    metric: str,
+    out_path: str,
+    by_geography: bool = False,
+    coordinates: Dict[str, Tuple[float, float]] = None,
+    render_headers: bool = True,
+):
+    from jinja2 import Environment, FileSystemLoader
+
+    if by_geography:
+        order = geographic_order(engine.regions, coordinates or {})
+    else:
+        order = alphabetical_order(engine.regions)
+
+    env = Environment(loader=FileSystemLoader("templates"))
+    template = env.get_template("pivot_page.html.jinja2")
+    with open(out_path, "w", encoding="utf-8") as fp:
+        template.stream(
+            by_geography=by_geography,
+            render_headers=render_headers,
+            col_regions=order,
+            rows=engine.rows(metric, order, order),
+        ).dump(fp)
@@ -1,29 +1,124 @@
 import argparse
+import asyncio
+import base64
+import functools
 import concurrent
 import concurrent.futures
-import glob
-import queue
-import random
+import hashlib
 
 import itertools
 import re
 import shutil
+import socket
+import tempfile
+import threading
 import time
 import traceback
 import uuid
+from contextlib import contextmanager
 from datetime import datetime
 from distutils import dir_util
 from enum import Enum
 from multiprocessing.dummy import freeze_support
-from pprint import pprint
-from typing import AnyStr, List, NamedTuple
+from collections import Counter, deque
+from typing import AnyStr, Dict, List, NamedTuple
 import logging
 import humanize
 from python_terraform import *
 from tqdm import tqdm
 
+from aioexec import (
+    MemorySampler,
+    SubprocessBridge,
+    print_memory_report,
+    record_memory_report,
+)
+from artifactstore import ArtifactStore, list_runs, pack_run_dir, print_disk_usage
+from durationmodel import (
+    ORDERS,
+    DurationModel,
+    RunEstimate,
+    estimate_basis_counts,
+    order_estimates,
+)
+from combos import (
+    iter_combos,
+    iter_pairs,
+    load_region_continents,
+    parse_provider_pairs,
+    parse_shard,
+    print_coverage_report,
+    put_combos,
+    sample_pairs,
+    write_combos,
+)
+from convergence import ConvergenceMonitor, IperfSettings
+from imagecache import (
+    BAKEABLE_PROVIDERS,
+    PROVISION_SCRIPT,
+    READINESS_POLL_SECONDS,
+    READINESS_PROBE,
+    READINESS_TIMEOUT_SECONDS,
+    BakedImage,
+    ImageCatalog,
+    bake_pairs,
+    keep_golden_images,
+)
+from logstream import BenchmarkLog, LogSection, read_log_bytes, split_sections
+from manifest import CohortManifest, combo_dirname
+from pivot import METRICS, PivotEngine, render_pivot_html
+from regioncatalog import RegionCatalog
+from registry import HOST, PAIR, Benchmark, BenchmarkRegistry, run_stages
+from results import PARSERS, ResultStore, ingest_run_dir, parse_and_store
+from scheduler import HELD_POLL_SECONDS, QuotaScheduler, ScheduledItem, load_quotas
+from simulation import (
+    BENCH_MODES,
+    BENCH_REPORT_FILE,
+    BENCH_SIZES,
+    NULL_MODULE,
+    SIMULATION_FILE,
+    STUB_TERRAFORM,
+    TERRAFORM_MODES,
+    SimulatedHost,
+    SimulatedTerraform,
+    SimulationSettings,
+    create_stub_workdir,
+    is_simulated_cohort,
+    load_simulation_settings,
+    record_bench_result,
+    run_latencies,
+    simulated_combos,
+)
+from statusserver import (
+    PhaseHistograms,
+    RunStatusBoard,
+    StatusServer,
+    build_status_app,
+)
+from teardown import (
+    DESTROY_RETRY_SECONDS,
+    TEARDOWN_WORKERS,
+    TeardownLedger,
+    TeardownPool,
+    destroy_with_retries,
+    print_teardown_stats,
+)
+from tfworkdir import TerraformWorkdirFactory
+from tracing import NULL_TRACER, Tracer, load_spans, print_span_summary, summarize_spans
+from workqueue import WorkQueue, SQLiteWorkQueue, open_work_queue, print_queue_stats
+
 
 COHORT = "all-providers-real"
+# parsed benchmark records, kept outside the cohort dir so it only ever holds combo dirs
+RESULTS_DIR = os.path.join("artifacts", "results")
+# per-run phase spans, artifacts/traces/<cohort>/<uuid>.jsonl
+TRACES_DIR = os.path.join("artifacts", "traces")
+# per-provider and per-region concurrent VM limits, all from notes.tex:
+# aws 32 vCPUs, azure 10 VMs/region, gcp 25 VMs ("quota limits to update"),
+# linode 50 and vultr 100 ("before launch"), digitalocean is unknown so left unlimited
+QUOTA_FILE = "quotas.json"
+# orchestrator memory per in-flight run, one line per process pool / asyncio orchestration
+MEMORY_REPORT_FILE = "orchestrator-memory.jsonl"
 
 
 class CloudProvider(str, Enum):
@@ -70,6 +165,324 @@ class BenchmarkConfig(NamedTuple):
         return "_".join([str(h) for h in self.hosts])
 
 
+# every command to a target is multiplexed over one authenticated OpenSSH ControlMaster
+# connection instead of paying a full key exchange per `ssh` process
+# ControlMaster isn't supported by the Windows OpenSSH client, fall back to a connection per command there
+SSH_MULTIPLEXING = os.name != "nt"
+# unix socket paths are limited to ~104 chars, so keep them out of the (long) tf workdir
+SSH_CONTROL_DIR = os.path.join(tempfile.gettempdir(), "pyterra-ssh")
+SSH_CONTROL_PERSIST = "30m"
+
+# set by the asyncio orchestrator, every terraform and ssh command of every run is then spawned by its event loop
+# instead of each run's thread forking its own (and needing a pump thread per stream)
+SUBPROCESS_BRIDGE: SubprocessBridge = None
+
+
+def set_subprocess_bridge(bridge: SubprocessBridge):
+    global SUBPROCESS_BRIDGE
+    SUBPROCESS_BRIDGE = bridge
+
+
+class BridgedTerraform(Terraform):
+    # Terraform.cmd with the child process on the orchestrator's loop when there is one
+    def cmd(self, cmd, *args, **kwargs):
+        if SUBPROCESS_BRIDGE is None:
+            return super().cmd(cmd, *args, **kwargs)
+
+        capture_output = kwargs.pop("capture_output", True)
+        kwargs.pop("raise_on_error", None)
+        cmds = self.generate_cmd_string(cmd, *args, **kwargs)
+        env = os.environ.copy() if self.is_env_vars_included else {}
+        return_code, stdout, stderr = SUBPROCESS_BRIDGE.capture(
+            cmds, cwd=self.working_dir or None, env=env
+        )
+        if return_code == 0:
+            self.read_state_file()
+        self.temp_var_files.clean_up()
+
+        stdout = stdout.decode("utf-8")
+        stderr = stderr.decode("utf-8")
+        if capture_output is not True:
+            # same as Terraform.cmd, uncaptured output goes to the console
+            sys.stdout.write(stdout)
+            sys.stderr.write(stderr)
+            return return_code, None, None
+        return return_code, stdout, stderr
+
+
+class SSHSession(object):
+    username: str
+    ip_address: str
+    ssh_private_key: str
+    known_hosts_file: str
+    control_path: str
+    handshakes: int
+    commands: int
+    failed_masters: int
+
+    def __init__(self, username: str, ip_address: str, ssh_private_key: str):
+        self.username = username
+        self.ip_address = ip_address
+        self.ssh_private_key = os.path.abspath(ssh_private_key)
+        self.cwd = os.path.dirname(self.ssh_private_key)
+
+        # the private key lives in the per-run tf workdir, so this known_hosts is per-run as well and
+        # parallel workers stop fighting over (and rewriting) ~/.ssh/known_hosts
+        self.known_hosts_file = os.path.join(self.cwd, "known_hosts")
+
+        key_hash = hashlib.sha1(self.ssh_private_key.encode("utf-8")).hexdigest()[:16]
+        self.control_path = os.path.join(SSH_CONTROL_DIR, f"{key_hash}.sock")
+
+        self.handshakes = 0
+        self.commands = 0
+        # master connections that didn't come up, kept apart so the direct ssh that
+        # follows isn't counted as a second handshake for the same command
+        self.failed_masters = 0
+        self.opened = False
+        self.lock = threading.Lock()
+
+    @property
+    def destination(self) -> str:
+        return f"{self.username}@{self.ip_address}"
+
+    @property
+    def handshakes_avoided(self) -> int:
+        return max(self.commands - self.handshakes, 0)
+
+    def ssh_options(self) -> List[str]:
+        options = [
+            "-i",
+            os.path.basename(self.ssh_private_key),
+            "-o",
+            "StrictHostKeyChecking=no",
+            "-o",
+            f"UserKnownHostsFile={self.known_hosts_file}",
+        ]
+        if SSH_MULTIPLEXING:
+            options.extend(["-o", f"ControlPath={self.control_path}"])
+        return options
+
+    def _control(self, cmd: List[str]) -> int:
+        # master start/check/exit go through the orchestrator's loop as well when there is one
+        # the backgrounded master inherits stdout/stderr, capturing them would block until it exits
+        if SUBPROCESS_BRIDGE is not None:
+            return SUBPROCESS_BRIDGE.status(cmd, cwd=self.cwd)
+        p = subprocess.run(
+            cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=self.cwd
+        )
+        return p.returncode
+
+    def is_open(self) -> bool:
+        if not SSH_MULTIPLEXING:
+            return False
+        # only talks to the local control socket, no handshake
+        cmd = ["ssh", *self.ssh_options(), "-O", "check", self.destination]
+        return self._control(cmd) == 0
+
+    def open(self) -> bool:
+        if not SSH_MULTIPLEXING:
+            return False
+        if not os.path.exists(SSH_CONTROL_DIR):
+            os.makedirs(SSH_CONTROL_DIR, exist_ok=True)
+
+        cmd = [
+            "ssh",
+            *self.ssh_options(),
+            "-o",
+            "ControlMaster=yes",
+            "-o",
+            f"ControlPersist={SSH_CONTROL_PERSIST}",
+            "-N",
+            "-f",
+            self.destination,
+        ]
+        return_code = self._control(cmd)
+        self.opened = return_code == 0
+        if self.opened:
+            self.handshakes += 1
+        else:
+            self.failed_masters += 1
+            print(
+                f"[{self.destination}] failed to open ssh master connection: {return_code}",
+                flush=True,
+            )
+        return self.opened
+
+    def close(self):
+        if self.opened:
+            cmd = ["ssh", *self.ssh_options(), "-O", "exit", self.destination]
+            self._control(cmd)
+        self.opened = False
+
+    def _cmd(self, cmd_str: str) -> List[str]:
+        cmd = ["ssh", *self.ssh_options()]
+        if SSH_MULTIPLEXING:
+            cmd.extend(["-o", "ControlMaster=no"])
+        cmd.append(self.destination)
+        cmd.extend(cmd_str.split())
+        return cmd
+
+    def _run(self, cmd_str: str):
+        if SUBPROCESS_BRIDGE is not None:
+            cmd = self._cmd(cmd_str)
+            return_code, stdout, stderr = SUBPROCESS_BRIDGE.capture(cmd, cwd=self.cwd)
+            return subprocess.CompletedProcess(cmd, return_code, stdout, stderr)
+        return subprocess.run(self._cmd(cmd_str), capture_output=True, cwd=self.cwd)
+
+    def _stream(self, cmd_str: str, on_stdout, on_stderr):
+        # hands each line to the callbacks as it arrives instead of buffering the whole output,
+        # stderr is drained on its own thread so neither pipe can fill up and stall ssh
+        if SUBPROCESS_BRIDGE is not None:
+            stdout_lines = [0]
+
+            def count_stdout(line):
+                stdout_lines[0] += 1
+                on_stdout(line)
+
+            return_code = SUBPROCESS_BRIDGE.stream(
+                self._cmd(cmd_str), count_stdout, on_stderr, cwd=self.cwd
+            )
+            return return_code, stdout_lines[0]
+
+        p = subprocess.Popen(
+            self._cmd(cmd_str),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=self.cwd,
+        )
+        stdout_lines = 0
+
+        def pump(pipe, callback):
+            for raw in iter(pipe.readline, b""):
+                callback(raw.decode("utf-8", errors="replace"))
+            pipe.close()
+
+        stderr_thread = threading.Thread(
+            target=pump, args=(p.stderr, on_stderr), daemon=True
+        )
+        stderr_thread.start()
+        for raw in iter(p.stdout.readline, b""):
+            stdout_lines += 1
+            on_stdout(raw.decode("utf-8", errors="replace"))
+        p.stdout.close()
+        stderr_thread.join()
+        return p.wait(), stdout_lines
+
+    def _begin_command(self):
+        with self.lock:
+            if not self.opened:
+                self.open()
+
+            self.commands += 1
+            if not self.opened:
+                # no master to multiplex over, every command pays its own handshake
+                self.handshakes += 1
+
+    def _reconnect(self) -> bool:
+        # 255 is ssh's own error code, the master may have died underneath us (node reboot, network blip)
+        # so reconnect once and retry before handing back the error
+        with self.lock:
+            if not self.is_open():
+                self.opened = False
+                return self.open()
+        return False
+
+    def stream(self, cmd_str: str, on_stdout, on_stderr) -> int:
+        self._begin_command()
+        return_code, stdout_lines = self._stream(cmd_str, on_stdout, on_stderr)
+        # only retry if nothing made it out, otherwise the log would get the output twice
+        if return_code == 255 and self.opened and stdout_lines == 0:
+            if self._reconnect():
+                return_code, stdout_lines = self._stream(cmd_str, on_stdout, on_stderr)
+        return return_code
+
+    def run(self, cmd_str: str):
+        self._begin_command()
+        p = self._run(cmd_str)
+        if p.returncode == 255 and self.opened and self._reconnect():
+            p = self._run(cmd_str)
+
+        return (
+            p.returncode,
+            str(p.stdout.decode("ascii")),
+            str(p.stderr.decode("ascii")),
+        )
+
+    def stats_str(self) -> str:
+        stats = f"{self.commands} commands over {self.handshakes} handshakes ({self.handshakes_avoided} avoided)"
+        if self.failed_masters > 0:
+            stats += f", {self.failed_masters} failed master connections"
+        return stats
+
+
+class SimulatedSSHSession(SSHSession):
+    # the same multiplexing/retry bookkeeping as a real session, with a SimulatedHost instead of sshd
+    def __init__(
+        self,
+        username: str,
+        ip_address: str,
+        ssh_private_key: str,
+        host: SimulatedHost,
+    ):
+        super().__init__(username, ip_address, ssh_private_key)
+        self.host = host
+
+    def is_open(self) -> bool:
+        return self.host.connected
+
+    def open(self) -> bool:
+        self.handshakes += 1
+        self.host.connected = True
+        self.opened = True
+        return True
+
+    def close(self):
+        self.host.connected = False
+        self.opened = False
+
+    def _run(self, cmd_str: str):
+        return_code, stdout, stderr = self.host.run(cmd_str)
+        return subprocess.CompletedProcess(cmd_str, return_code, stdout, stderr)
+
+    def _stream(self, cmd_str: str, on_stdout, on_stderr):
+        return self.host.stream(cmd_str, on_stdout, on_stderr)
+
+
+# sessions are per-process, each ProcessPoolExecutor worker keeps its own
+_ssh_sessions = {}
+_ssh_sessions_lock = threading.Lock()
+
+
+def get_ssh_session(
+    username: str, ip_address: str, ssh_private_key: str, provider: str = None
+) -> SSHSession:
+    key = (username, ip_address, os.path.abspath(ssh_private_key))
+    with _ssh_sessions_lock:
+        if key not in _ssh_sessions:
+            if SIMULATION is not None:
+                _ssh_sessions[key] = SimulatedSSHSession(
+                    username,
+                    ip_address,
+                    ssh_private_key,
+                    SimulatedHost(SIMULATION, provider),
+                )
+            else:
+                _ssh_sessions[key] = SSHSession(username, ip_address, ssh_private_key)
+        return _ssh_sessions[key]
+
+
+def close_ssh_sessions(ssh_private_keys: List[str]) -> List[SSHSession]:
+    ssh_private_keys = [os.path.abspath(k) for k in ssh_private_keys]
+    closed = []
+    with _ssh_sessions_lock:
+        for key in list(_ssh_sessions.keys()):
+            if key[2] in ssh_private_keys:
+                session = _ssh_sessions.pop(key)
+                session.close()
+                closed.append(session)
+    return closed
+
+
 class BenchmarkTarget(NamedTuple):
     src_dst: AnyStr
     ip_address: AnyStr
@@ -79,28 +492,18 @@ class BenchmarkTarget(NamedTuple):
     provider: AnyStr
     ssh_private_key: AnyStr
 
-    def ssh_keygen_reset(self):
-        cmd = ["ssh-keygen", "-R", self.ip_address]
-        p = subprocess.run(
-            cmd, capture_output=True, cwd=os.path.dirname(self.ssh_private_key)
-        )
-        return (
-            p.returncode,
-            str(p.stdout.decode("ascii")),
-            str(p.stderr.decode("ascii")),
+    def ssh_session(self) -> SSHSession:
+        username = CloudProvider.ssh_user(self.provider)
+        return get_ssh_session(
+            username, self.ip_address, self.ssh_private_key, str(self.provider)
         )
 
-    def run_ssh_cmd(self, cmd_str):
-        username = CloudProvider.ssh_user(self.provider)
-        cmd = [
-            "ssh",
-            "-i",
-            os.path.basename(self.ssh_private_key),
-            "-o",
-            "StrictHostKeyChecking=no",
-            f"{username}@{self.ip_address}",
-        ]
-        cmd.extend(cmd_str.split())
+    def ssh_keygen_reset(self):
+        # only touches the per-run known_hosts, never the shared one
+        known_hosts_file = self.ssh_session().known_hosts_file
+        if not os.path.exists(known_hosts_file):
+            return (0, "", "")
+        cmd = ["ssh-keygen", "-R", self.ip_address, "-f", known_hosts_file]
         p = subprocess.run(
             cmd, capture_output=True, cwd=os.path.dirname(self.ssh_private_key)
         )
@@ -110,34 +513,39 @@ class BenchmarkTarget(NamedTuple):
             str(p.stderr.decode("ascii")),
         )
 
-    def run_ssh_benchmark_cmd(self, cmd_str, as_private=False):
-        stdout_all = []
-        stderr_all = []
+    def run_ssh_cmd(self, cmd_str):
+        return self.ssh_session().run(cmd_str)
+
+    def wait_until_ready(self, timeout: float = READINESS_TIMEOUT_SECONDS) -> bool:
+        # polls instead of sleeping a fixed amount, a golden image is usually ready on the first try
+        deadline = time.time() + timeout
+        while True:
+            (return_code, stdout, stderr) = self.run_ssh_cmd(READINESS_PROBE)
+            if return_code == 0:
+                return True
+            if time.time() > deadline:
+                return False
+            time.sleep(READINESS_POLL_SECONDS)
+
+    def stream_ssh_cmd(self, cmd_str, section: LogSection, on_stdout=None) -> int:
+        # on_stdout sees every line right after it's logged, e.g. to stop a benchmark early
+        def write_stdout(line):
+            section.write_stdout(line)
+            if on_stdout is not None:
+                on_stdout(line)
+
+        return self.ssh_session().stream(cmd_str, write_stdout, section.write_stderr)
+
+    def run_ssh_benchmark_cmd(self, cmd_str, section: LogSection) -> int:
         # run a hostname since these lots may be written to the same file
         # this let's us know which machine is under execution a bit easier
         # to read than just the IP address
-        (return_code, stdout, stderr) = self.run_ssh_cmd(f"hostname")
-        stdout_all.append(stdout)
-        stderr_all.append(stderr)
-
-        (return_code, stdout, stderr) = self.run_ssh_cmd(f"time {cmd_str}")
-        stdout_all.append(stdout)
-        stderr_all.append(stderr)
-        return (return_code, "\n".join(stdout_all), "\n".join(stderr_all))
+        self.stream_ssh_cmd("hostname", section)
+        return self.stream_ssh_cmd(f"time {cmd_str}", section)
 
 
 def run_ssh_cmd(ip_str, cmd_str, id_rsa_path):
-    cmd = [
-        "ssh",
-        "-i",
-        os.path.basename(id_rsa_path),
-        "-o",
-        "StrictHostKeyChecking=no",
-        f"root@{ip_str}",
-    ]
-    cmd.extend(cmd_str.split())
-    p = subprocess.run(cmd, capture_output=True, cwd=os.path.dirname(id_rsa_path))
-    return (p.returncode, str(p.stdout.decode("ascii")), str(p.stderr.decode("ascii")))
+    return get_ssh_session("root", ip_str, id_rsa_path).run(cmd_str)
 
 
 def run_ssh_benchmark_cmd(ip_str, cmd_str, id_rsa_path):
@@ -146,7 +554,7 @@ def run_ssh_benchmark_cmd(ip_str, cmd_str, id_rsa_path):
     # run a hostname since these lots may be written to the same file
     # this let's us know which machine is under execution a bit easier
     # to read than just the IP address
-    (return_code, stdout, stderr) = run_ssh_cmd(ip_str, f"hostname", id_rsa_path)
+    (return_code, stdout, stderr) = run_ssh_cmd(ip_str, "hostname", id_rsa_path)
     stdout_all.append(stdout)
     stderr_all.append(stderr)
 
@@ -161,130 +569,494 @@ IPERF_UDP_PORT = 25000
 IPERF_RETRIES = 5
 BENCHMARK_RUNTIME = 60
 THREAD_COUNT = 1
+# one iperf client per node at a time, adaptive runs SIGINT it through this once converged
+IPERF_CLIENT_PIDFILE = f"/tmp/iperf-client.{IPERF_PORT}.pid"
+# fixed BENCHMARK_RUNTIME and THREAD_COUNT unless --iperf-adaptive / --iperf-parallel say otherwise
+IPERF_SETTINGS = IperfSettings(max_seconds=BENCHMARK_RUNTIME, parallel=(THREAD_COUNT,))
 
 
-def run_iperf(targets: List[BenchmarkTarget], private=False):
-    stdout_all = []
-    stderr_all = []
+def set_iperf_settings(settings: IperfSettings):
+    global IPERF_SETTINGS
+    IPERF_SETTINGS = settings
+
+
+# latency probes (ping/traceroute) barely touch the link, so both directions (and the traceroute variants)
+# can run at the same time. bandwidth tests (iperf) always run serially since overlap would skew results
+CONCURRENT_BENCHMARKS = True
+
+
+def set_concurrent_benchmarks(enabled: bool):
+    global CONCURRENT_BENCHMARKS
+    CONCURRENT_BENCHMARKS = enabled
+
+
+# boot from golden images in the image catalog where there is one, see bake-images
+USE_IMAGE_CACHE = True
+
+
+def set_image_cache(enabled: bool):
+    global USE_IMAGE_CACHE
+    USE_IMAGE_CACHE = enabled
+
+
+# names from BENCHMARKS to run, None is every default one
+BENCHMARK_SELECTION = None
+
+
+def set_benchmark_selection(names: List[str]):
+    global BENCHMARK_SELECTION
+    BENCHMARK_SELECTION = names
+
+
+# --simulate, terraform and every node are faked (see simulation.py) and the runs go to a cohort of their own
+SIMULATION: SimulationSettings = None
+
+
+def set_simulation(settings: SimulationSettings):
+    global SIMULATION, COHORT, _teardown_pool, _status_board
+    SIMULATION = settings
+    if settings is not None and settings.cohort != COHORT:
+        COHORT = settings.cohort
+        # the teardown ledger and status board belong to the cohort they were opened for
+        _teardown_pool = None
+        _status_board = None
+
+
+def uses_stub_terraform() -> bool:
+    return SIMULATION is not None and SIMULATION.terraform == STUB_TERRAFORM
+
+
+def set_worker_options(
+    concurrent_benchmarks: bool,
+    image_cache: bool,
+    iperf_settings: IperfSettings,
+    benchmark_selection: List[str],
+    simulation: SimulationSettings,
+):
+    set_concurrent_benchmarks(concurrent_benchmarks)
+    set_benchmark_selection(benchmark_selection)
+    set_image_cache(image_cache)
+    set_iperf_settings(iperf_settings)
+    set_simulation(simulation)
+
+
+def run_directions(
+    targets: List[BenchmarkTarget],
+    build_cmd,
+    log: BenchmarkLog,
+    serial=None,
+    echo_cmd=False,
+    tracer: Tracer = NULL_TRACER,
+    watch=None,
+):
+    # runs `build_cmd(from_host, to_host)` src->dst and dst->src, each streaming into its own log section
+    # sections are opened up front so output always lands in direction order
+    # watch(from_host, to_host, section) may return a callback for every stdout line
+    if serial is None:
+        serial = not CONCURRENT_BENCHMARKS
+
+    directions = [(targets[0], targets[1]), (targets[1], targets[0])]
+    sections = [
+        log.section(f"{from_host.src_dst}->{to_host.src_dst}")
+        for from_host, to_host in directions
+    ]
+
+    def _run_direction(args):
+        (from_host, to_host), section = args
+        cmd = build_cmd(from_host, to_host)
+        if echo_cmd:
+            section.write_stdout(cmd)
+        on_stdout = watch(from_host, to_host, section) if watch is not None else None
+        with tracer.span(
+            f"{log.name}.direction",
+            direction=section.label,
+            provider=str(from_host.provider),
+        ):
+            return (cmd, from_host.stream_ssh_cmd(cmd, section, on_stdout))
+
+    if serial:
+        return [_run_direction(d) for d in zip(directions, sections)]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(directions)) as executor:
+        return list(executor.map(_run_direction, zip(directions, sections)))
+
+
+def run_iperf(
+    targets: List[BenchmarkTarget],
+    log: BenchmarkLog,
+    private=False,
+    tracer: Tracer = NULL_TRACER,
+    settings: IperfSettings = None,
+):
+    if settings is None:
+        settings = IPERF_SETTINGS
     try:
+        servers = log.section("servers")
         for target in targets:
             (return_code, stdout, stderr) = target.run_ssh_cmd(
                 f"sudo nohup iperf --server --port {IPERF_PORT} &> /dev/null & echo $!"
             )
-            stdout_all.append(stdout)
-            stderr_all.append(stderr)
-
-        bench_start = time.perf_counter()
-        for from_host, to_host in targets, reversed(targets):
-            to_ip = to_host.private_ip_address if private else to_host.ip_address
-            # TODO: fix for azure
-            # (return_code, stdout, stderr) = _run_iperf(from_host.ip_address, to_ip, from_host.ssh_private_key)
-            (return_code, stdout, stderr) = from_host.run_ssh_cmd(
-                f"sudo iperf --enhancedreports --client {to_ip} --port {IPERF_PORT} --format m --time {BENCHMARK_RUNTIME} --parallel {THREAD_COUNT}"
+            servers.write(stdout, stderr)
+
+        for parallel in settings.parallel:
+
+            def build_iperf_cmd(from_host, to_host):
+                to_ip = to_host.private_ip_address if private else to_host.ip_address
+                # TODO: fix for azure
+                # (return_code, stdout, stderr) = _run_iperf(from_host.ip_address, to_ip, from_host.ssh_private_key)
+                cmd = f"sudo iperf --enhancedreports --client {to_ip} --port {IPERF_PORT} --format m --time {settings.max_seconds:g} --parallel {parallel}"
+                if settings.adaptive:
+                    # interval reports to judge convergence by, and a pid to stop it with
+                    # (iperf still prints its summary on SIGINT)
+                    cmd = f"echo $$ > {IPERF_CLIENT_PIDFILE}; exec {cmd} --interval {settings.interval_seconds:g}"
+                return cmd
+
+            def watch(from_host, to_host, section):
+                if not settings.adaptive:
+                    return None
+                monitor = ConvergenceMonitor(settings, parallel)
+
+                def on_stdout(line):
+                    if monitor.feed(line):
+                        from_host.run_ssh_cmd(
+                            f"sudo kill -INT $(cat {IPERF_CLIENT_PIDFILE})"
+                        )
+                        section.write_stdout(monitor.summary())
+
+                return on_stdout
+
+            # never overlap the directions, both would be fighting for the same link
+            run_directions(
+                targets,
+                build_iperf_cmd,
+                log,
+                serial=True,
+                tracer=tracer,
+                watch=watch,
             )
-
-            stdout_all.append(stdout)
-            stderr_all.append(stderr)
-        bench_end = time.perf_counter()
-        print(
-            f"Benchmark total time: {bench_end - bench_start:0.4f} seconds", flush=True
-        )
-        print(
-            f"Benchmark total time: {humanize.naturaltime(bench_end - bench_start)}",
-            flush=True,
-        )
     except Exception as ex:
-        stderr_all.append(str(ex))
+        log.section("error").write_stderr(str(ex))
 
-    return (0, "\n".join(stdout_all), "\n".join(stderr_all))
+    return 0
 
 
-def run_ping(targets: List[BenchmarkTarget]):
-    stdout_all = []
-    stderr_all = []
+def run_ping(
+    targets: List[BenchmarkTarget],
+    log: BenchmarkLog,
+    serial=None,
+    tracer: Tracer = NULL_TRACER,
+):
     try:
-        bench_start = time.perf_counter()
-        for from_host, to_host in targets, reversed(targets):
+
+        def build_ping_cmd(from_host, to_host):
             logging.info(f"_run_ping({from_host}, {to_host})")
-            ping_cmd = f"ping -c 100 {to_host.ip_address}"
-            stdout_all.append(ping_cmd)
-            (return_code, stdout, stderr) = from_host.run_ssh_cmd(ping_cmd)
-            stdout_all.append(stdout)
-            stderr_all.append(stderr)
-        bench_end = time.perf_counter()
-        print(f"Ping total time: {bench_end - bench_start:0.4f} seconds", flush=True)
-        print(
-            f"Ping total time: {humanize.naturaltime(bench_end - bench_start)}",
-            flush=True,
+            return f"ping -c 100 {to_host.ip_address}"
+
+        run_directions(
+            targets, build_ping_cmd, log, serial=serial, echo_cmd=True, tracer=tracer
         )
     except Exception as ex:
-        stderr_all.append(str(ex))
+        log.section("error").write_stderr(str(ex))
 
-    return (0, "\n".join(stdout_all), "\n".join(stderr_all))
+    return 0
 
 
-def run_traceroute(targets: List[BenchmarkTarget], use_icmp=False, private=False):
-    stdout_all = []
-    stderr_all = []
+def run_traceroute(
+    targets: List[BenchmarkTarget],
+    log: BenchmarkLog,
+    use_icmp=False,
+    private=False,
+    serial=None,
+    tracer: Tracer = NULL_TRACER,
+):
     try:
-        bench_start = time.perf_counter()
         trace_type = "icmp" if use_icmp else "udp"
-        for from_host, to_host in targets, reversed(targets):
+
+        def build_traceroute_cmd(from_host, to_host):
             logging.info(f"_run_traceroute({from_host}, {to_host})")
             to_ip = to_host.private_ip_address if private else to_host.ip_address
-            traceroute_cmd = f"sudo traceroute --tries=5 --wait=5 --resolve-hostnames --type={trace_type} {to_ip}"
-            stdout_all.append(traceroute_cmd)
-            (return_code, stdout, stderr) = from_host.run_ssh_cmd(traceroute_cmd)
-            stdout_all.append(stdout)
-            stderr_all.append(stderr)
-        bench_end = time.perf_counter()
-        print(
-            f"Benchmark total time: {bench_end - bench_start:0.4f} seconds", flush=True
-        )
-        print(
-            f"Benchmark total time: {humanize.naturaltime(bench_end - bench_start)}",
-            flush=True,
+            return f"sudo traceroute --tries=5 --wait=5 --resolve-hostnames --type={trace_type} {to_ip}"
+
+        run_directions(
+            targets,
+            build_traceroute_cmd,
+            log,
+            serial=serial,
+            echo_cmd=True,
+            tracer=tracer,
         )
     except Exception as ex:
-        stderr_all.append(str(ex))
+        log.section("error").write_stderr(str(ex))
+
+    return 0
+
+
+def run_on_hosts(
+    targets: List[BenchmarkTarget],
+    build_cmd,
+    log: BenchmarkLog,
+    serial=None,
+    tracer: Tracer = NULL_TRACER,
+):
+    # runs `build_cmd(target)` on every node, each into its own section (opened up front, same as run_directions)
+    # host-local benchmarks don't share anything, so the nodes go at the same time
+    if serial is None:
+        serial = not CONCURRENT_BENCHMARKS
+
+    sections = [log.section(target.src_dst) for target in targets]
+
+    def _run_host(args):
+        target, section = args
+        cmd = build_cmd(target)
+        logging.info(f"_run_on_hosts({target}, {cmd})")
+        with tracer.span(
+            f"{log.name}.host",
+            direction=target.src_dst,
+            provider=str(target.provider),
+        ):
+            return (cmd, target.run_ssh_benchmark_cmd(cmd, section))
 
-    return (0, "\n".join(stdout_all), "\n".join(stderr_all))
+    if serial:
+        return [_run_host(t) for t in zip(targets, sections)]
 
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        return list(executor.map(_run_host, zip(targets, sections)))
+
+
+# everything a run measures, in the order they were registered (ties in the stage plan go that way too)
+# a new benchmark is one register() call, BenchmarkRunner.run_benchmarks doesn't need to know about it
+BENCHMARKS = BenchmarkRegistry()
+register_benchmark = BENCHMARKS.register
+
+
+def has_private_networking(runner) -> bool:
+    return runner.enable_private_networking
+
+
+def skip_on_azure(runner):
+    if CloudProvider.AZURE.value in [t.provider for t in runner.targets]:
+        return "Skipping traceroute because of Azure"
+    return None
+
+
+register_benchmark(Benchmark("ping", PAIR, run=run_ping))
+for name, kwargs, enabled in [
+    ("traceroute", {}, None),
+    ("traceroute.icmp", {"use_icmp": True}, None),
+    ("traceroute.private", {"private": True}, has_private_networking),
+    (
+        "traceroute.private.icmp",
+        {"use_icmp": True, "private": True},
+        has_private_networking,
+    ),
+]:
+    register_benchmark(
+        Benchmark(
+            name,
+            PAIR,
+            run=functools.partial(run_traceroute, **kwargs),
+            enabled=enabled,
+            skip=skip_on_azure,
+        )
+    )
+register_benchmark(Benchmark("iperf", PAIR, run=run_iperf, bandwidth=True))
+register_benchmark(
+    Benchmark(
+        "iperf.private",
+        PAIR,
+        run=functools.partial(run_iperf, private=True),
+        bandwidth=True,
+        after=("iperf",),
+        enabled=has_private_networking,
+    )
+)
+register_benchmark(
+    Benchmark("cryptsetup_benchmark", HOST, cmd=lambda target: "cryptsetup benchmark")
+)
+# opt-in with --benchmarks, both are installed by the provision script
+# fio saturates the disk, not the link, but keep it off the nodes while iperf measures
+register_benchmark(
+    Benchmark(
+        "fio",
+        HOST,
+        cmd=lambda target: "fio --name=randrw --rw=randrw --bs=4k --size=256M --runtime=30 --time_based "
+        "--direct=1 --ioengine=libaio --filename=/tmp/fio.benchmark --output-format=json",
+        bandwidth=True,
+        default=False,
+    )
+)
+register_benchmark(
+    Benchmark(
+        "stress-ng",
+        HOST,
+        cmd=lambda target: "stress-ng --cpu 0 --cpu-method matrixprod --metrics-brief --timeout 30s",
+        bandwidth=True,
+        default=False,
+    )
+)
+
+
+DEMOGRAPHICS_CMDS = {
+    "lshw": "sudo lshw -json",
+    "cpuid": "sudo cpuid -1",
+    "cpuinfo": "sudo cat /proc/cpuinfo",
+    "ifconfig": "sudo ifconfig",
+    "resolvectl": "sudo resolvectl status",
+}
+DEMOGRAPHICS_SCRIPT = os.path.join("terraform", "collect-demographics.py")
+DEMOGRAPHICS_STDERR_LINES = 20
+
+
+def collect_demographics(
+    target: BenchmarkTarget, open_log, finish_log, name_cmds=None
+) -> Dict:
+    # ship the survey script and its commands base64'd so they survive the ssh command line's whitespace splitting,
+    # the node runs every command in a single round trip and streams back `<name>\t<stream>\t<line>` records,
+    # each line goes straight into its `<name>.<src_dst>` log so only the per-command summary stays in memory
+    if name_cmds is None:
+        name_cmds = DEMOGRAPHICS_CMDS
+    with open(DEMOGRAPHICS_SCRIPT, "rb") as fp:
+        script_b64 = base64.b64encode(fp.read()).decode("ascii")
+    cmds_b64 = base64.b64encode(json.dumps(name_cmds).encode("utf-8")).decode("ascii")
+
+    bundle = {"hostname": None, "src_dst": target.src_dst, "sections": {}}
+    logs = {}
+    sections = {}
+    # only the tail, for the message if the survey itself fails
+    survey_stderr = deque(maxlen=DEMOGRAPHICS_STDERR_LINES)
+
+    def section(name: str) -> LogSection:
+        if name not in logs:
+            logs[name] = open_log(f"{name}.{target.src_dst}")
+            sections[name] = logs[name].section()
+        return sections[name]
+
+    def on_record(line: str):
+        record = line.rstrip("\n").split("\t", 2)
+        if len(record) != 3:
+            return
+        name, stream, text = record
+        if stream == "hostname":
+            bundle["hostname"] = text
+        elif name not in name_cmds:
+            return
+        elif stream == "stdout":
+            section(name).write_stdout(text)
+        elif stream == "stderr":
+            section(name).write_stderr(text)
+        elif stream == "exit":
+            return_code, seconds = text.split()
+            bundle["sections"][name] = {
+                "cmd": name_cmds[name],
+                "return_code": int(return_code),
+                "seconds": float(seconds),
+            }
 
-def run_cryptsetup_benchmark(targets: List[BenchmarkTarget]):
-    stdout_all = []
-    stderr_all = []
     try:
-        bench_start = time.perf_counter()
-        for target in targets:
-            logging.info(f"_run_cryptsetup_benchmark({target})")
-            (return_code, stdout, stderr) = target.run_ssh_benchmark_cmd(
-                "cryptsetup benchmark"
-            )
-            stdout_all.append(stdout)
-            stderr_all.append(stderr)
-        bench_end = time.perf_counter()
-        print(
-            f"Benchmark total time: {bench_end - bench_start:0.4f} seconds", flush=True
+        return_code = target.ssh_session().stream(
+            f"echo {script_b64} | base64 --decode | python3 - {cmds_b64}",
+            on_record,
+            survey_stderr.append,
         )
-        print(
-            f"Benchmark total time: {humanize.naturaltime(bench_end - bench_start)}",
-            flush=True,
+        # commands that never started, one that streamed part of its output keeps what it got
+        missing = [
+            n for n in name_cmds if n not in bundle["sections"] and n not in logs
+        ]
+        if len(missing) > 0:
+            # no python3 on the node (or the survey blew up), do the rest the slow way
+            print(
+                f"[{target.src_dst}] demographics bundle failed ({return_code}), falling back to per-command: {''.join(survey_stderr)}",
+                flush=True,
+            )
+        for name in missing:
+            start = time.time()
+            return_code = target.stream_ssh_cmd(name_cmds[name], section(name))
+            bundle["sections"][name] = {
+                "cmd": name_cmds[name],
+                "return_code": return_code,
+                "seconds": time.time() - start,
+            }
+    finally:
+        for log in logs.values():
+            finish_log(log)
+
+    return bundle
+
+
+_tf_workdir_factory = None
+
+
+def fix_line_endings(file_path):
+    with open(file_path, "rb") as open_file:
+        content = open_file.read()
+
+    content = content.replace(b"\r\n", b"\n")
+
+    with open(file_path, "wb") as open_file:
+        open_file.write(content)
+
+
+def get_tf_workdir_factory(tf_dir: str) -> TerraformWorkdirFactory:
+    # one per worker process, templates themselves are shared on disk
+    global _tf_workdir_factory
+    if _tf_workdir_factory is None:
+        _tf_workdir_factory = TerraformWorkdirFactory(tf_dir, ".tfworkdir")
+    return _tf_workdir_factory
+
+
+_teardown_pool = None
+# per process, the asyncio orchestrator raises it to its number of in-flight runs
+TEARDOWN_POOL_WORKERS = TEARDOWN_WORKERS
+
+
+def get_teardown_pool() -> TeardownPool:
+    # one per worker process, its threads outlive the run that handed them a workdir
+    global _teardown_pool
+    if _teardown_pool is None:
+        _teardown_pool = TeardownPool(
+            TeardownLedger(os.path.join("artifacts", COHORT)),
+            workers=TEARDOWN_POOL_WORKERS,
+            # a simulated destroy's retries back off on the simulated clock
+            retry_seconds=DESTROY_RETRY_SECONDS
+            * (SIMULATION.time_scale if SIMULATION is not None else 1.0),
         )
-    except Exception as ex:
-        stderr_all.append(str(ex))
+    return _teardown_pool
+
+
+_status_board = None
+
+
+def get_status_board() -> RunStatusBoard:
+    global _status_board
+    if _status_board is None:
+        _status_board = RunStatusBoard(os.path.join("artifacts", COHORT))
+    return _status_board
+
+
+_image_catalog = None
+
+
+def get_image_catalog() -> ImageCatalog:
+    global _image_catalog
+    if _image_catalog is None:
+        _image_catalog = ImageCatalog()
+    return _image_catalog
 
-    return (0, "\n".join(stdout_all), "\n".join(stderr_all))
+
+_region_catalog = None
+
+
+def get_region_catalog() -> RegionCatalog:
+    # loaded lazily once per process instead of once per decode_combo_str host
+    global _region_catalog
+    if _region_catalog is None:
+        _region_catalog = RegionCatalog()
+    return _region_catalog
 
 
 def choose_random_zone(provider: str, region: str):
-    regions_to_zones = json.load(
-        open(os.path.join("artifacts", "regions", "regions-to-zones.json"), "r")
-    )
-    if provider in regions_to_zones and region in regions_to_zones[provider]:
-        zones = regions_to_zones[provider][region]
-        return zones[random.randint(0, len(zones) - 1)]
-    return None
+    # skips zones an earlier apply learned won't take our instance type
+    return get_region_catalog().choose_zone(provider, region)
 
 
 class BenchmarkRunner(object):
@@ -301,12 +1073,28 @@ class BenchmarkRunner(object):
         self.config = decode_combo_str(config_str)
         self.uuid = uuid.uuid4()
         self.targets = []
+        self.logs_written = []
+        # benchmarks that logged an error, any of them fails the run
+        self.failed_benchmarks = []
+        # golden images init_tf picked for the hosts, a failed apply may show one of them is gone
+        self.booted_images = []
 
         if (len(self.config.hosts) == 2) and (len(set(self.config.hosts)) == 1):
             self.enable_private_networking = True
         else:
             self.enable_private_networking = False
 
+        # traces live beside the cohort rather than in the run dir so trace-summary reads one dir
+        self.tracer = Tracer(
+            os.path.join(TRACES_DIR, COHORT, f"{self.uuid}.jsonl"),
+            cohort=COHORT,
+            combo=self.config_str,
+            uuid=str(self.uuid),
+            providers=[str(h.provider) for h in self.config.hosts],
+            src_region=self.config.hosts[0].region,
+            dst_region=self.config.hosts[-1].region,
+        )
+
     def write_to_logfile(self, name, stdout, stderr, print_logs: bool = False):
         # ensure we're always writing a single string block
         if isinstance(stdout, list):
@@ -314,75 +1102,122 @@ class BenchmarkRunner(object):
         if isinstance(stderr, list):
             stderr = "\n".join(stderr)
 
-        # write the actual log files
-        with open(
-            os.path.join(self.benchmark_dir, f"{name}.stdout.log"),
-            "w",
-            encoding="utf-8",
-        ) as fp:
-            fp.write(stdout)
-        with open(
-            os.path.join(self.benchmark_dir, f"{name}.stderr.log"),
-            "w",
-            encoding="utf-8",
-        ) as fp:
-            fp.write(stderr)
-
-        # if requested, print out stdout
-        if print_logs:
-            print(stdout, flush=True)
-        # always print errors
-        print(stderr, flush=True)
-
-    def fix_line_endings(self, file_path):
-        with open(file_path, "rb") as open_file:
-            content = open_file.read()
-
-        content = content.replace(b"\r\n", b"\n")
-
-        with open(file_path, "wb") as open_file:
-            open_file.write(content)
+        # small outputs that already arrived whole (terraform, bookkeeping json) go through the same
+        # compressed logs as the streamed benchmarks
+        log = BenchmarkLog(self.benchmark_dir, name, tee=print_logs)
+        log.section().write(stdout, stderr)
+        self.finish_log(log)
+
+    def open_log(self, name, print_logs: bool = False) -> BenchmarkLog:
+        # benchmarks stream straight into this, print_logs tees each line to the console as it arrives
+        return BenchmarkLog(self.benchmark_dir, name, tee=print_logs)
+
+    def finish_log(self, log: BenchmarkLog):
+        stdout_path, stderr_path = log.close()
+        self.logs_written.append(log.name)
+        if log.name in PARSERS:
+            # only the parsed benchmarks are read back, and those outputs are small
+            stdout = read_log_bytes(stdout_path)
+            self.store_results(
+                log.name,
+                stdout.decode("utf-8", errors="replace"),
+                split_sections(stdout, log.index),
+            )
+
+    def store_results(self, name, stdout, sections=None):
+        # parse as we go so analysis never has to re-read the raw logs
+        try:
+            parse_and_store(
+                ResultStore(os.path.join(RESULTS_DIR, COHORT)),
+                COHORT,
+                combo_dirname(self.config_str),
+                str(self.uuid),
+                name,
+                stdout,
+                sections=sections,
+            )
+        except Exception as ex:
+            print(f"[{str(self.config)}] failed to parse {name}: {ex}", flush=True)
+
+    def update_status(self, update: str, *args):
+        # the status board is only for watching, it never fails a run
+        try:
+            getattr(get_status_board(), update)(str(self.uuid), *args)
+        except Exception as ex:
+            print(f"[{str(self.config)}] failed to update status: {ex}", flush=True)
+
+    def set_phase(self, phase: str):
+        self.update_status("phase", phase)
+
+    @contextmanager
+    def phase(self, name: str):
+        # top-level phases show up on the status server as well as in the trace
+        self.set_phase(name)
+        with self.tracer.span(name):
+            yield
 
     def init_tf(self):
         # print("making tfworkdir", flush=True)
         tf_dir = os.path.abspath("terraform")
 
         # make sure provision script isn't corrupted by windows
-        self.fix_line_endings(os.path.join(tf_dir, "provision-benchmark-node.sh"))
-
-        self.tf_work_dir = os.path.abspath(
-            os.path.join(".tfworkdir", "benchmarks", str(self.uuid))
-        )
-        if not os.path.exists(self.tf_work_dir):
-            os.makedirs(self.tf_work_dir)
-
-        # print("copy_tree tfworkdir", flush=True)
-        dir_util.copy_tree(tf_dir, self.tf_work_dir)
-        if os.path.exists(os.path.join(self.tf_work_dir, ".terraform")):
-            dir_util.remove_tree(os.path.join(self.tf_work_dir, ".terraform"))
-
-        # Do string substitution on the main Terraform file.
-        #
-        # This isn't great but is a "solution" to the problem that Terraform doesn't allow module sources to be variables/interpolated.
-        # An alternative method would be to make main.tf a jinja2 template and render it, but then editing the main.tf becomes
-        # a pain in any IDE since it will be treated either as a jinja2 template and lose intellisense, or like a Terraform file
-        # which has syntax errors onlines like `source = {{ module_src }}`.
-        main_tf = open(os.path.join(self.tf_work_dir, "main.tf"), "r").read()
-        main_tf_updated = main_tf.replace(
-            'source = "./modules/null"',
-            f'source = "./modules/{self.config.hosts[0].provider}"',
-            1,
-        )
-        main_tf_updated = main_tf_updated.replace(
-            'source = "./modules/null"',
-            f'source = "./modules/{self.config.hosts[1].provider}"',
-            1,
-        )
-        with open(os.path.join(self.tf_work_dir, "main.tf"), "w") as fp:
-            fp.write(main_tf_updated)
+        fix_line_endings(os.path.join(tf_dir, "provision-benchmark-node.sh"))
+
+        # per-run dirs are symlink overlays over a pre-initialized template for this provider pair,
+        # only main.tf and terraform.tfvars are real files and providers come from the shared plugin cache
+        providers = [str(h.provider) for h in self.config.hosts]
+        run_dir = os.path.join(".tfworkdir", "benchmarks", str(self.uuid))
+        if uses_stub_terraform():
+            workdir = create_stub_workdir(run_dir)
+        elif SIMULATION is not None:
+            # every host on terraform/modules/null
+            workdir = get_tf_workdir_factory(tf_dir).create(
+                run_dir, ["null" for _ in providers]
+            )
+        else:
+            workdir = get_tf_workdir_factory(tf_dir).create(run_dir, providers)
+        self.tf_work_dir = workdir.path
+        print(
+            f"[{str(self.config)}] terraform init saved {workdir.seconds_saved:0.2f} seconds (overlay {workdir.overlay_seconds:0.4f}s)",
+            flush=True,
+        )
+
+        # a miss boots the stock image and the provision script installs everything as before
+        images = [
+            (
+                get_image_catalog().lookup(str(h.provider), h.region)
+                if USE_IMAGE_CACHE
+                else None
+            )
+            or ""
+            for h in self.config.hosts
+        ]
+        if any(images):
+            print(
+                f"[{str(self.config)}] golden images: {', '.join(i or 'miss' for i in images)}",
+                flush=True,
+            )
+        self.booted_images = [
+            BakedImage(str(h.provider), h.region, image)
+            for h, image in zip(self.config.hosts, images)
+            if image
+        ]
+        self.write_to_logfile(
+            "tf_workdir",
+            json.dumps(
+                {
+                    "template": os.path.basename(workdir.template),
+                    "init_seconds": workdir.init_seconds,
+                    "overlay_seconds": workdir.overlay_seconds,
+                    "seconds_saved": workdir.seconds_saved,
+                    "images": images,
+                }
+            ),
+            "",
+        )
 
         tf_vars = os.path.abspath(os.path.join(self.tf_work_dir, "terraform.tfvars"))
-        self.tf = Terraform(
+        tf_kwargs = dict(
             working_dir=self.tf_work_dir,
             var_file=tf_vars,
             variables={
@@ -392,15 +1227,43 @@ class BenchmarkRunner(object):
                 "dst_zone": self.config.hosts[1].zone,
                 "uuid_partial": str(self.uuid).split("-")[-1],
                 "enable_private_networking": self.enable_private_networking,
+                "src_image": images[0],
+                "dst_image": images[-1],
             },
         )
-
-        self.tf.init()
-
-    def provision(self):
-        return_code, stdout, stderr = self.tf.apply(capture_output=True, skip_plan=True)
+        if uses_stub_terraform():
+            self.tf = SimulatedTerraform(providers, SIMULATION, **tf_kwargs)
+        else:
+            self.tf = BridgedTerraform(**tf_kwargs)
+
+    def provision(self, tfplan_filepath: str):
+        # apply exactly what was planned instead of planning all over again,
+        # terraform refuses -var/-var-file alongside a saved plan so drop them for this call
+        with self.phase("apply"):
+            return_code, stdout, stderr = self.tf.apply(
+                tfplan_filepath,
+                capture_output=True,
+                skip_plan=True,
+                var=None,
+                var_file=None,
+            )
         # stdout = [self.config_str, stdout]
         self.write_to_logfile("apply", stdout, stderr, print_logs=False)
+        if return_code != 0:
+            for outcome in get_region_catalog().learn_from_apply(f"{stdout}\n{stderr}"):
+                print(
+                    f"[{str(self.config)}] {outcome.provider} zone {outcome.zone} rejected {outcome.instance_type}, won't choose it again",
+                    flush=True,
+                )
+            for image in get_image_catalog().forget_missing(
+                f"{stdout}\n{stderr}", self.booted_images
+            ):
+                print(
+                    f"[{str(self.config)}] golden image {image.image_id} for {image.provider}+{image.region} failed, provisioning from scratch until it's baked again",
+                    flush=True,
+                )
+            # no point benchmarking a half-applied plan, the run (and its queue lease) failed
+            raise RuntimeError(f"terraform apply failed ({return_code})")
 
         # use copy2 to preserve original file metadata
         tfstate_filepath = os.path.join(
@@ -414,6 +1277,10 @@ class BenchmarkRunner(object):
         for target_type, config in self.tf.tfstate.outputs["benchmark_targets"][
             "value"
         ].items():
+            if config["provider"] == "null":
+                # a null-module node stands in for the combo's host
+                host = self.config.hosts[0 if target_type == "src" else -1]
+                config = {**config, "provider": str(host.provider)}
             self.targets.append(
                 BenchmarkTarget(
                     src_dst=target_type,
@@ -433,7 +1300,17 @@ class BenchmarkRunner(object):
         # so a recycled IP will have a different ssh public key fingerprint
         # do a reset for the IP and we should be good
         for target in self.targets:
-            target.ssh_keygen_reset()
+            with self.tracer.span(
+                "keygen_reset", direction=target.src_dst, provider=str(target.provider)
+            ):
+                target.ssh_keygen_reset()
+
+        # benchmarks start the moment both nodes are usable
+        self.set_phase("ready")
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(self.targets)
+        ) as executor:
+            list(executor.map(self.wait_until_ready, self.targets))
 
         # save the "who is who" data for easier parsing/debugging later
         self.write_to_logfile("targets", json.dumps(self.targets), "", print_logs=True)
@@ -441,77 +1318,216 @@ class BenchmarkRunner(object):
     def run_ssh_cmd_host(self, target: BenchmarkTarget, cmd: str):
         pass
 
+    def wait_until_ready(self, target: BenchmarkTarget):
+        with self.tracer.span(
+            "ready", direction=target.src_dst, provider=str(target.provider)
+        ):
+            if not target.wait_until_ready():
+                print(
+                    f"[{str(self.config)}] {target.src_dst} still not ready after {READINESS_TIMEOUT_SECONDS}s, going ahead anyway",
+                    flush=True,
+                )
+
     def run_demographics(self):
         try:
-            name_demo_cmds = {
-                "lshw": "sudo lshw -json",
-                "cpuid": "sudo cpuid -1",
-                "cpuinfo": "sudo cat /proc/cpuinfo",
-                "ifconfig": "sudo ifconfig",
-                "resolvectl": "sudo resolvectl status",
-            }
-            for name, cmd in name_demo_cmds.items():
-                for target in self.targets:
-                    (return_code, stdout, stderr) = target.run_ssh_cmd(cmd)
-                    self.write_to_logfile(f"{name}.{target.src_dst}", stdout, stderr)
+            # all targets at once, so the survey takes as long as the slowest host
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=len(self.targets)
+            ) as executor:
+                bundles = list(
+                    executor.map(
+                        functools.partial(
+                            collect_demographics,
+                            open_log=self.open_log,
+                            finish_log=self.finish_log,
+                        ),
+                        self.targets,
+                    )
+                )
+
+            # the outputs are already in their logs, this is just each command's exit status and timing
+            for bundle in bundles:
+                with open(
+                    os.path.join(
+                        self.benchmark_dir, f"demographics.{bundle['src_dst']}.json"
+                    ),
+                    "w",
+                    encoding="utf-8",
+                ) as fp:
+                    json.dump(bundle, fp)
         except Exception as ex:
             print(f"TODO: run_demographics - NEED TO TAKE CARE OF THIS EXCEPTION: {ex}")
 
-    def run_benchmarks(self):
-        return_code, stdout, stderr = run_ping(self.targets)
-        self.write_to_logfile("ping", stdout, stderr, print_logs=True)
-
-        if CloudProvider.AZURE.value in [t.provider for t in self.targets]:
-            self.write_to_logfile(
-                "traceroute.skip",
-                "Skipping traceroute because of Azure",
-                "stderr",
-                print_logs=True,
-            )
-        else:
-            return_code, stdout, stderr = run_traceroute(self.targets)
-            self.write_to_logfile("traceroute", stdout, stderr, print_logs=True)
-
-            return_code, stdout, stderr = run_traceroute(self.targets, use_icmp=True)
-            self.write_to_logfile("traceroute.icmp", stdout, stderr, print_logs=True)
-
-            if self.enable_private_networking:
-                return_code, stdout, stderr = run_traceroute(self.targets, private=True)
-                self.write_to_logfile(
-                    "traceroute.private", stdout, stderr, print_logs=True
-                )
-                return_code, stdout, stderr = run_traceroute(
-                    self.targets, use_icmp=True, private=True
-                )
+    def run_benchmark(self, benchmark: Benchmark):
+        log = self.open_log(benchmark.name, print_logs=True)
+        with self.tracer.span(benchmark.name):
+            try:
+                if benchmark.run is not None:
+                    benchmark.run(self.targets, log, tracer=self.tracer)
+                elif benchmark.scope == HOST:
+                    run_on_hosts(
+                        self.targets,
+                        benchmark.cmd,
+                        log,
+                        serial=True if benchmark.bandwidth else None,
+                        tracer=self.tracer,
+                    )
+                else:
+                    run_directions(
+                        self.targets,
+                        benchmark.cmd,
+                        log,
+                        serial=True if benchmark.bandwidth else None,
+                        echo_cmd=benchmark.echo_cmd,
+                        tracer=self.tracer,
+                    )
+            except Exception as ex:
+                log.section("error").write_stderr(str(ex))
+        # the run_* helpers log their own exceptions into an error section as well
+        if any(section.label == "error" for section in log.sections):
+            self.failed_benchmarks.append(benchmark.name)
+        self.finish_log(log)
+
+    def plan_benchmarks(self):
+        benchmarks = []
+        for benchmark in BENCHMARKS.select(BENCHMARK_SELECTION):
+            if benchmark.enabled is not None and not benchmark.enabled(self):
+                continue
+            reason = benchmark.skip(self) if benchmark.skip is not None else None
+            if reason is not None:
                 self.write_to_logfile(
-                    "traceroute.private.icmp", stdout, stderr, print_logs=True
+                    f"{benchmark.name}.skip", reason, "stderr", print_logs=True
                 )
+                continue
+            benchmarks.append(benchmark)
+        # latency probes and host-local benchmarks share stages, bandwidth tests get theirs to themselves
+        return BENCHMARKS.plan(benchmarks, concurrent=CONCURRENT_BENCHMARKS)
 
-        return_code, stdout, stderr = run_iperf(self.targets)
-        self.write_to_logfile("iperf", stdout, stderr, print_logs=True)
+    def run_benchmarks(self):
+        stages = self.plan_benchmarks()
+        print(
+            f"[{str(self.config)}] benchmark stages: {' | '.join(str(s) for s in stages)}",
+            flush=True,
+        )
+        run_stages(
+            stages,
+            self.run_benchmark,
+            on_stage=lambda stage: self.set_phase(f"benchmarks:{stage}"),
+        )
 
-        if self.enable_private_networking:
-            return_code, stdout, stderr = run_iperf(self.targets, private=True)
-            self.write_to_logfile("iperf.private", stdout, stderr, print_logs=True)
+    def close_ssh_sessions(self):
+        sessions = close_ssh_sessions([t.ssh_private_key for t in self.targets])
+        for session in sessions:
+            print(f"[{session.destination}] ssh: {session.stats_str()}", flush=True)
+        self.write_to_logfile(
+            "ssh_sessions",
+            json.dumps(
+                [
+                    {
+                        "destination": s.destination,
+                        "commands": s.commands,
+                        "handshakes": s.handshakes,
+                        "handshakes_avoided": s.handshakes_avoided,
+                        "failed_masters": s.failed_masters,
+                    }
+                    for s in sessions
+                ]
+            ),
+            "",
+        )
 
-        return_code, stdout, stderr = run_cryptsetup_benchmark(self.targets)
-        self.write_to_logfile("cryptsetup_benchmark", stdout, stderr, print_logs=True)
+    def destroy(self, attempt: int = 1) -> int:
+        # runs on the teardown pool, possibly a few times
+        with self.tracer.span("destroy", attempt=attempt):
+            return_code, stdout, stderr = self.tf.destroy(
+                capture_output=True, force=True
+            )
+        self.write_to_logfile(
+            "destroy" if attempt == 1 else f"destroy.{attempt}",
+            stdout,
+            stderr,
+            print_logs=False,
+        )
+        return return_code
+
+    def finish_teardown(self, destroyed: bool):
+        if destroyed:
+            # sometimes [WinError 145] The directory is not empty
+            # ignore errors and delete anyways
+            # Windows is dumb
+            try:
+                shutil.rmtree(self.tf_work_dir, ignore_errors=True)
+                dir_util.remove_tree(self.tf_work_dir)
+            except:
+                pass
+        else:
+            # the workdir holds the only state that knows about these resources
+            print(
+                f"[!] [{str(self.config)}] destroy gave up, keeping {self.tf_work_dir} for `teardown --retry`",
+                flush=True,
+            )
+
+        # destroy's log is the last one, the run dir is complete now
+        with self.tracer.span("pack"):
+            self.pack_artifacts()
 
     def cleanup(self):
-        return_code, stdout, stderr = self.tf.destroy(capture_output=True, force=True)
-        self.write_to_logfile("destroy", stdout, stderr, print_logs=False)
+        # drop the master connections before the nodes disappear underneath them
+        self.close_ssh_sessions()
+
+        if getattr(self, "tf", None) is None:
+            # never got as far as a terraform workdir, nothing to destroy
+            self.pack_artifacts()
+            return
+
+        # destroy (and pack) in the background so this worker can start its next combo
+        get_teardown_pool().hand_off(
+            str(self.uuid),
+            self.config_str,
+            self.tf_work_dir,
+            self.tf.var_file,
+            self.tf.variables,
+            self.destroy,
+            after=self.finish_teardown,
+        )
 
-        # sometimes [WinError 145] The directory is not empty
-        # ignore errors and delete anyways
-        # Windows is dumb
+    def record_in_manifest(self, started_at: float, status: str):
         try:
-            shutil.rmtree(self.tf_work_dir, ignore_errors=True)
-            dir_util.remove_tree(self.tf_work_dir)
-        except:
-            pass
+            CohortManifest(os.path.join("artifacts", COHORT)).record_run(
+                self.config_str,
+                str(self.uuid),
+                [name for name in self.logs_written if name in BENCHMARKS],
+                started_at,
+                time.time(),
+                status,
+            )
+        except Exception as ex:
+            print(f"[{str(self.config)}] failed to update manifest: {ex}", flush=True)
 
-    def run(self):
+    def pack_artifacts(self):
+        try:
+            stats = ArtifactStore(os.path.join("artifacts", COHORT)).pack_run(
+                self.benchmark_dir
+            )
+            print(
+                f"[{str(self.config)}] packed {stats.files} artifacts ({stats.shared} shared), "
+                f"{humanize.naturalsize(stats.bytes_before)} -> {humanize.naturalsize(stats.bytes_after)}",
+                flush=True,
+            )
+        except Exception as ex:
+            print(f"[{str(self.config)}] failed to pack artifacts: {ex}", flush=True)
+
+    def run(self) -> str:
+        # "ok" or "error", a failed apply or benchmark is reported here rather than raised
         start_all = time.perf_counter()
+        started_at = time.time()
+        # only ok once every benchmark got through, an interrupted run isn't recorded as complete
+        status = "error"
+        self.update_status(
+            "start",
+            self.config_str,
+            sorted(set(str(h.provider) for h in self.config.hosts)),
+        )
         # todo: add config values to
         try:
             # get terraform
@@ -524,30 +1540,41 @@ class BenchmarkRunner(object):
             self.benchmark_dir = os.path.join(
                 "artifacts",
                 COHORT,
-                self.config_str.replace("|", "_").replace(":", "-"),
+                combo_dirname(self.config_str),
                 str(self.uuid),
             )
             if not os.path.exists(self.benchmark_dir):
                 os.makedirs(self.benchmark_dir)
 
-            self.init_tf()
+            with self.phase("init_tf"):
+                self.init_tf()
 
             # tf cant handle tfplans in different dirs apparently
             tfplan_filepath = os.path.join(f"{self.uuid}.tfplan")
-            self.tf.plan(capture_output=False, out=tfplan_filepath)
-            shutil.move(
+            with self.phase("plan"):
+                self.tf.plan(capture_output=False, out=tfplan_filepath)
+            # keep a copy with the run, apply consumes the one in the workdir
+            shutil.copy2(
                 os.path.join(self.tf_work_dir, tfplan_filepath),
                 os.path.join(self.benchmark_dir, tfplan_filepath),
             )
 
             # provision
-            self.provision()
+            self.provision(tfplan_filepath)
 
             # do vm/hw survey
-            self.run_demographics()
+            with self.phase("demographics"):
+                self.run_demographics()
 
             # run benchmarks
             self.run_benchmarks()
+            if len(self.failed_benchmarks) > 0:
+                print(
+                    f"[{str(self.config)}] failed benchmarks: {', '.join(self.failed_benchmarks)}",
+                    flush=True,
+                )
+            else:
+                status = "ok"
 
             # run geekbench
             # for target in self.targets:
@@ -555,15 +1582,22 @@ class BenchmarkRunner(object):
             #     self.write_to_logfile(f'geekbench.{target.src_dst}', stdout, stderr, print_logs=True)
 
         except Exception as ex:
+            status = "error"
             print(
                 f"TODO: run - NEED TO TAKE CARE OF THIS EXCEPTION: {traceback.format_exc()}"
             )
 
         finally:
-            # cleanup
+            # the benchmarks are done (or not) at this point, destroy doesn't change that
+            self.record_in_manifest(started_at, status)
+
+            # hands destroy and packing off to the teardown pool
+            self.set_phase("teardown")
             self.cleanup()
+            self.update_status("finish", status)
 
             end_all = time.perf_counter()
+            self.tracer.emit("run", started_at, end_all - start_all, status, {})
             print(
                 f"[{str(self.config)}] ending {self.uuid} @ {datetime.now()}",
                 flush=True,
@@ -571,6 +1605,8 @@ class BenchmarkRunner(object):
             print(f"Total time: {end_all - start_all:0.4f} seconds")
             print(f"Total time: {humanize.naturaltime(end_all - start_all)}")
 
+        return status
+
 
 def decode_combo_str(combo: str) -> BenchmarkConfig:
     hosts = combo.split("_")
@@ -578,11 +1614,11 @@ def decode_combo_str(combo: str) -> BenchmarkConfig:
     for h in hosts:
         provider, region = h.split("+")
         zone_parts = region.split("[")
-        zone = choose_random_zone(provider, region)
-
         if len(zone_parts) > 1:
             region = zone_parts[0]
             zone = zone_parts[1].replace("]", "")
+        else:
+            zone = choose_random_zone(provider, region)
 
         parsed_hosts.append(
             BenchmarkHost(provider=CloudProvider(provider), region=region, zone=zone)
@@ -591,11 +1627,7 @@ def decode_combo_str(combo: str) -> BenchmarkConfig:
 
 
 def get_provider_regions(provider):
-    return list(
-        json.load(open(os.path.join("artifacts", "all_regions.json"), "r"))[
-            provider.value
-        ].keys()
-    )
+    return list(get_region_catalog().provider_regions(provider.value))
 
 
 def build_combos(provider, round_robin=True):
@@ -619,18 +1651,22 @@ def build_combos(provider, round_robin=True):
     return benchmarks_to_run
 
 
+def killswitch_engaged() -> bool:
+    return os.path.exists(".killswitch") and open(
+        ".killswitch", "r"
+    ).read().strip().lower() in ["1", "true", "y", "yes", "engaged"]
+
+
 def run_benchmark_str(benchmark_str) -> bool:
     print(f"{benchmark_str}")
-    if os.path.exists(".killswitch") and open(
-        ".killswitch", "r"
-    ).read().strip().lower() in ["1", "true", "y", "yes", "engaged"]:
+    if killswitch_engaged():
         print("killswitch activated, exiting", flush=True)
         return False
 
     start = time.perf_counter()
     try:
         runner = BenchmarkRunner(benchmark_str)
-        runner.run()
+        status = runner.run()
     except Exception as ex:
         print(f"OH FUCK OH FUCK OH FUCK: {runner.config}: {ex}")
         print(f"{traceback.format_exc()}")
@@ -638,82 +1674,816 @@ def run_benchmark_str(benchmark_str) -> bool:
     end = time.perf_counter()
     print(f"Benchmark time: {end - start:0.4f} seconds")
     print(f"Benchmark time: {humanize.naturaltime(end - start)}")
-    return True
+    # so the queue retries (and eventually dead-letters) failed runs instead of acking them
+    return status == "ok"
+
+
+def quota_limits(quotas, demands: List[Dict[str, int]]) -> Dict[str, int]:
+    limits = dict(quotas["providers"])
+    for demand in demands:
+        for key in demand:
+            if "+" in key and key not in limits:
+                # bare provider keys in "regions" are the default for every region of that provider
+                provider = key.split("+")[0]
+                limits[key] = quotas["regions"].get(
+                    key, quotas["regions"].get(provider)
+                )
+    return limits
+
+
+def combo_demand(config: BenchmarkConfig, quotas) -> Dict[str, int]:
+    # every host is one VM held against its provider's and its region's budget
+    demand = Counter()
+    for host in config.hosts:
+        provider = str(host.provider)
+        region_key = f"{provider}+{host.region}"
+        demand[provider] += 1
+        if region_key in quotas["regions"] or provider in quotas["regions"]:
+            demand[region_key] += 1
+    return dict(demand)
+
+
+# --status-port, the orchestrator serves /status (json) and /metrics (prometheus) while it runs
+STATUS_HOST = "127.0.0.1"
+STATUS_PORT = None
+
+
+def set_status_address(host: str, port: int):
+    global STATUS_HOST, STATUS_PORT
+    STATUS_HOST = host
+    STATUS_PORT = port
+
+
+def start_status_server(queue_depth, workers: int) -> StatusServer:
+    if STATUS_PORT is None:
+        return None
+    # its own connections, the pool workers fork off this process and must not share them
+    cohort_dir = os.path.join("artifacts", COHORT)
+    app = build_status_app(
+        COHORT,
+        RunStatusBoard(cohort_dir),
+        PhaseHistograms(os.path.join(TRACES_DIR, COHORT)),
+        queue_depth,
+        workers,
+        TeardownLedger(cohort_dir).stats,
+    )
+    server = StatusServer(app, STATUS_HOST, STATUS_PORT).start()
+    print(f"[*] Status at {server.url}/status and {server.url}/metrics", flush=True)
+    return server
+
+
+def stop_status_server(server: StatusServer):
+    if server is not None:
+        server.stop()
+
+
+def teardown_holds(quota_file=None, poll_seconds: float = HELD_POLL_SECONDS):
+    # a run's VMs stay alive until the teardown pool's destroy finishes, long after the run itself returned,
+    # so every destroy still pending counts against the same quotas as a run in flight
+    # only teardowns handed off from now on, pending rows of an orchestrator that died would never clear
+    # (leaked ones are left to `teardown --retry` for the same reason)
+    quotas = load_quotas(quota_file if quota_file is not None else QUOTA_FILE)
+    ledger = TeardownLedger(os.path.join("artifacts", COHORT))
+    since = time.time()
+    if SIMULATION is not None:
+        poll_seconds *= SIMULATION.time_scale
+
+    def held() -> Counter:
+        demand = Counter()
+        for teardown in ledger.teardowns(["pending"]):
+            if teardown.handed_off_at < since:
+                continue
+            # a bake's nodes count the same as a run's
+            combo = teardown.combo
+            if combo.startswith(BAKE_COMBO_PREFIX):
+                combo = combo[len(BAKE_COMBO_PREFIX) :]
+            hosts = []
+            try:
+                for h in combo.split("_"):
+                    provider, region = h.split("+")
+                    region = region.split("[")[0]
+                    hosts.append(BenchmarkHost(CloudProvider(provider), region))
+            except ValueError:
+                # whatever else shares the ledger, it's no reason to stop dispatching
+                continue
+            demand.update(combo_demand(BenchmarkConfig(hosts=hosts), quotas))
+        return demand
+
+    return held, poll_seconds
+
+
+def schedule_benchmark_strs(benchmark_strs, quota_file=None):
+    quotas = load_quotas(quota_file if quota_file is not None else QUOTA_FILE)
+
+    items = []
+    for i, benchmark_str in enumerate(benchmark_strs):
+        config = decode_combo_str(benchmark_str)
+        items.append(
+            ScheduledItem(
+                index=i,
+                item=benchmark_str,
+                demand=combo_demand(config, quotas),
+                group=tuple(sorted(str(h.provider) for h in config.hosts)),
+            )
+        )
+
+    return items, quota_limits(quotas, [item.demand for item in items])
+
 
+def report_orchestrator_memory(sampler: MemorySampler):
+    report = sampler.report()
+    print_memory_report(report)
+    record_memory_report(report, os.path.join("artifacts", COHORT, MEMORY_REPORT_FILE))
+
+
+def print_dispatch_prediction(
+    model: DurationModel,
+    dispatched: List[RunEstimate],
+    dropped: List[RunEstimate],
+    makespan: float,
+    given_makespan: float,
+    workers: int,
+    order: str,
+):
+    basis = estimate_basis_counts(dispatched)
+    print(
+        f"[*] Duration model: {model.runs} past runs, estimates by "
+        + ", ".join(f"{level} {count}" for level, count in sorted(basis.items())),
+        flush=True,
+    )
+    vm_cost = sum(e.vm_cost for e in dispatched)
+    egress_cost = sum(e.egress_cost for e in dispatched)
+    compared = (
+        f", as given {humanize.naturaldelta(given_makespan)}"
+        if given_makespan is not None
+        else ""
+    )
+    print(
+        f"[*] Predicted: {len(dispatched)} runs in {humanize.naturaldelta(makespan)} on {workers} workers "
+        f"({'as given' if order == 'given' else order + ' first'}{compared}), done around {datetime.fromtimestamp(time.time() + makespan):%Y-%m-%d %H:%M}, "
+        f"${vm_cost + egress_cost:,.2f} (${vm_cost:,.2f} VMs, ${egress_cost:,.2f} egress)",
+        flush=True,
+    )
+    if len(dropped) > 0:
+        print(
+            f"[!] Over budget, leaving out {len(dropped)} runs (${sum(e.cost for e in dropped):,.2f})",
+            flush=True,
+        )
+
+
+def plan_dispatch(
+    benchmark_strs, workers: int, quota_file=None, order="longest", budget=None
+) -> List[str]:
+    # estimate every combo from past runs, order (and trim to the budget) and predict the cohort
+    model = DurationModel.from_history(TRACES_DIR, RESULTS_DIR)
+    estimates = [model.estimate(s) for s in benchmark_strs]
+    dispatched, dropped = order_estimates(estimates, order, budget)
+
+    def predict(estimates: List[RunEstimate]) -> float:
+        items, limits = schedule_benchmark_strs(
+            [e.combo for e in estimates], quota_file
+        )
+        return QuotaScheduler(limits).simulate(
+            items, [e.seconds for e in estimates], workers
+        )
+
+    makespan = predict(dispatched)
+    given_makespan = None
+    if order != "given" and len(dropped) == 0:
+        given_makespan = predict(estimates)
+    print_dispatch_prediction(
+        model, dispatched, dropped, makespan, given_makespan, workers, order
+    )
+    return [e.combo for e in dispatched]
+
+
+def run_benchmark_strs_parallel(
+    benchmark_strs,
+    workers=8,
+    quota_file=None,
+    use_asyncio=False,
+    order="longest",
+    budget=None,
+    dry_run=False,
+):
+    benchmark_strs = plan_dispatch(benchmark_strs, workers, quota_file, order, budget)
+    if dry_run:
+        return
+    if use_asyncio:
+        run_benchmark_strs_async(benchmark_strs, workers=workers, quota_file=quota_file)
+        return
 
-def run_benchmark_strs_parallel(benchmark_strs, workers=8):
     freeze_support()
     print(
         f"Starting processing of {len(benchmark_strs)} regions with {workers} workers"
     )
+    items, limits = schedule_benchmark_strs(benchmark_strs, quota_file)
+    # the workers' teardown pools keep destroying after run_benchmark_str returned
+    held, poll_seconds = teardown_holds(quota_file)
+    scheduler = QuotaScheduler(limits, held=held, poll_seconds=poll_seconds)
+    scheduler.queued = len(items)
+    status_server = start_status_server(lambda: scheduler.queued, workers)
+
     start = time.perf_counter()
-    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
-        r = list(
-            tqdm(
-                executor.map(run_benchmark_str, benchmark_strs),
-                total=len(benchmark_strs),
-            )
-        )
+    # pass the flag along explicitly, spawned (non-fork) workers won't inherit module state
+    try:
+        with MemorySampler("process-pool", lambda: scheduler.in_flight) as sampler:
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=set_worker_options,
+                initargs=(
+                    CONCURRENT_BENCHMARKS,
+                    USE_IMAGE_CACHE,
+                    IPERF_SETTINGS,
+                    BENCHMARK_SELECTION,
+                    SIMULATION,
+                ),
+            ) as executor:
+                scheduler.run(executor, run_benchmark_str, items, max_in_flight=workers)
+            # the workers only exit once their teardown pools drained
+    finally:
+        stop_status_server(status_server)
     end = time.perf_counter()
     print(f"Total time: {end - start:0.4f} seconds")
     print(f"Total time: {humanize.naturaltime(end - start)}")
+    report_orchestrator_memory(sampler)
+    print_teardown_stats(TeardownLedger(os.path.join("artifacts", COHORT)))
+
+
+async def run_benchmark_strs_on_loop(
+    items, limits, workers: int, quota_file=None
+) -> MemorySampler:
+    loop = asyncio.get_running_loop()
+    set_subprocess_bridge(SubprocessBridge(loop))
+
+    # a run is a thread that mostly sits waiting on the loop for its terraform/ssh children,
+    # the per-process singletons are shared by all of them so build them before they race to
+    global TEARDOWN_POOL_WORKERS
+    TEARDOWN_POOL_WORKERS = workers
+    get_region_catalog()
+    get_image_catalog()
+    get_tf_workdir_factory(os.path.abspath("terraform"))
+    teardown_pool = get_teardown_pool()
+
+    runs = concurrent.futures.ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="run"
+    )
 
+    async def run_one(benchmark_str):
+        return await loop.run_in_executor(runs, run_benchmark_str, benchmark_str)
+
+    # with as many destroy threads as runs, up to twice the quota would be alive without counting them
+    held, poll_seconds = teardown_holds(quota_file)
+    scheduler = QuotaScheduler(limits, held=held, poll_seconds=poll_seconds)
+    scheduler.queued = len(items)
+    status_server = start_status_server(lambda: scheduler.queued, workers)
+    try:
+        with MemorySampler("asyncio", lambda: scheduler.in_flight) as sampler:
+            await scheduler.run_async(run_one, items, max_in_flight=workers)
+            # the destroys still need the loop for their terraform processes
+            await loop.run_in_executor(None, teardown_pool.drain)
+    finally:
+        runs.shutdown(wait=True)
+        set_subprocess_bridge(None)
+        stop_status_server(status_server)
+    return sampler
+
+
+def run_benchmark_strs_async(benchmark_strs, workers=8, quota_file=None):
+    # one process for every in-flight run instead of a python interpreter each,
+    # --workers is then just how many runs are in flight (quotas still apply)
+    print(
+        f"Starting processing of {len(benchmark_strs)} regions with {workers} in-flight runs on one event loop"
+    )
+    items, limits = schedule_benchmark_strs(benchmark_strs, quota_file)
 
-def do_queue_processing(combos):
-    combo_queue = queue.Queue()
-    for combo in combos:
-        combo_queue.put(combo)
-    print(f"Total benchmarking combos: {combo_queue.qsize()}")
     start = time.perf_counter()
-    run = not combo_queue.empty()
+    sampler = asyncio.run(
+        run_benchmark_strs_on_loop(items, limits, workers, quota_file)
+    )
+    end = time.perf_counter()
+    print(f"Total time: {end - start:0.4f} seconds")
+    print(f"Total time: {humanize.naturaltime(end - start)}")
+    report_orchestrator_memory(sampler)
+    print_teardown_stats(TeardownLedger(os.path.join("artifacts", COHORT)))
+
+
+QUEUE_POLL_SECONDS = 30
+
+
+def process_work_queue(work_queue: WorkQueue, workers=1):
+    # quotas aren't enforced here, with several orchestrators sharing one account no single
+    # process knows the account-wide usage
+    freeze_support()
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"[*] {owner} processing queue with {workers} workers")
+    start = time.perf_counter()
     queue_runs = 0
-    while run:
-        combo = combo_queue.get()
-        queue_runs += 1
-        if combo is None:
-            exit()
-        print(f"[{queue_runs}: {combo}")
-        resp = run_benchmark_str(combo)
-        if resp:
-            combo_queue.task_done()
-        else:
-            combo_queue.put(combo)
-        run = not combo_queue.empty()
+    in_flight = {}
+    accepting = True
+    # the queue's own connection belongs to this loop, the status server gets the last poll's depth
+    queue_depth = [work_queue.outstanding()]
+    status_server = start_status_server(lambda: queue_depth[0], workers)
+    sampler = MemorySampler("queue", lambda: len(in_flight))
+    with sampler, concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=set_worker_options,
+        initargs=(
+            CONCURRENT_BENCHMARKS,
+            USE_IMAGE_CACHE,
+            IPERF_SETTINGS,
+            BENCHMARK_SELECTION,
+            SIMULATION,
+        ),
+    ) as executor:
+        while accepting or len(in_flight) > 0:
+            if accepting and killswitch_engaged():
+                # stop leasing new combos but let the in-flight runs finish and report
+                print("killswitch activated, draining", flush=True)
+                accepting = False
+
+            while accepting and len(in_flight) < workers:
+                lease = work_queue.lease(owner)
+                if lease is None:
+                    break
+                queue_runs += 1
+                print(f"[{queue_runs}: {lease.combo} (attempt {lease.attempt})")
+                in_flight[executor.submit(run_benchmark_str, lease.combo)] = lease
+
+            if len(in_flight) == 0:
+                if not accepting or work_queue.outstanding() == 0:
+                    break
+                # everything left is backing off or leased by another orchestrator
+                time.sleep(QUEUE_POLL_SECONDS)
+                continue
+
+            done, _ = concurrent.futures.wait(
+                list(in_flight.keys()),
+                timeout=QUEUE_POLL_SECONDS,
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                lease = in_flight.pop(future)
+                try:
+                    error = "" if future.result() else "run_benchmark_str failed"
+                except Exception as ex:
+                    error = str(ex)
+                if error == "":
+                    work_queue.complete(lease)
+                else:
+                    work_queue.fail(lease, error)
+
+            # keep our leases alive so other orchestrators don't steal long (azure) runs
+            for lease in in_flight.values():
+                work_queue.heartbeat(lease)
+            if status_server is not None:
+                queue_depth[0] = work_queue.outstanding()
+
+    stop_status_server(status_server)
+
     end = time.perf_counter()
     print(f"Total queue time: {end - start:0.4f} seconds")
     print(f"Total queue time: {humanize.naturaltime(end - start)}")
-    pprint(combos)
-    run_benchmark_str(combos[0])
-
-
-def run_unfinished_cohort():
-    combo_dirs = glob.glob(os.path.join("artifacts", COHORT, "*"))
-    invalid_runs = []
-    for combo_dir in combo_dirs:
-        has_valid_run = False
-        benchmark_config = decode_combo_str(os.path.basename(combo_dir))
-        for dir in sorted(
-            glob.glob(os.path.join(combo_dir, "*")), key=os.path.getmtime
-        ):
-            if os.path.exists(os.path.join(dir, "iperf.stdout.log")):
-                has_valid_run = True
-                break
-        if not has_valid_run:
-            invalid_runs.append(str(benchmark_config))
+    report_orchestrator_memory(sampler)
+    print_queue_stats(work_queue)
+    print_teardown_stats(TeardownLedger(os.path.join("artifacts", COHORT)))
+
+
+def do_queue_processing(combos, work_queue: WorkQueue = None, workers=1):
+    if work_queue is None:
+        work_queue = SQLiteWorkQueue(os.path.join("artifacts", COHORT, "queue.sqlite"))
+    added = work_queue.put(combos)
+    print(f"Total benchmarking combos: {len(combos)} ({added} new)")
+    process_work_queue(work_queue, workers=workers)
+
+
+def get_cohort_manifest(backfill: bool = True) -> CohortManifest:
+    manifest = CohortManifest(os.path.join("artifacts", COHORT))
+    if backfill and manifest.is_empty():
+        # cohorts from before the manifest existed need one walk of the artifacts
+        print(f"[*] Backfilled {manifest.backfill()} runs into {manifest.path}")
+    return manifest
+
+
+def run_unfinished_cohort(max_age_days=None, combos=None, workers=8):
+    invalid_runs = get_cohort_manifest().combos_needing_run(
+        combos=combos, max_age_days=max_age_days
+    )
     print(f"[*] Missing {len(invalid_runs)} runs from {COHORT}")
-    run_benchmark_strs_parallel(invalid_runs, workers=8)
+    run_benchmark_strs_parallel(invalid_runs, workers=workers)
 
 
-def direct(args):
+def refresh(args):
+    set_status_address(args.status_host, args.status_port)
+    # a rebuild walks the artifacts anyway, don't backfill an empty manifest first
+    manifest = get_cohort_manifest(backfill=not args.rebuild)
+    if args.rebuild:
+        print(f"[*] Rebuilt manifest from {manifest.rebuild()} runs")
+
+    combos = None
     if args.combo_file is not None:
         combos = [
             combo.strip()
             for combo in open(os.path.abspath(args.combo_file), "r").read().split()
         ]
+    needing_run = manifest.combos_needing_run(
+        combos=combos, max_age_days=args.max_age_days
+    )
+    print(
+        f"[*] {len(needing_run)} combos in {COHORT} are missing"
+        + (f" or older than {args.max_age_days} days" if args.max_age_days else "")
+    )
+    if args.run:
+        run_benchmark_strs_parallel(
+            needing_run,
+            workers=args.workers,
+            quota_file=args.quota_file,
+            use_asyncio=args.use_asyncio,
+            order=args.order,
+            budget=args.budget,
+            dry_run=args.dry_run,
+        )
     else:
+        print("\n".join(needing_run))
+
+
+def direct(args):
+    set_concurrent_benchmarks(not args.serial_benchmarks)
+    set_image_cache(not args.no_image_cache)
+    set_status_address(args.status_host, args.status_port)
+    if args.simulate:
+        set_simulation(
+            load_simulation_settings(
+                args.sim_config,
+                time_scale=args.sim_time_scale,
+                terraform=args.sim_terraform,
+            )
+        )
+        print(
+            f"[*] Simulating with {SIMULATION.terraform} terraform at {SIMULATION.time_scale:g}x into {COHORT}",
+            flush=True,
+        )
+    if args.benchmarks is not None:
+        # fail on a typo before any VM is up
+        BENCHMARKS.select(args.benchmarks)
+    set_benchmark_selection(args.benchmarks)
+    set_iperf_settings(
+        IPERF_SETTINGS._replace(
+            adaptive=args.iperf_adaptive,
+            tolerance=args.iperf_tolerance,
+            min_seconds=args.iperf_min_seconds,
+            max_seconds=args.iperf_max_seconds,
+            parallel=tuple(args.iperf_parallel),
+        )
+    )
+
+    if args.combo_file is not None:
+        combos = [
+            combo.strip()
+            for combo in open(os.path.abspath(args.combo_file), "r").read().split()
+        ]
+    elif args.combos is not None:
         combos = args.combos
+    else:
+        combos = []
+
+    if args.queue is not None:
+        # orchestrators joining an existing cohort can skip the combos and just pull
+        do_queue_processing(
+            combos, open_work_queue(args.queue, COHORT), workers=args.workers
+        )
+        return
+
+    run_benchmark_strs_parallel(
+        combos,
+        workers=args.workers,
+        quota_file=args.quota_file,
+        use_asyncio=args.use_asyncio,
+        order=args.order,
+        budget=args.budget,
+        dry_run=args.dry_run,
+    )
+
+
+def ingest_results(args):
+    # backfill the result store from an existing artifacts tree
+    cohort_dir = os.path.join("artifacts", COHORT)
+    if not os.path.isdir(cohort_dir):
+        print(f"[*] No runs in {cohort_dir} to ingest")
+        return
+    run_dirs = [path for _, _, path in list_runs(cohort_dir)]
+    store_root = os.path.join(RESULTS_DIR, COHORT)
+    print(f"[*] Ingesting {len(run_dirs)} runs from {cohort_dir} into {store_root}")
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+        records = sum(
+            tqdm(
+                executor.map(
+                    ingest_run_dir,
+                    [(store_root, COHORT, d) for d in run_dirs],
+                    chunksize=64,
+                ),
+                total=len(run_dirs),
+            )
+        )
+    end = time.perf_counter()
+    print(f"[*] Ingested {humanize.intcomma(records)} records")
+    print(f"Total time: {end - start:0.4f} seconds")
+
+
+def pack_artifacts(args):
+    # migrate unpacked run dirs into per-run archives + shared blobs
+    cohort_dir = os.path.join("artifacts", COHORT)
+    # create the blob db before the workers race to
+    ArtifactStore(cohort_dir)
+    run_dirs = [path for _, _, path in list_runs(cohort_dir) if os.path.isdir(path)]
+    before = print_disk_usage("before", cohort_dir)
+    print(f"[*] Packing {len(run_dirs)} runs in {cohort_dir}")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+        stats = list(
+            tqdm(
+                executor.map(
+                    pack_run_dir,
+                    [(cohort_dir, d) for d in run_dirs],
+                    chunksize=16,
+                ),
+                total=len(run_dirs),
+            )
+        )
+    after = print_disk_usage("after", cohort_dir)
+    print(
+        f"[*] {sum(s.shared for s in stats)} of {sum(s.files for s in stats)} files deduplicated, "
+        f"{humanize.naturalsize(before['bytes'])} -> {humanize.naturalsize(after['bytes'])}"
+    )
+
+
+def trace_summary(args):
+    trace_dir = os.path.join(TRACES_DIR, COHORT)
+    spans = load_spans(trace_dir)
+    if args.phases:
+        spans = (s for s in spans if s["name"] in args.phases)
+    summary = summarize_spans(spans)
+    if args.json:
+        json.dump(
+            [
+                {"phase": name, "provider": provider, **stats}
+                for (name, provider), stats in summary.items()
+            ],
+            sys.stdout,
+            indent=2,
+        )
+        print()
+    else:
+        print(f"[*] {trace_dir}")
+        print_span_summary(summary)
+
+
+def teardown(args):
+    # leaked (or orphaned pending) workdirs, optionally destroyed again from here
+    ledger = TeardownLedger(os.path.join("artifacts", COHORT))
+    needing_destroy = ledger.needing_destroy(args.stale_minutes * 60)
+    for t in needing_destroy:
+        error = t.last_error.strip().splitlines()[-1] if t.last_error.strip() else ""
+        print(
+            f"[{t.state}] {t.combo} {t.uuid} {t.tf_work_dir} ({t.attempts} attempts, {t.owner}) {error}"
+        )
+
+    if args.retry:
+        for t in needing_destroy:
+            if not os.path.exists(t.tf_work_dir):
+                print(
+                    f"[!] {t.tf_work_dir} is gone, clean up {t.combo} {t.uuid} by hand"
+                )
+                continue
+            tf = Terraform(
+                working_dir=t.tf_work_dir, var_file=t.var_file, variables=t.variables
+            )
+
+            def destroy(attempt):
+                return_code, stdout, stderr = tf.destroy(
+                    capture_output=True, force=True
+                )
+                return return_code
+
+            if destroy_with_retries(ledger, t.uuid, destroy):
+                shutil.rmtree(t.tf_work_dir, ignore_errors=True)
+                print(f"[*] destroyed {t.combo} {t.uuid}")
+            else:
+                print(f"[!] still can't destroy {t.combo} {t.uuid}")
+    print_teardown_stats(ledger)
+
+
+# teardown ledger combos of bake-images runs, "bake <src>_<dst>" with both nodes like a run's combo
+BAKE_COMBO_PREFIX = "bake "
+
+
+def bake_image_pair(pair) -> List[BakedImage]:
+    # one throwaway run per pair of regions: provision both nodes from scratch, snapshot them,
+    # keep the snapshots and destroy the nodes
+    src, dst = pair
+    bake_uuid = str(uuid.uuid4())
+    tf_dir = os.path.abspath("terraform")
+    workdir = get_tf_workdir_factory(tf_dir).create(
+        os.path.join(".tfworkdir", "images", bake_uuid), [src[0], dst[0]]
+    )
+    tf = Terraform(
+        working_dir=workdir.path,
+        var_file=os.path.abspath(os.path.join(workdir.path, "terraform.tfvars")),
+        variables={
+            "src_region": src[1],
+            "dst_region": dst[1],
+            "src_zone": get_region_catalog().choose_zone(*src),
+            "dst_zone": get_region_catalog().choose_zone(*dst),
+            "uuid_partial": bake_uuid.split("-")[-1],
+            "enable_private_networking": False,
+            "bake_images": True,
+        },
+    )
+    ledger = TeardownLedger(os.path.join("artifacts", COHORT))
+    ledger.add(
+        bake_uuid,
+        f"{BAKE_COMBO_PREFIX}{src[0]}+{src[1]}_{dst[0]}+{dst[1]}",
+        workdir.path,
+        tf.var_file,
+        tf.variables,
+    )
+    try:
+        return_code, stdout, stderr = tf.apply(capture_output=True, skip_plan=True)
+        if return_code != 0:
+            get_region_catalog().learn_from_apply(f"{stdout}\n{stderr}")
+            raise Exception(f"terraform apply failed: {stderr}")
+        baked = tf.tfstate.outputs["baked_images"]["value"]
+        images = [BakedImage(src[0], src[1], baked["src"])]
+        if dst != src:
+            images.append(BakedImage(dst[0], dst[1], baked["dst"]))
+        images = [image for image in images if image.image_id != ""]
+        keep_golden_images(tf)
+        get_image_catalog().record(images)
+        return images
+    finally:
+
+        def destroy(attempt):
+            return_code, stdout, stderr = tf.destroy(capture_output=True, force=True)
+            return return_code
+
+        if destroy_with_retries(ledger, bake_uuid, destroy):
+            shutil.rmtree(workdir.path, ignore_errors=True)
+        else:
+            print(
+                f"[!] bake {src} {dst} left resources behind in {workdir.path}, see `teardown --retry`",
+                flush=True,
+            )
+
+
+def bake_images(args):
+    fix_line_endings(PROVISION_SCRIPT)
+    providers = args.providers if args.providers else BAKEABLE_PROVIDERS
+    if args.regions:
+        regions = [tuple(r.split("+")) for r in args.regions]
+    else:
+        regions = [
+            (provider, region)
+            for provider in providers
+            for region in get_provider_regions(CloudProvider(provider))
+        ]
+    regions = [r for r in regions if r[0] in BAKEABLE_PROVIDERS]
+    if not args.force:
+        regions = get_image_catalog().missing(regions)
+
+    pairs = bake_pairs(regions)
+    print(
+        f"[*] Baking {len(regions)} golden images ({get_image_catalog().script_hash}) in {len(pairs)} runs"
+    )
+    baked = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(bake_image_pair, pair): pair for pair in pairs}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                for image in future.result():
+                    print(f"[*] {image.provider}+{image.region}: {image.image_id}")
+                    baked.append(image)
+            except Exception as ex:
+                print(f"[!] baking {futures[future]} failed: {ex}", flush=True)
+    print(f"[*] Baked {len(baked)} of {len(regions)} golden images")
+
+
+def pivot(args):
+    # fold any newly landed runs into the persisted matrices, then render
+    store = ResultStore(os.path.join(RESULTS_DIR, COHORT))
+    engine_path = os.path.join(store.root, "pivot.npz")
+    os.makedirs(store.root, exist_ok=True)
+    engine = PivotEngine.load(engine_path)
+    print(
+        f"[*] Folded {engine.update_from_store(store)} new result shards into {engine_path}"
+    )
+    engine.save(engine_path)
+
+    coordinates = None
+    if args.coordinates is not None:
+        with open(args.coordinates, "r") as fp:
+            coordinates = {r: tuple(c) for r, c in json.load(fp).items()}
+
+    for metric in args.metrics:
+        ordering = "geographic" if args.by_geography else "alphabetical"
+        out_path = os.path.join(store.root, f"pivot.{metric}.{ordering}.html")
+        render_pivot_html(
+            engine,
+            metric,
+            out_path,
+            by_geography=args.by_geography,
+            coordinates=coordinates,
+        )
+        print(f"[*] Wrote {out_path}")
+
+
+def clear_simulated_cohort(cohort: str):
+    if not is_simulated_cohort(cohort):
+        raise ValueError(f"{cohort} isn't a simulated cohort, not clearing it")
+    for root in [os.path.join("artifacts"), TRACES_DIR, RESULTS_DIR]:
+        shutil.rmtree(os.path.join(root, cohort), ignore_errors=True)
+
+
+def bench_result(mode: str, combos: int, workers: int, wall_seconds: float) -> Dict:
+    latencies = run_latencies(load_spans(os.path.join(TRACES_DIR, COHORT)))
+    memory = {}
+    memory_report_file = os.path.join("artifacts", COHORT, MEMORY_REPORT_FILE)
+    if os.path.exists(memory_report_file):
+        with open(memory_report_file, "r") as fp:
+            memory = json.loads(fp.read().splitlines()[-1])
+    return {
+        "mode": mode,
+        "combos": combos,
+        "workers": workers,
+        "time_scale": SIMULATION.time_scale,
+        "terraform": SIMULATION.terraform,
+        "at": time.time(),
+        "wall_seconds": wall_seconds,
+        "runs_per_minute": latencies["runs"] / wall_seconds * 60.0,
+        # how busy the run slots were, what's missing went to dispatch, quotas and the orchestrator itself
+        "slot_utilization": latencies.get("total_seconds", 0.0)
+        / (wall_seconds * workers),
+        **{f"run_{k}": v for k, v in latencies.items()},
+        "per_run_bytes": memory.get("per_run_bytes"),
+        "peak_python_bytes": memory.get("peak_python_bytes"),
+        "peak_other_bytes": memory.get("peak_other_bytes"),
+    }
+
+
+def print_bench_results(results: List[Dict]):
+    print(
+        f"{'mode':<14} {'combos':>7} {'workers':>7} {'runs/min':>9} {'slots':>6} {'errors':>6} "
+        f"{'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'per run':>10} {'peak':>10}"
+    )
+    for r in results:
+        per_run = r["per_run_bytes"]
+        peak = r["peak_python_bytes"]
+        print(
+            f"{r['mode']:<14} {r['combos']:>7} {r['workers']:>7} {r['runs_per_minute']:>9.1f} "
+            f"{100.0 * r['slot_utilization']:>5.0f}% {r['run_errors']:>6} "
+            f"{r.get('run_p50', 0.0):>7.2f}s {r.get('run_p95', 0.0):>7.2f}s "
+            f"{r.get('run_p99', 0.0):>7.2f}s {r.get('run_max', 0.0):>7.2f}s "
+            f"{humanize.naturalsize(per_run) if per_run is not None else '-':>10} "
+            f"{humanize.naturalsize(peak) if peak else '-':>10}"
+        )
+
+
+def sim_bench(args):
+    # every mode through the same simulated cohorts, one fresh cohort per size and mode
+    settings = load_simulation_settings(
+        args.sim_config, time_scale=args.sim_time_scale, terraform=args.sim_terraform
+    )
+    providers = args.providers if args.providers else [p.value for p in CloudProvider]
+    results = []
+    for size in args.sizes:
+        combos = simulated_combos(size, providers, seed=args.seed)
+        for mode in args.modes:
+            set_simulation(settings._replace(cohort=f"{settings.cohort}-{mode}-{size}"))
+            clear_simulated_cohort(COHORT)
+            print(
+                f"[*] sim-bench: {size} combos through {mode} with {args.workers} workers into {COHORT}",
+                flush=True,
+            )
+            start = time.perf_counter()
+            if mode == "queue":
+                do_queue_processing(combos, workers=args.workers)
+            else:
+                run_benchmark_strs_parallel(
+                    combos,
+                    workers=args.workers,
+                    quota_file=args.quota_file,
+                    use_asyncio=mode == "asyncio",
+                )
+            result = bench_result(mode, size, args.workers, time.perf_counter() - start)
+            record_bench_result(result)
+            results.append(result)
+            if not args.keep_artifacts:
+                clear_simulated_cohort(COHORT)
+    print(f"[*] {BENCH_REPORT_FILE}")
+    print_bench_results(results)
+
 
-    run_benchmark_strs_parallel(combos, workers=args.workers)
+def queue_stats(args):
+    print_queue_stats(open_work_queue(args.queue, COHORT))
 
 
 def proxy(args):
@@ -725,36 +2495,132 @@ def generate_combos(args):
     if args.providers is None or len(args.providers) == 0:
         args.providers = [p.value for p in CloudProvider]
 
-    # grab all regions and cache which provider they belong to
-    regions = {}
-    for provider in args.providers:
-        for provider_region in get_provider_regions(CloudProvider(provider)):
-            regions[provider_region] = provider
-
-    # build out the combinations of regions
-    combos = []
-    combos.extend(zip(regions.keys(), regions.keys()))
-    if not args.skip_round_robin:
-        combos.extend(list(itertools.combinations(regions.keys(), 2)))
+    regions = [
+        (provider, provider_region)
+        for provider in args.providers
+        for provider_region in get_provider_regions(CloudProvider(provider))
+    ]
 
-    # parse into benchmark config strings
-    benchmarks_to_run = []
-    for combo in combos:
-        benchmarks_to_run.append(
-            str(
-                BenchmarkConfig(
-                    hosts=[
-                        BenchmarkHost(provider=regions[combo[0]], region=combo[0]),
-                        BenchmarkHost(provider=regions[combo[1]], region=combo[1]),
-                    ]
-                )
-            )
+    # lazily built, filtered and sharded, only one combo is ever held at a time
+    pairs = iter_pairs(
+        regions,
+        round_robin=not args.skip_round_robin,
+        provider_pairs=(
+            parse_provider_pairs(args.provider_pairs) if args.provider_pairs else None
+        ),
+        continents=set(args.continents) if args.continents else None,
+        region_continents=(
+            load_region_continents(args.continent_file) if args.continents else None
+        ),
+    )
+    if args.sample is not None:
+        # sampling needs the whole (filtered) pair list, sharding still applies to the sample
+        with open(args.coordinates, "r") as fp:
+            coordinates = {r: tuple(c) for r, c in json.load(fp).items()}
+        pairs, report = sample_pairs(pairs, coordinates, args.sample, seed=args.seed)
+        # keep stdout clean for the combos themselves
+        print_coverage_report(
+            report, sys.stderr if args.queue is None and args.out is None else None
         )
+        if args.report is not None:
+            with open(args.report, "w") as fp:
+                json.dump(report, fp, indent=2)
+    combos = iter_combos(pairs, shard=args.shard)
+
+    if args.queue is not None:
+        added = put_combos(combos, open_work_queue(args.queue, COHORT))
+        print(f"[*] Queued {added} new combos on {args.queue}")
+    elif args.out is not None:
+        with open(args.out, "w") as fp:
+            written = write_combos(combos, fp)
+        print(f"[*] Wrote {written} combos to {args.out}")
+    else:
+        # dump to screen
+        write_combos(combos, sys.stdout)
 
-    # dump to screen
-    print("\n".join(benchmarks_to_run))
 
-    return benchmarks_to_run
+def add_simulation_arguments(subparser):
+    subparser.add_argument(
+        "--simulate",
+        action="store_true",
+        default=False,
+        help="no cloud accounts needed: terraform is stubbed (or runs the null module), every ssh command "
+        "replays a recorded output, and the runs go to a cohort of their own",
+    )
+    subparser.add_argument(
+        "--sim-config",
+        dest="sim_config",
+        default=SIMULATION_FILE,
+        help="json of latencies, provider_latencies and failure_rates over the defaults in simulation.py",
+    )
+    subparser.add_argument(
+        "--sim-time-scale",
+        dest="sim_time_scale",
+        type=float,
+        default=None,
+        help="every simulated latency is multiplied by this, 1 is real time",
+    )
+    subparser.add_argument(
+        "--sim-terraform",
+        dest="sim_terraform",
+        choices=TERRAFORM_MODES,
+        default=None,
+        help=f"{STUB_TERRAFORM} needs no terraform at all, {NULL_MODULE} runs the real binary against terraform/modules/null",
+    )
+    return subparser
+
+
+def add_dispatch_arguments(subparser):
+    subparser.add_argument(
+        "--order",
+        dest="order",
+        choices=ORDERS,
+        default="longest",
+        help="dispatch order by the duration model's estimates, longest first shortens the cohort's tail",
+    )
+    subparser.add_argument(
+        "--budget",
+        dest="budget",
+        type=float,
+        default=None,
+        help="only dispatch combos (in --order) while their estimated dollar cost fits",
+    )
+    subparser.add_argument(
+        "--dry-run",
+        dest="dry_run",
+        action="store_true",
+        default=False,
+        help="print the predicted completion time and cost, launch nothing",
+    )
+    return subparser
+
+
+def add_status_arguments(subparser):
+    subparser.add_argument(
+        "--status-port",
+        dest="status_port",
+        type=int,
+        default=None,
+        help="serve in-flight runs and phase latencies on /status (json) and /metrics (prometheus)",
+    )
+    subparser.add_argument(
+        "--status-host",
+        dest="status_host",
+        default=STATUS_HOST,
+    )
+    return subparser
+
+
+def add_asyncio_argument(subparser):
+    subparser.add_argument(
+        "--asyncio",
+        dest="use_asyncio",
+        action="store_true",
+        default=False,
+        help="drive every run from this one process on an event loop instead of a process per worker, "
+        "--workers is then the number of in-flight runs",
+    )
+    return subparser
 
 
 def add_global_arguments(subparser):
@@ -762,6 +2628,76 @@ def add_global_arguments(subparser):
     subparser.add_argument("--combos", nargs="+", dest="combos", help="bar help")
     subparser.add_argument("--cohort", nargs="+", dest="cohort", help="bar help")
     subparser.add_argument("--combo-file", dest="combo_file", help="")
+    subparser.add_argument(
+        "--queue",
+        dest="queue",
+        help="durable work queue, a sqlite file path or redis://host:port/db",
+    )
+    subparser.add_argument(
+        "--quota-file",
+        dest="quota_file",
+        default=QUOTA_FILE,
+        help="json of per-provider/per-region concurrent VM limits",
+    )
+    add_dispatch_arguments(subparser)
+    add_status_arguments(subparser)
+    add_asyncio_argument(subparser)
+    add_simulation_arguments(subparser)
+    subparser.add_argument(
+        "--serial-benchmarks",
+        dest="serial_benchmarks",
+        action="store_true",
+        default=False,
+        help="run every benchmark, and every direction of it, one at a time",
+    )
+    subparser.add_argument(
+        "--benchmarks",
+        dest="benchmarks",
+        nargs="+",
+        default=None,
+        help=f"run only these, default is every default one of {BENCHMARKS.names()}",
+    )
+    subparser.add_argument(
+        "--no-image-cache",
+        dest="no_image_cache",
+        action="store_true",
+        default=False,
+        help="always provision stock images from scratch, even where a golden image exists",
+    )
+    subparser.add_argument(
+        "--iperf-adaptive",
+        dest="iperf_adaptive",
+        action="store_true",
+        default=False,
+        help="stop each iperf run once its throughput has converged",
+    )
+    subparser.add_argument(
+        "--iperf-tolerance",
+        dest="iperf_tolerance",
+        type=float,
+        default=IPERF_SETTINGS.tolerance,
+        help="converged once the 95%% confidence interval is within +-this fraction of the mean",
+    )
+    subparser.add_argument(
+        "--iperf-min-seconds",
+        dest="iperf_min_seconds",
+        type=float,
+        default=IPERF_SETTINGS.min_seconds,
+    )
+    subparser.add_argument(
+        "--iperf-max-seconds",
+        dest="iperf_max_seconds",
+        type=float,
+        default=IPERF_SETTINGS.max_seconds,
+    )
+    subparser.add_argument(
+        "--iperf-parallel",
+        dest="iperf_parallel",
+        type=int,
+        nargs="+",
+        default=list(IPERF_SETTINGS.parallel),
+        help="sweep these --parallel stream counts, e.g. 1 2 4 8",
+    )
 
     return subparser
 
@@ -784,8 +2720,170 @@ def build_parser():
         help="baz help",
     )
     parser_b.add_argument("--skip-round-robin", action="store_true", default=False)
+    parser_b.add_argument(
+        "--shard",
+        type=parse_shard,
+        help="i/n, only emit the combos shard i of n owns (0-based)",
+    )
+    parser_b.add_argument(
+        "--provider-pairs",
+        nargs="+",
+        dest="provider_pairs",
+        help="only these provider pairs, e.g. aws:gcp linode:linode",
+    )
+    parser_b.add_argument(
+        "--continents",
+        nargs="+",
+        help="only combos with both hosts on these continents",
+    )
+    parser_b.add_argument(
+        "--continent-file",
+        dest="continent_file",
+        help='json of "provider+region" -> continent',
+    )
+    parser_b.add_argument(
+        "--sample",
+        type=int,
+        help="budgeted subset of N combos stratified by distance band and provider pair",
+    )
+    parser_b.add_argument(
+        "--coordinates",
+        help='json of "provider+region" -> [lat, lon], needed for --sample',
+    )
+    parser_b.add_argument(
+        "--seed", type=int, default=0, help="same seed, same sample on every shard"
+    )
+    parser_b.add_argument("--report", help="write the --sample coverage report as json")
+    parser_b.add_argument("--out", help="write combos to this file instead of stdout")
+    parser_b.add_argument("--queue", dest="queue", help="put combos on this work queue")
     parser_b.set_defaults(func=generate_combos)
 
+    parser_d = subparsers.add_parser(
+        "refresh", help="list (or re-run) combos that are missing or stale"
+    )
+    parser_d.add_argument("--max-age-days", dest="max_age_days", type=float)
+    parser_d.add_argument(
+        "--combo-file",
+        dest="combo_file",
+        help="the full cohort, defaults to every combo in the manifest",
+    )
+    parser_d.add_argument("--run", action="store_true", default=False)
+    parser_d.add_argument(
+        "--rebuild",
+        action="store_true",
+        default=False,
+        help="re-index the manifest from the artifacts tree",
+    )
+    parser_d.add_argument("--workers", dest="workers", default=1, type=int)
+    parser_d.add_argument("--quota-file", dest="quota_file", default=QUOTA_FILE)
+    add_status_arguments(parser_d)
+    add_asyncio_argument(parser_d)
+    add_dispatch_arguments(parser_d)
+    parser_d.set_defaults(func=refresh)
+
+    parser_e = subparsers.add_parser(
+        "ingest-results", help="parse existing artifacts into the result store"
+    )
+    parser_e.add_argument("--workers", dest="workers", default=8, type=int)
+    parser_e.set_defaults(func=ingest_results)
+
+    parser_g = subparsers.add_parser(
+        "pack-artifacts",
+        help="pack run dirs into compressed, deduplicated archives and report disk usage",
+    )
+    parser_g.add_argument("--workers", dest="workers", default=8, type=int)
+    parser_g.set_defaults(func=pack_artifacts)
+
+    parser_h = subparsers.add_parser(
+        "trace-summary", help="p50/p95/max per phase per provider from the run traces"
+    )
+    parser_h.add_argument(
+        "--phases", nargs="+", help="only these spans, e.g. apply destroy iperf"
+    )
+    parser_h.add_argument("--json", action="store_true", default=False)
+    parser_h.set_defaults(func=trace_summary)
+
+    parser_i = subparsers.add_parser(
+        "teardown", help="list (or retry) workdirs whose destroy gave up"
+    )
+    parser_i.add_argument("--retry", action="store_true", default=False)
+    parser_i.add_argument(
+        "--stale-minutes",
+        dest="stale_minutes",
+        default=60,
+        type=float,
+        help="pending teardowns older than this count as orphaned",
+    )
+    parser_i.set_defaults(func=teardown)
+
+    parser_j = subparsers.add_parser(
+        "bake-images",
+        help="build golden images from the provision script for regions without a current one",
+    )
+    parser_j.add_argument("--providers", nargs="+", choices=BAKEABLE_PROVIDERS)
+    parser_j.add_argument(
+        "--regions", nargs="+", help="only these, e.g. aws+us-east-1 gcp+us-west1"
+    )
+    parser_j.add_argument(
+        "--force",
+        action="store_true",
+        default=False,
+        help="rebake even where the catalog has a current image",
+    )
+    parser_j.add_argument("--workers", dest="workers", default=4, type=int)
+    parser_j.set_defaults(func=bake_images)
+
+    parser_f = subparsers.add_parser(
+        "pivot", help="region x region pivot tables from the result store"
+    )
+    parser_f.add_argument(
+        "--metrics",
+        nargs="+",
+        choices=list(METRICS.keys()),
+        default=list(METRICS.keys()),
+    )
+    parser_f.add_argument("--by-geography", action="store_true", default=False)
+    parser_f.add_argument(
+        "--coordinates", help="json of region -> [lat, lon] for geographic ordering"
+    )
+    parser_f.set_defaults(func=pivot)
+
+    parser_c = subparsers.add_parser(
+        "queue-stats", help="throughput and retry rates per provider"
+    )
+    parser_c.add_argument("--queue", dest="queue", required=True)
+    parser_c.set_defaults(func=queue_stats)
+
+    parser_k = add_simulation_arguments(
+        subparsers.add_parser(
+            "sim-bench",
+            help="orchestrator throughput, memory and tail latency on simulated cohorts",
+        )
+    )
+    parser_k.add_argument(
+        "--sizes", nargs="+", type=int, default=BENCH_SIZES, help="combos per cohort"
+    )
+    parser_k.add_argument(
+        "--modes", nargs="+", choices=BENCH_MODES, default=BENCH_MODES
+    )
+    parser_k.add_argument("--workers", dest="workers", default=32, type=int)
+    parser_k.add_argument("--quota-file", dest="quota_file", default=QUOTA_FILE)
+    parser_k.add_argument(
+        "--providers",
+        nargs="+",
+        choices=[p.value for p in CloudProvider],
+        help="simulated combos are between these, default is every provider",
+    )
+    parser_k.add_argument("--seed", type=int, default=0)
+    parser_k.add_argument(
+        "--keep-artifacts",
+        dest="keep_artifacts",
+        action="store_true",
+        default=False,
+        help="keep each simulated cohort's artifacts, traces and results instead of clearing them after measuring",
+    )
+    parser_k.set_defaults(func=sim_bench)
+
     return parser
 
 
@@ -793,6 +2891,15 @@ if __name__ == "__main__":
     parser = build_parser()
     args = parser.parse_args()
     if args.subparser_name in ["direct", "proxy"]:
-        if (args.combos is None) and (args.combo_file is None):
-            parser.error("either a combo file or combo list is required")
+        if (
+            (args.combos is None)
+            and (args.combo_file is None)
+            and (getattr(args, "queue", None) is None)
+        ):
+            parser.error("either a combo file, combo list or queue is required")
+    if args.subparser_name == "generate-combos":
+        if args.continents and args.continent_file is None:
+            parser.error("--continents needs a --continent-file")
+        if args.sample is not None and args.coordinates is None:
+            parser.error("--sample needs --coordinates")
     args.func(args)
@@ -0,0 +1,142 @@
+import json
+import os
+import random
+import re
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from tfworkdir import file_lock
+
+ALL_REGIONS_FILE = os.path.join("artifacts", "all_regions.json")
+REGIONS_TO_ZONES_FILE = os.path.join("artifacts", "regions", "regions-to-zones.json")
+ZONE_CAPABILITIES_FILE = os.path.join("artifacts", "regions", "zone-capabilities.json")
+
+# apply errors that mean "this zone will never take our instance type", as opposed to
+# capacity/quota hiccups that are worth retrying
+# e.g. Unsupported: Your requested instance type (t2.micro) is not supported in your requested Availability Zone (sa-east-1b)
+ZONE_REJECTION_PATTERNS = [
+    (
+        "aws",
+        re.compile(
+            r"requested instance type \((?P<instance_type>[^)]+)\) is not supported in your requested Availability Zone \((?P<zone>[^)]+)\)"
+        ),
+    ),
+]
+
+
+class ZoneOutcome(NamedTuple):
+    provider: str
+    zone: str
+    instance_type: Optional[str]
+    reason: str
+
+
+def zone_rejections(apply_output: str) -> List[ZoneOutcome]:
+    outcomes = []
+    for provider, pattern in ZONE_REJECTION_PATTERNS:
+        for m in pattern.finditer(apply_output):
+            outcomes.append(
+                ZoneOutcome(
+                    provider,
+                    m.group("zone"),
+                    m.groupdict().get("instance_type"),
+                    m.group(0),
+                )
+            )
+    return outcomes
+
+
+class RegionCatalog(object):
+    # the region/zone json files parsed once per process, indexed by provider
+    # plus what apply errors have taught us about zones, shared between processes on disk
+    def __init__(
+        self,
+        all_regions_file: str = ALL_REGIONS_FILE,
+        regions_to_zones_file: str = REGIONS_TO_ZONES_FILE,
+        capabilities_file: str = ZONE_CAPABILITIES_FILE,
+    ):
+        self.all_regions_file = all_regions_file
+        self.regions_to_zones_file = regions_to_zones_file
+        self.capabilities_file = capabilities_file
+        self._regions = None
+        self._zones = None
+        self._capabilities = {}
+        self._capabilities_mtime = None
+
+    @property
+    def regions(self) -> Dict[str, List[str]]:
+        if self._regions is None:
+            with open(self.all_regions_file, "r") as fp:
+                self._regions = {p: list(r.keys()) for p, r in json.load(fp).items()}
+        return self._regions
+
+    @property
+    def zones(self) -> Dict[str, Dict[str, List[str]]]:
+        if self._zones is None:
+            self._zones = {}
+            if os.path.exists(self.regions_to_zones_file):
+                with open(self.regions_to_zones_file, "r") as fp:
+                    self._zones = json.load(fp)
+        return self._zones
+
+    @property
+    def capabilities(self) -> Dict[str, Dict[str, dict]]:
+        # other workers learn zones too, re-read only when the file actually changed
+        try:
+            mtime = os.path.getmtime(self.capabilities_file)
+        except OSError:
+            return self._capabilities
+        if mtime != self._capabilities_mtime:
+            with open(self.capabilities_file, "r") as fp:
+                self._capabilities = json.load(fp)
+            self._capabilities_mtime = mtime
+        return self._capabilities
+
+    def provider_regions(self, provider: str) -> List[str]:
+        return self.regions[provider]
+
+    def region_zones(self, provider: str, region: str) -> List[str]:
+        return self.zones.get(provider, {}).get(region, [])
+
+    def is_rejected(self, provider: str, zone: str) -> bool:
+        return self.capabilities.get(provider, {}).get(zone, {}).get("rejected", False)
+
+    def usable_zones(self, provider: str, region: str) -> List[str]:
+        return [
+            z
+            for z in self.region_zones(provider, region)
+            if not self.is_rejected(provider, z)
+        ]
+
+    def choose_zone(self, provider: str, region: str) -> Optional[str]:
+        # None lets the provider pick, which is also what happens once every known zone is rejected
+        zones = self.usable_zones(provider, region)
+        if len(zones) == 0:
+            return None
+        return zones[random.randint(0, len(zones) - 1)]
+
+    def record_outcomes(self, outcomes: List[ZoneOutcome]):
+        if len(outcomes) == 0:
+            return
+        os.makedirs(os.path.dirname(self.capabilities_file), exist_ok=True)
+        with file_lock(self.capabilities_file + ".lock"):
+            capabilities = {}
+            if os.path.exists(self.capabilities_file):
+                with open(self.capabilities_file, "r") as fp:
+                    capabilities = json.load(fp)
+            for outcome in outcomes:
+                capabilities.setdefault(outcome.provider, {})[outcome.zone] = {
+                    "rejected": True,
+                    "instance_type": outcome.instance_type,
+                    "reason": outcome.reason,
+                    "learned_at": time.time(),
+                }
+            with open(self.capabilities_file + ".tmp", "w") as fp:
+                json.dump(capabilities, fp, indent=2)
+            os.replace(self.capabilities_file + ".tmp", self.capabilities_file)
+        self._capabilities_mtime = None
+
+    def learn_from_apply(self, apply_output: str) -> List[ZoneOutcome]:
+        outcomes = zone_rejections(apply_output)
+        self.record_outcomes(outcomes)
+        return outcomes
@@ -0,0 +1,145 @@
+import concurrent.futures
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+# what a benchmark's commands run against
+HOST = "host"  # each node on its own (cryptsetup, fio, stress-ng)
+PAIR = "pair"  # src->dst and dst->src (ping, traceroute, iperf)
+
+# every benchmark in a shared stage holds about one ssh session per node at a time,
+# sshd allows 10 per master connection by default (MaxSessions)
+STAGE_WIDTH = 8
+
+
+class Benchmark(NamedTuple):
+    # also the log name
+    name: str
+    scope: str
+    # either a command for run_on_hosts/run_directions, cmd(target) for HOST and cmd(from_host, to_host) for PAIR,
+    # or run(targets, log, tracer=...) for anything more involved (iperf has to start its servers first)
+    cmd: Optional[Callable] = None
+    run: Optional[Callable] = None
+    # needs the nodes to itself, nothing else runs alongside it: bandwidth sensitive,
+    # or loads the nodes enough to skew whatever would share the stage
+    bandwidth: bool = False
+    # only starts once these are done (when they're part of the run at all)
+    after: Tuple[str, ...] = ()
+    # enabled(runner), not applicable to this run, left out silently (private networking, ...)
+    enabled: Optional[Callable] = None
+    # skip(runner), applicable but can't run here, the reason goes to <name>.skip
+    skip: Optional[Callable] = None
+    # part of every run unless --benchmarks says otherwise
+    default: bool = True
+    # write the command into the log ahead of its output
+    echo_cmd: bool = False
+
+
+class Stage(NamedTuple):
+    benchmarks: List[Benchmark]
+    exclusive: bool
+
+    def __str__(self):
+        return "+".join(b.name for b in self.benchmarks)
+
+
+class BenchmarkRegistry(object):
+    def __init__(self):
+        self.benchmarks: Dict[str, Benchmark] = {}
+
+    def register(self, benchmark: Benchmark) -> Benchmark:
+        if benchmark.name in self.benchmarks:
+            raise ValueError(f"benchmark {benchmark.name} is already registered")
+        if benchmark.scope not in [HOST, PAIR]:
+            raise ValueError(
+                f"benchmark {benchmark.name} has unknown scope {benchmark.scope}"
+            )
+        if (benchmark.cmd is None) == (benchmark.run is None):
+            raise ValueError(
+                f"benchmark {benchmark.name} needs exactly one of cmd or run"
+            )
+        self.benchmarks[benchmark.name] = benchmark
+        return benchmark
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.benchmarks
+
+    def names(self) -> List[str]:
+        return list(self.benchmarks.keys())
+
+    def select(self, names: Optional[List[str]] = None) -> List[Benchmark]:
+        # registration order, None is every default benchmark
+        if names is None:
+            return [b for b in self.benchmarks.values() if b.default]
+        unknown = [n for n in names if n not in self.benchmarks]
+        if len(unknown) > 0:
+            raise ValueError(f"unknown benchmarks {unknown}, known are {self.names()}")
+        return [b for b in self.benchmarks.values() if b.name in names]
+
+    def plan(
+        self,
+        benchmarks: List[Benchmark],
+        width: int = STAGE_WIDTH,
+        concurrent: bool = True,
+    ) -> List[Stage]:
+        # list scheduling in dependency (then registration) order:
+        #   bandwidth benchmarks get a stage to themselves, appended after everything so far
+        #   the rest join the earliest shared stage after their dependencies that still has room
+        ordered = dependency_order(benchmarks)
+        if not concurrent:
+            return [Stage([b], True) for b in ordered]
+
+        stages: List[Stage] = []
+        stage_of = {}
+        for b in ordered:
+            earliest = max([stage_of[d] + 1 for d in b.after if d in stage_of] + [0])
+            index = None
+            if not b.bandwidth:
+                for i in range(earliest, len(stages)):
+                    if not stages[i].exclusive and len(stages[i].benchmarks) < width:
+                        index = i
+                        break
+            if index is None:
+                index = max(earliest, len(stages))
+                stages.append(Stage([], b.bandwidth))
+            stages[index].benchmarks.append(b)
+            stage_of[b.name] = index
+        return stages
+
+
+def dependency_order(benchmarks: List[Benchmark]) -> List[Benchmark]:
+    # stable topological sort, dependencies outside `benchmarks` count as done
+    names = set(b.name for b in benchmarks)
+    remaining = list(benchmarks)
+    done = set()
+    ordered = []
+    while len(remaining) > 0:
+        ready = [
+            b for b in remaining if all(d in done or d not in names for d in b.after)
+        ]
+        if len(ready) == 0:
+            raise ValueError(
+                f"benchmark dependency cycle between {[b.name for b in remaining]}"
+            )
+        # one at a time so registration order breaks ties
+        ordered.append(ready[0])
+        done.add(ready[0].name)
+        remaining.remove(ready[0])
+    return ordered
+
+
+def run_stages(
+    stages: List[Stage],
+    run_benchmark: Callable[[Benchmark], None],
+    on_stage: Callable[[Stage], None] = None,
+):
+    # stages strictly one after another, the benchmarks within a stage all at once
+    for stage in stages:
+        if on_stage is not None:
+            on_stage(stage)
+        if len(stage.benchmarks) == 1:
+            run_benchmark(stage.benchmarks[0])
+            continue
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(stage.benchmarks)
+        ) as executor:
+            for f in [executor.submit(run_benchmark, b) for b in stage.benchmarks]:
+                f.result()
@@ -0,0 +1,407 @@
+import glob
+import json
+import math
+import os
+import re
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+import numpy as np
+
+from artifactstore import RUN_ARCHIVE_SUFFIX, open_run
+
+DIRECTIONS = ["src->dst", "dst->src"]
+HOSTS = ["src", "dst"]
+
+
+class PingRecord(NamedTuple):
+    direction: str
+    dst_ip: str
+    transmitted: int
+    received: int
+    loss_pct: float
+    rtt_min: float
+    rtt_avg: float
+    rtt_max: float
+    rtt_mdev: float
+
+
+class IperfRecord(NamedTuple):
+    direction: str
+    stream: str
+    start: float
+    end: float
+    # the 0.00-<runtime> line (or [SUM] across --parallel streams)
+    is_summary: bool
+    transfer_mbytes: float
+    mbits_per_sec: float
+    # --parallel streams in this run
+    parallel: int
+    # seconds the run actually lasted, adaptive runs stop early once the link has settled
+    duration: float
+
+
+class TracerouteRecord(NamedTuple):
+    direction: str
+    dst_ip: str
+    hop: int
+    probe: int
+    host: str
+    address: str
+    # nan for a `*`
+    rtt_ms: float
+
+
+class CryptsetupRecord(NamedTuple):
+    host: str
+    algorithm: str
+    key_bits: int
+    encryption_mib_s: float
+    decryption_mib_s: float
+
+
+# group 1 of every header is the address the block was measuring towards
+PING_HEADER_RE = re.compile(r"^PING (\S+)", re.MULTILINE)
+PING_PACKETS_RE = re.compile(
+    r"(\d+) packets transmitted, (\d+) (?:packets )?received.*?([\d.]+)% packet loss"
+)
+PING_RTT_RE = re.compile(r"= ([\d.]+)/([\d.]+)/([\d.]+)/([\d.]+) ms")
+
+IPERF_HEADER_RE = re.compile(r"^Client connecting to ([^,\s]+)", re.MULTILINE)
+IPERF_INTERVAL_RE = re.compile(
+    r"^\[\s*([\w-]+)\]\s+([\d.]+)\s*-\s*([\d.]+)\s+sec\s+([\d.]+)\s+(\w?)Bytes\s+([\d.]+)\s+(\w?)bits/sec",
+    re.MULTILINE,
+)
+
+TRACEROUTE_HEADER_RE = re.compile(r"^traceroute to \S+ \(([^)]+)\)", re.MULTILINE)
+TRACEROUTE_HOP_RE = re.compile(r"^\s*(\d+)\s+(.*)$")
+TRACEROUTE_PROBE_RE = re.compile(r"(\S+) \(([^)]+)\)|([\d.]+) ms|(\*)")
+
+CRYPTSETUP_HEADER_RE = re.compile(r"^# Tests are approximate", re.MULTILINE)
+CRYPTSETUP_CIPHER_RE = re.compile(
+    r"^\s*(\S+)\s+(\d+)b\s+([\d.]+) MiB/s\s+([\d.]+) MiB/s", re.MULTILINE
+)
+
+UNIT_SCALE = {"": 1.0 / 1e6, "K": 1.0 / 1e3, "M": 1.0, "G": 1e3}
+BYTE_UNIT_SCALE = {"": 1.0 / 1024**2, "K": 1.0 / 1024, "M": 1.0, "G": 1024.0}
+
+
+def split_blocks(output: str, header_re) -> List[str]:
+    starts = [m.start() for m in header_re.finditer(output)]
+    return [output[s:e] for s, e in zip(starts, starts[1:] + [len(output)])]
+
+
+def labelled_blocks(
+    output: str,
+    header_re,
+    labels: List[str],
+    target_ips: Dict[str, str] = None,
+    sections: List[Tuple[str, str]] = None,
+) -> Iterator[Tuple[str, str]]:
+    # (direction or host, block) for every block that can be attributed, the rest are skipped rather than guessed
+    # a failed direction prints no header, so a block's position in the log says nothing about which one it is
+    # sections are the log's (label, text) pieces from its section index, logstream.split_sections
+    if sections:
+        for label, text in sections:
+            if label not in labels:
+                continue
+            for block in split_blocks(text, header_re):
+                yield label, block
+        return
+
+    # logs written before sections were indexed, the address each block measured towards says which direction it was
+    if target_ips is None or header_re.groups == 0:
+        return
+    for block in split_blocks(output, header_re):
+        label = target_ips.get(header_re.search(block).group(1))
+        if label in labels:
+            yield label, block
+
+
+def target_ips_from_tfstate(tfstate: str) -> Dict[str, str]:
+    # address -> direction towards it, from the benchmark_targets output terraform saved with the run
+    targets = json.loads(tfstate)["outputs"]["benchmark_targets"]["value"]
+    target_ips = {}
+    for direction in DIRECTIONS:
+        to_host = targets[direction.split("->")[1]]
+        for key in ["ip_address", "private_ip_address"]:
+            if to_host.get(key):
+                target_ips[to_host[key]] = direction
+    return target_ips
+
+
+def parse_ping(
+    output: str, target_ips: Dict[str, str] = None, sections=None
+) -> List[PingRecord]:
+    records = []
+    for direction, block in labelled_blocks(
+        output, PING_HEADER_RE, DIRECTIONS, target_ips, sections
+    ):
+        packets = PING_PACKETS_RE.search(block)
+        if packets is None:
+            continue
+        rtt = PING_RTT_RE.search(block)
+        rtts = [float(v) for v in rtt.groups()] if rtt else [math.nan] * 4
+        records.append(
+            PingRecord(
+                direction,
+                PING_HEADER_RE.search(block).group(1),
+                int(packets.group(1)),
+                int(packets.group(2)),
+                float(packets.group(3)),
+                *rtts,
+            )
+        )
+    return records
+
+
+def parse_iperf(
+    output: str, target_ips: Dict[str, str] = None, sections=None
+) -> List[IperfRecord]:
+    records = []
+    for direction, block in labelled_blocks(
+        output, IPERF_HEADER_RE, DIRECTIONS, target_ips, sections
+    ):
+        intervals = list(IPERF_INTERVAL_RE.finditer(block))
+        if len(intervals) == 0:
+            continue
+        runtime = max(float(m.group(3)) for m in intervals)
+        streams = set(m.group(1) for m in intervals)
+        # newer iperf2 labels the sums [SUM-<n>]
+        parallel = max(len([s for s in streams if not s.startswith("SUM")]), 1)
+        for m in intervals:
+            stream, start, end = m.group(1), float(m.group(2)), float(m.group(3))
+            if len(streams) > 1:
+                is_summary = (
+                    stream.startswith("SUM") and start == 0.0 and end == runtime
+                )
+            else:
+                is_summary = start == 0.0 and end == runtime
+            records.append(
+                IperfRecord(
+                    direction,
+                    stream,
+                    start,
+                    end,
+                    is_summary,
+                    float(m.group(4)) * BYTE_UNIT_SCALE.get(m.group(5), 1.0),
+                    float(m.group(6)) * UNIT_SCALE.get(m.group(7), 1.0),
+                    parallel,
+                    runtime,
+                )
+            )
+    return records
+
+
+def parse_traceroute(
+    output: str, target_ips: Dict[str, str] = None, sections=None
+) -> List[TracerouteRecord]:
+    records = []
+    for direction, block in labelled_blocks(
+        output, TRACEROUTE_HEADER_RE, DIRECTIONS, target_ips, sections
+    ):
+        dst_ip = TRACEROUTE_HEADER_RE.search(block).group(1)
+        for line in block.splitlines()[1:]:
+            hop_match = TRACEROUTE_HOP_RE.match(line)
+            if hop_match is None:
+                continue
+            hop = int(hop_match.group(1))
+            host, address, probe = "", "", 0
+            for m in TRACEROUTE_PROBE_RE.finditer(hop_match.group(2)):
+                if m.group(1) is not None:
+                    # later probes of the same hop may answer from a different router
+                    host, address = m.group(1), m.group(2)
+                    continue
+                probe += 1
+                if m.group(4) is not None:
+                    records.append(
+                        TracerouteRecord(
+                            direction, dst_ip, hop, probe, "", "", math.nan
+                        )
+                    )
+                else:
+                    records.append(
+                        TracerouteRecord(
+                            direction,
+                            dst_ip,
+                            hop,
+                            probe,
+                            host,
+                            address,
+                            float(m.group(3)),
+                        )
+                    )
+    return records
+
+
+def parse_cryptsetup(
+    output: str, target_ips: Dict[str, str] = None, sections=None
+) -> List[CryptsetupRecord]:
+    # the output names no address, so logs without a section index can't be attributed to a host at all
+    records = []
+    for host, block in labelled_blocks(
+        output, CRYPTSETUP_HEADER_RE, HOSTS, sections=sections
+    ):
+        for m in CRYPTSETUP_CIPHER_RE.finditer(block):
+            records.append(
+                CryptsetupRecord(
+                    host,
+                    m.group(1),
+                    int(m.group(2)),
+                    float(m.group(3)),
+                    float(m.group(4)),
+                )
+            )
+    return records
+
+
+# log name -> (table, parser)
+PARSERS = {
+    "ping": ("ping", parse_ping),
+    "traceroute": ("traceroute", parse_traceroute),
+    "traceroute.icmp": ("traceroute", parse_traceroute),
+    "traceroute.private": ("traceroute", parse_traceroute),
+    "traceroute.private.icmp": ("traceroute", parse_traceroute),
+    "iperf": ("iperf", parse_iperf),
+    "iperf.private": ("iperf", parse_iperf),
+    "cryptsetup_benchmark": ("cryptsetup", parse_cryptsetup),
+}
+KEY_COLUMNS = ["cohort", "combo", "uuid", "benchmark"]
+
+
+def records_to_array(records: List[NamedTuple], keys: Dict[str, str]) -> np.ndarray:
+    fields = list(KEY_COLUMNS) + list(records[0]._fields)
+    columns = [[keys[k]] * len(records) for k in KEY_COLUMNS]
+    columns += [list(c) for c in zip(*records)]
+    return np.rec.fromarrays(columns, names=fields).view(np.ndarray)
+
+
+# what shards written before a column existed get for it
+MISSING_FILL = {"f": np.nan, "i": -1, "b": False, "U": ""}
+
+
+def concat_arrays(arrays: List[np.ndarray]) -> np.ndarray:
+    # shards have different string widths, widen everything to the largest before concatenating
+    if len(arrays) == 0:
+        return np.array([])
+    names = []
+    for a in arrays:
+        names.extend(n for n in a.dtype.names if n not in names)
+    descr = []
+    for name in names:
+        dtypes = [a.dtype[name] for a in arrays if name in a.dtype.names]
+        if dtypes[0].kind == "U":
+            descr.append((name, f"U{max(d.itemsize // 4 for d in dtypes)}"))
+        else:
+            descr.append((name, np.result_type(*dtypes)))
+
+    widened = []
+    for a in arrays:
+        out = np.empty(len(a), dtype=descr)
+        for name, dtype in descr:
+            if name in a.dtype.names:
+                out[name] = a[name]
+            else:
+                out[name] = MISSING_FILL.get(np.dtype(dtype).kind, 0)
+        widened.append(out)
+    return np.concatenate(widened)
+
+
+class ResultStore(object):
+    # numpy-backed columnar store, one structured-array shard per (table, run) under
+    # <root>/<table>/<combo>/<uuid>.<benchmark>.npy so parallel workers never share a file
+    def __init__(self, root: str):
+        self.root = root
+
+    def shard_path(self, table: str, combo: str, run_uuid: str, benchmark: str) -> str:
+        return os.path.join(self.root, table, combo, f"{run_uuid}.{benchmark}.npy")
+
+    def has_run(self, combo: str, run_uuid: str) -> bool:
+        return (
+            len(glob.glob(os.path.join(self.root, "*", combo, f"{run_uuid}.*.npy"))) > 0
+        )
+
+    def write(
+        self,
+        cohort: str,
+        combo: str,
+        run_uuid: str,
+        benchmark: str,
+        records: List[NamedTuple],
+    ) -> int:
+        if len(records) == 0:
+            return 0
+        table, _ = PARSERS[benchmark]
+        path = self.shard_path(table, combo, run_uuid, benchmark)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        array = records_to_array(
+            records,
+            {
+                "cohort": cohort,
+                "combo": combo,
+                "uuid": run_uuid,
+                "benchmark": benchmark,
+            },
+        )
+        # write-then-rename so readers never see half a shard
+        with open(path + ".tmp", "wb") as fp:
+            np.save(fp, array)
+        os.replace(path + ".tmp", path)
+        return len(records)
+
+    def load(self, table: str) -> np.ndarray:
+        shards = sorted(glob.glob(os.path.join(self.root, table, "*", "*.npy")))
+        return concat_arrays([np.load(s) for s in shards])
+
+
+def parse_and_store(
+    store: ResultStore,
+    cohort: str,
+    combo: str,
+    run_uuid: str,
+    benchmark: str,
+    stdout,
+    target_ips: Dict[str, str] = None,
+    sections: List[Tuple[str, str]] = None,
+) -> int:
+    if benchmark not in PARSERS:
+        return 0
+    _, parser = PARSERS[benchmark]
+    return store.write(
+        cohort, combo, run_uuid, benchmark, parser(stdout, target_ips, sections)
+    )
+
+
+def ingest_run_dir(args) -> int:
+    # backfill a single artifacts/<cohort>/<combo>/<uuid> dir (or packed archive), runs in a worker process
+    store_root, cohort, run_path = args
+    store = ResultStore(store_root)
+    combo = os.path.basename(os.path.dirname(run_path))
+    run_uuid = os.path.basename(run_path)
+    if run_uuid.endswith(RUN_ARCHIVE_SUFFIX):
+        run_uuid = run_uuid[: -len(RUN_ARCHIVE_SUFFIX)]
+    if store.has_run(combo, run_uuid):
+        return 0
+
+    run = open_run(run_path)
+    # logs from before sections were indexed can only be attributed by address
+    target_ips = None
+    if "terraform.tfstate" in run.names():
+        try:
+            target_ips = target_ips_from_tfstate(run.read_text("terraform.tfstate"))
+        except (ValueError, KeyError):
+            pass
+    ingested = 0
+    for benchmark in PARSERS.keys():
+        if not run.has_log(benchmark):
+            continue
+        ingested += parse_and_store(
+            store,
+            cohort,
+            combo,
+            run_uuid,
+            benchmark,
+            run.read_log(benchmark),
+            target_ips,
+            run.read_log_sections(benchmark),
+        )
+    return ingested
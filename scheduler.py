@@ -0,0 +1,236 @@
+import asyncio
+import concurrent.futures
+import heapq
+import json
+import os
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Hashable, List, NamedTuple
+
+from tqdm import tqdm
+
+# how often a scheduler with held budgets re-checks them while nothing it dispatched has finished
+HELD_POLL_SECONDS = 5
+
+
+class ScheduledItem(NamedTuple):
+    index: int
+    item: object
+    # how much of each budget (e.g. "aws", "azure+eastus") the item holds while in flight
+    demand: Dict[str, int]
+    # items are bucketed by group (provider pair) so a saturated provider is skipped in one check
+    group: Hashable
+
+
+def load_quotas(quota_file: str) -> Dict[str, Dict[str, int]]:
+    # {"providers": {"aws": 32}, "regions": {"azure": 10, "azure+eastus": 5}}
+    # region entries keyed by a bare provider apply to every region of that provider
+    if quota_file is None or not os.path.exists(quota_file):
+        return {"providers": {}, "regions": {}}
+    with open(quota_file, "r") as fp:
+        quotas = json.load(fp)
+    quotas.setdefault("providers", {})
+    quotas.setdefault("regions", {})
+    return quotas
+
+
+class QuotaScheduler(object):
+    limits: Dict[str, int]
+    in_use: Counter
+
+    def __init__(
+        self,
+        limits: Dict[str, int],
+        held: Callable[[], Counter] = None,
+        poll_seconds: float = HELD_POLL_SECONDS,
+    ):
+        self.limits = limits
+        self.in_use = Counter()
+        # budget still taken after an item returned, e.g. a run's VMs while the teardown pool destroys them
+        self.held = held
+        self.held_in_use = Counter()
+        self.poll_seconds = poll_seconds
+        # progress for the status server, items not started yet and items running
+        self.queued = 0
+        self.in_flight = 0
+
+    def fits(self, demand: Dict[str, int]) -> bool:
+        for key, count in demand.items():
+            limit = self.limits.get(key)
+            if (
+                limit is not None
+                and self.in_use[key] + self.held_in_use[key] + count > limit
+            ):
+                return False
+        return True
+
+    def can_ever_fit(self, demand: Dict[str, int]) -> bool:
+        for key, count in demand.items():
+            limit = self.limits.get(key)
+            if limit is not None and count > limit:
+                return False
+        return True
+
+    def acquire(self, demand: Dict[str, int]):
+        self.in_use.update(demand)
+
+    def release(self, demand: Dict[str, int]):
+        self.in_use.subtract(demand)
+
+    def refresh_held(self):
+        if self.held is not None:
+            self.held_in_use = Counter(self.held())
+
+    def wait_timeout(self):
+        # only poll when held budgets can free up without any of our own items finishing
+        return self.poll_seconds if self.held is not None else None
+
+    def next_item(self, pending: Dict[Hashable, List[ScheduledItem]]) -> ScheduledItem:
+        # earliest pending item that fits the remaining budgets, looking at most one
+        # fitting candidate per group
+        best = None
+        for group, items in pending.items():
+            for item in items:
+                if best is not None and item.index > best.index:
+                    break
+                if self.fits(item.demand):
+                    best = item
+                    break
+        if best is not None:
+            pending[best.group].remove(best)
+            if len(pending[best.group]) == 0:
+                del pending[best.group]
+        return best
+
+    def _pending(
+        self, items: List[ScheduledItem], results: List, report: bool = True
+    ) -> OrderedDict:
+        pending = OrderedDict()
+        for item in items:
+            if not self.can_ever_fit(item.demand):
+                if not report:
+                    continue
+                print(
+                    f"[!] {item.item} needs {item.demand} which can never fit in {self.limits}, skipping",
+                    flush=True,
+                )
+                results[item.index] = False
+                continue
+            pending.setdefault(item.group, []).append(item)
+        return pending
+
+    def run(
+        self,
+        executor: concurrent.futures.Executor,
+        fn: Callable,
+        items: List[ScheduledItem],
+        max_in_flight: int,
+    ) -> List:
+        results = [None] * len(items)
+        pending = self._pending(items, results)
+
+        in_flight = {}
+        with tqdm(total=len(items)) as progress:
+            progress.update(len(items) - sum(len(v) for v in pending.values()))
+            while len(pending) > 0 or len(in_flight) > 0:
+                self.refresh_held()
+                # keep every provider busy up to its own quota instead of throttling everything to the strictest one
+                while len(pending) > 0 and len(in_flight) < max_in_flight:
+                    item = self.next_item(pending)
+                    if item is None:
+                        break
+                    self.acquire(item.demand)
+                    in_flight[executor.submit(fn, item.item)] = item
+                self.in_flight = len(in_flight)
+                self.queued = sum(len(v) for v in pending.values())
+
+                if len(in_flight) == 0:
+                    # everything left waits on held budget
+                    time.sleep(self.poll_seconds)
+                    continue
+                done, _ = concurrent.futures.wait(
+                    list(in_flight.keys()),
+                    timeout=self.wait_timeout(),
+                    return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+                for future in done:
+                    item = in_flight.pop(future)
+                    self.release(item.demand)
+                    try:
+                        results[item.index] = future.result()
+                    except Exception as ex:
+                        print(f"[!] {item.item} failed: {ex}", flush=True)
+                        results[item.index] = False
+                    progress.update(1)
+                self.in_flight = len(in_flight)
+                self.queued = sum(len(v) for v in pending.values())
+
+        return results
+
+    async def run_async(
+        self,
+        fn: Callable,
+        items: List[ScheduledItem],
+        max_in_flight: int,
+    ) -> List:
+        # same scheduling as run, with `await fn(item)` tasks on the running loop instead of executor futures
+        results = [None] * len(items)
+        pending = self._pending(items, results)
+
+        in_flight = {}
+        with tqdm(total=len(items)) as progress:
+            progress.update(len(items) - sum(len(v) for v in pending.values()))
+            while len(pending) > 0 or len(in_flight) > 0:
+                self.refresh_held()
+                while len(pending) > 0 and len(in_flight) < max_in_flight:
+                    item = self.next_item(pending)
+                    if item is None:
+                        break
+                    self.acquire(item.demand)
+                    in_flight[asyncio.ensure_future(fn(item.item))] = item
+                self.in_flight = len(in_flight)
+                self.queued = sum(len(v) for v in pending.values())
+
+                if len(in_flight) == 0:
+                    await asyncio.sleep(self.poll_seconds)
+                    continue
+                done, _ = await asyncio.wait(
+                    list(in_flight.keys()),
+                    timeout=self.wait_timeout(),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    item = in_flight.pop(task)
+                    self.release(item.demand)
+                    try:
+                        results[item.index] = task.result()
+                    except Exception as ex:
+                        print(f"[!] {item.item} failed: {ex}", flush=True)
+                        results[item.index] = False
+                    progress.update(1)
+                self.in_flight = len(in_flight)
+                self.queued = sum(len(v) for v in pending.values())
+
+        return results
+
+    def simulate(
+        self, items: List[ScheduledItem], seconds: List[float], max_in_flight: int
+    ) -> float:
+        # what run would take if every item took its seconds[item.index], same dispatch decisions
+        pending = self._pending(items, [None] * len(items), report=False)
+        clock = 0.0
+        in_flight = []
+        while len(pending) > 0 or len(in_flight) > 0:
+            while len(pending) > 0 and len(in_flight) < max_in_flight:
+                item = self.next_item(pending)
+                if item is None:
+                    break
+                self.acquire(item.demand)
+                heapq.heappush(
+                    in_flight, (clock + seconds[item.index], item.index, item)
+                )
+            if len(in_flight) == 0:
+                break
+            clock, _, item = heapq.heappop(in_flight)
+            self.release(item.demand)
+        return clock
@@ -0,0 +1,353 @@
+import base64
+import glob
+import json
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, NamedTuple, Tuple
+
+import numpy as np
+from python_terraform import Terraform
+
+from tfworkdir import TerraformWorkdir
+
+SIMULATION_FILE = "simulation.json"
+RECORDINGS_DIR = "recordings"
+# simulated runs go to their own cohort, refresh (and the duration model) must never take them for real ones
+SIMULATED_COHORT = "simulated"
+
+# how the terraform side of a simulated run is faked
+STUB_TERRAFORM = "stub"  # in process, no terraform binary, nothing to init
+NULL_MODULE = "null-module"  # real terraform with every host on terraform/modules/null
+TERRAFORM_MODES = [STUB_TERRAFORM, NULL_MODULE]
+
+# seconds a real run spends on each, before time_scale. terraform commands by name, ssh commands by
+# the program they run (see command_kind), "ssh" for anything else
+LATENCIES = {
+    "init": 1.0,
+    "plan": 8.0,
+    "apply": 90.0,
+    "destroy": 60.0,
+    "ready": 30.0,
+    "demographics": 6.0,
+    "hostname": 0.3,
+    "ping": 99.0,
+    "traceroute": 25.0,
+    "iperf": 60.0,
+    "iperf-server": 0.5,
+    "kill": 0.3,
+    "cryptsetup": 20.0,
+    "fio": 30.0,
+    "stress-ng": 30.0,
+    "ssh": 0.3,
+}
+# where a provider is far off the above, azure's VMs take minutes to come and go
+PROVIDER_LATENCIES = {
+    "azure": {"apply": 420.0, "destroy": 300.0, "ready": 60.0},
+    "aws": {"apply": 75.0},
+    "gcp": {"apply": 60.0, "destroy": 90.0},
+}
+# chance per command, "ssh" drops the master connection (the session reconnects and retries once)
+FAILURE_RATES = {"apply": 0.02, "destroy": 0.01, "ssh": 0.002}
+
+# sim-bench, cohort sizes and the orchestrators to drive through them
+BENCH_SIZES = [100, 1000, 50000]
+BENCH_MODES = ["process-pool", "asyncio", "queue"]
+BENCH_REPORT_FILE = os.path.join("artifacts", "simulation-bench.jsonl")
+
+
+class SimulationSettings(NamedTuple):
+    cohort: str = SIMULATED_COHORT
+    # 0.01 turns a 7 minute run into about 4 seconds
+    time_scale: float = 0.01
+    # sigma of the lognormal every latency is multiplied by, the tail comes from here
+    jitter: float = 0.25
+    latencies: Dict[str, float] = LATENCIES
+    provider_latencies: Dict[str, Dict[str, float]] = PROVIDER_LATENCIES
+    failure_rates: Dict[str, float] = FAILURE_RATES
+    recordings_dir: str = RECORDINGS_DIR
+    terraform: str = STUB_TERRAFORM
+
+    def latency(self, kind: str, provider: str = None) -> float:
+        seconds = self.provider_latencies.get(provider, {}).get(
+            kind, self.latencies.get(kind, self.latencies["ssh"])
+        )
+        return seconds * self.time_scale * random.lognormvariate(0.0, self.jitter)
+
+    def fails(self, kind: str) -> bool:
+        return random.random() < self.failure_rates.get(kind, 0.0)
+
+
+def load_simulation_settings(
+    simulation_file: str = SIMULATION_FILE, **overrides
+) -> SimulationSettings:
+    # simulation.json is merged over the defaults the same way prices.json is, overrides (flags) win over both
+    settings = {
+        "latencies": dict(LATENCIES),
+        "provider_latencies": {p: dict(l) for p, l in PROVIDER_LATENCIES.items()},
+        "failure_rates": dict(FAILURE_RATES),
+    }
+    if simulation_file is not None and os.path.exists(simulation_file):
+        with open(simulation_file, "r") as fp:
+            for key, value in json.load(fp).items():
+                if key == "provider_latencies":
+                    for provider, latencies in value.items():
+                        settings[key].setdefault(provider, {}).update(latencies)
+                elif isinstance(settings.get(key), dict):
+                    settings[key].update(value)
+                else:
+                    settings[key] = value
+    settings.update({k: v for k, v in overrides.items() if v is not None})
+    if settings.get("terraform", STUB_TERRAFORM) not in TERRAFORM_MODES:
+        raise ValueError(
+            f"unknown simulated terraform {settings['terraform']}, expected one of {TERRAFORM_MODES}"
+        )
+    return SimulationSettings(**settings)
+
+
+def is_simulated_cohort(cohort: str) -> bool:
+    return cohort.startswith(SIMULATED_COHORT)
+
+
+class Recordings(object):
+    # real outputs to replay, <recordings_dir>/<kind>/*.txt, one of a kind's recordings is picked per command
+    def __init__(self, recordings_dir: str):
+        self.outputs: Dict[str, List[str]] = {}
+        for path in sorted(glob.glob(os.path.join(recordings_dir, "*", "*.txt"))):
+            kind = os.path.basename(os.path.dirname(path))
+            with open(path, "r", encoding="utf-8") as fp:
+                self.outputs.setdefault(kind, []).append(fp.read())
+
+    def replay(self, kind: str) -> str:
+        outputs = self.outputs.get(kind)
+        if not outputs:
+            return ""
+        return random.choice(outputs)
+
+
+_recordings = {}
+_recordings_lock = threading.Lock()
+
+
+def get_recordings(recordings_dir: str) -> Recordings:
+    # read once per process, every simulated host replays from the same set
+    with _recordings_lock:
+        if recordings_dir not in _recordings:
+            _recordings[recordings_dir] = Recordings(recordings_dir)
+        return _recordings[recordings_dir]
+
+
+# what wraps the program a benchmark command actually runs
+COMMAND_WRAPPERS = ["sudo", "time", "exec", "nohup"]
+
+
+def command_kind(cmd_str: str) -> str:
+    if cmd_str.startswith("(cloud-init"):
+        # READINESS_PROBE
+        return "ready"
+    if "base64" in cmd_str and "python3" in cmd_str:
+        # collect_demographics' survey script
+        return "demographics"
+    # adaptive iperf writes its pid first, `echo $$ > pidfile; exec sudo iperf ...`
+    words = cmd_str.split(";")[-1].split()
+    while len(words) > 0 and words[0] in COMMAND_WRAPPERS:
+        words = words[1:]
+    if len(words) == 0:
+        return "ssh"
+    if words[0] == "iperf" and "--server" in words:
+        return "iperf-server"
+    return words[0]
+
+
+class SimulatedHost(object):
+    # stands in for a node behind ssh, every command takes its (scaled) latency and answers with a recording
+    def __init__(self, settings: SimulationSettings, provider: str = None):
+        self.settings = settings
+        self.provider = provider
+        self.recordings = get_recordings(settings.recordings_dir)
+        self.connected = False
+        # set by `kill -INT`, the running iperf client then prints the rest of its output right away
+        self.interrupted = threading.Event()
+
+    def demographics_records(self, cmd_str: str) -> str:
+        # what terraform/collect-demographics.py streams back, `<name>\t<stream>\t<line>` records
+        name_cmds = json.loads(base64.b64decode(cmd_str.split()[-1]).decode("utf-8"))
+        records = [f"\thostname\t{self.hostname()}\n"]
+        for name in name_cmds:
+            for line in self.recordings.replay(name).splitlines():
+                records.append(f"{name}\tstdout\t{line}\n")
+            records.append(f"{name}\texit\t0 0.000\n")
+        return "".join(records)
+
+    def hostname(self) -> str:
+        return f"simulated-{self.provider}"
+
+    def respond(self, cmd_str: str) -> Tuple[int, str, str, float]:
+        # (return code, stdout, stderr, seconds it takes)
+        kind = command_kind(cmd_str)
+        seconds = self.settings.latency(kind, self.provider)
+        if self.settings.fails("ssh"):
+            self.connected = False
+            return (
+                255,
+                "",
+                "Connection to 127.0.0.1 closed by remote host.\n",
+                self.settings.latency("ssh", self.provider),
+            )
+        if kind == "kill":
+            self.interrupted.set()
+            return 0, "", "", seconds
+        if kind == "iperf-server":
+            return 0, f"{random.randint(1000, 65000)}\n", "", seconds
+        if kind == "hostname":
+            return 0, self.hostname() + "\n", "", seconds
+        if kind == "demographics":
+            return 0, self.demographics_records(cmd_str), "", seconds
+        return 0, self.recordings.replay(kind), "", seconds
+
+    def run(self, cmd_str: str) -> Tuple[int, bytes, bytes]:
+        return_code, stdout, stderr, seconds = self.respond(cmd_str)
+        time.sleep(seconds)
+        return return_code, stdout.encode("utf-8"), stderr.encode("utf-8")
+
+    def stream(
+        self,
+        cmd_str: str,
+        on_stdout: Callable[[str], None],
+        on_stderr: Callable[[str], None],
+    ) -> Tuple[int, int]:
+        # (return code, stdout lines), the lines trickle in over the command's latency
+        # the way ping prints one a second
+        if command_kind(cmd_str) == "iperf":
+            self.interrupted.clear()
+        return_code, stdout, stderr, seconds = self.respond(cmd_str)
+        lines = stdout.splitlines(keepends=True)
+        if len(lines) == 0:
+            time.sleep(seconds)
+        for line in lines:
+            if not self.interrupted.is_set():
+                time.sleep(seconds / len(lines))
+            on_stdout(line)
+        for line in stderr.splitlines(keepends=True):
+            on_stderr(line)
+        return return_code, len(lines)
+
+
+def create_stub_workdir(run_dir: str) -> TerraformWorkdir:
+    # the stub has nothing to init or link, an empty dir is all its state needs
+    os.makedirs(run_dir, exist_ok=True)
+    return TerraformWorkdir(os.path.abspath(run_dir), STUB_TERRAFORM, 0.0, 0.0)
+
+
+class SimulatedTerraform(Terraform):
+    # init/plan/apply/destroy only take their (scaled) latency, apply's state has the outputs main.tf
+    # gets from terraform/modules/null, except for the run's own providers, regions and zones
+    def __init__(self, providers: List[str], settings: SimulationSettings, **kwargs):
+        self.providers = providers
+        self.settings = settings
+        super().__init__(**kwargs)
+
+    def write_state(self, outputs: Dict):
+        state = {"version": 4, "outputs": outputs, "resources": []}
+        with open(os.path.join(self.working_dir, "terraform.tfstate"), "w") as fp:
+            json.dump(state, fp)
+
+    def benchmark_targets(self) -> Dict:
+        targets = {}
+        for i, (src_dst, provider) in enumerate(
+            zip(["src", "dst"], [self.providers[0], self.providers[-1]])
+        ):
+            key_file = f"id_rsa-{i}"
+            with open(os.path.join(self.working_dir, key_file), "w") as fp:
+                fp.write("simulated\n")
+            targets[src_dst] = {
+                "ip_address": "127.0.0.1",
+                "private_ip_address": "127.0.0.1",
+                "region": self.variables.get(f"{src_dst}_region"),
+                "zone": self.variables.get(f"{src_dst}_zone"),
+                "provider": provider,
+                "src_dst": src_dst,
+                "ssh_private_key": f"./{key_file}",
+                "uuid_partial": self.variables.get("uuid_partial"),
+            }
+        return {"benchmark_targets": {"value": targets, "type": "object"}}
+
+    def cmd(self, cmd, *args, **kwargs):
+        capture_output = kwargs.pop("capture_output", True)
+        kwargs.pop("raise_on_error", None)
+        # the slowest host holds the command up, same as a real apply across two providers
+        time.sleep(max(self.settings.latency(cmd, p) for p in self.providers))
+
+        if self.settings.fails(cmd):
+            return_code, stdout = 1, ""
+            stderr = f"Error: simulated {cmd} failure on {', '.join(self.providers)}\n"
+        else:
+            return_code, stderr = 0, ""
+            stdout = f"Simulated {cmd} of {', '.join(self.providers)} complete\n"
+        if cmd == "plan" and return_code == 0 and kwargs.get("out") is not None:
+            with open(os.path.join(self.working_dir, kwargs["out"]), "w") as fp:
+                fp.write(json.dumps(self.variables))
+        elif cmd == "apply":
+            # a failed apply still leaves a state behind, just without outputs
+            self.write_state(self.benchmark_targets() if return_code == 0 else {})
+        elif cmd == "destroy" and return_code == 0:
+            self.write_state({})
+        self.read_state_file()
+
+        if capture_output is not True:
+            print(stdout, end="", flush=True)
+            return return_code, None, None
+        return return_code, stdout, stderr
+
+
+def simulated_combos(count: int, providers: List[str], seed: int = 0) -> List[str]:
+    # count distinct combos between made-up regions, about as many intra-region ones as a real cohort.
+    # zones are pinned so decode_combo_str never needs the region catalog
+    regions = 1
+    while len(providers) * regions * (len(providers) * regions + 1) // 2 < 2 * count:
+        regions += 1
+    hosts = [
+        f"{provider}+sim{r:03d}[sim{r:03d}a]"
+        for r in range(regions)
+        for provider in providers
+    ]
+    rng = random.Random(seed)
+    combos = []
+    seen = set()
+    while len(combos) < count:
+        src, dst = sorted([rng.randrange(len(hosts)), rng.randrange(len(hosts))])
+        if (src, dst) not in seen:
+            seen.add((src, dst))
+            combos.append(f"{hosts[src]}_{hosts[dst]}")
+    return combos
+
+
+def run_latencies(spans: Iterator[Dict]) -> Dict:
+    # tail latency of whole runs, from the "run" span every BenchmarkRunner emits last
+    seconds = []
+    errors = 0
+    for span in spans:
+        if span["name"] != "run":
+            continue
+        seconds.append(span["seconds"])
+        if span["status"] != "ok":
+            errors += 1
+    if len(seconds) == 0:
+        return {"runs": 0, "errors": 0}
+    seconds = np.array(seconds)
+    return {
+        "runs": len(seconds),
+        "errors": errors,
+        "total_seconds": float(seconds.sum()),
+        "p50": float(np.percentile(seconds, 50)),
+        "p95": float(np.percentile(seconds, 95)),
+        "p99": float(np.percentile(seconds, 99)),
+        "max": float(seconds.max()),
+    }
+
+
+def record_bench_result(result: Dict, report_file: str = BENCH_REPORT_FILE):
+    os.makedirs(os.path.dirname(report_file), exist_ok=True)
+    with open(report_file, "a", encoding="utf-8") as fp:
+        fp.write(json.dumps(result) + "\n")
@@ -0,0 +1,300 @@
+import glob
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from flask import Flask, Response, jsonify
+from werkzeug.serving import make_server
+
+from tracing import span_providers
+
+STATUS_DB = "status.sqlite"
+# phases run from well under a second (keygen_reset) to an hour (azure apply/destroy)
+PHASE_BUCKETS = [0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600]
+
+
+class RunStatusBoard(object):
+    # which phase every run of the cohort is in, written by the runners (any process, any thread)
+    # and read by the status server in the orchestrator
+    def __init__(self, cohort_dir: str):
+        os.makedirs(cohort_dir, exist_ok=True)
+        self.path = os.path.join(cohort_dir, STATUS_DB)
+        self.db = sqlite3.connect(
+            self.path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS runs (
+                uuid TEXT PRIMARY KEY,
+                combo TEXT NOT NULL,
+                providers TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                phase TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                phase_started_at REAL NOT NULL,
+                finished_at REAL,
+                status TEXT NOT NULL DEFAULT 'running'
+            )"""
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS runs_status ON runs (status)")
+        self.lock = threading.Lock()
+
+    def _execute(self, sql: str, params: Tuple = ()):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def start(self, uuid: str, combo: str, providers: List[str]):
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO runs (uuid, combo, providers, owner, phase, started_at, phase_started_at) "
+            "VALUES (?, ?, ?, ?, 'starting', ?, ?)",
+            (
+                uuid,
+                combo,
+                json.dumps(providers),
+                f"{socket.gethostname()}:{os.getpid()}",
+                now,
+                now,
+            ),
+        )
+
+    def phase(self, uuid: str, phase: str):
+        self._execute(
+            "UPDATE runs SET phase = ?, phase_started_at = ? WHERE uuid = ?",
+            (phase, time.time(), uuid),
+        )
+
+    def finish(self, uuid: str, status: str):
+        self._execute(
+            "UPDATE runs SET phase = 'done', status = ?, finished_at = ? WHERE uuid = ?",
+            (status, time.time(), uuid),
+        )
+
+    def in_flight(self) -> List[Dict]:
+        now = time.time()
+        runs = []
+        for row in self._execute(
+            "SELECT uuid, combo, owner, phase, started_at, phase_started_at FROM runs "
+            "WHERE status = 'running' ORDER BY started_at"
+        ):
+            uuid, combo, owner, phase, started_at, phase_started_at = row
+            if not owner_alive(owner):
+                # the orchestrator died under it, the teardown ledger has whatever it left behind
+                continue
+            runs.append(
+                {
+                    "uuid": uuid,
+                    "combo": combo,
+                    "owner": owner,
+                    "phase": phase,
+                    "run_seconds": now - started_at,
+                    "phase_seconds": now - phase_started_at,
+                }
+            )
+        return runs
+
+    def finished(self) -> Dict[str, Dict[str, int]]:
+        # provider -> status -> runs, a run counts for each of its providers
+        counts = {}
+        for providers, status, runs in self._execute(
+            "SELECT providers, status, COUNT(*) FROM runs WHERE status != 'running' GROUP BY providers, status"
+        ):
+            for provider in json.loads(providers):
+                by_status = counts.setdefault(provider, {"ok": 0, "error": 0})
+                by_status[status] = by_status.get(status, 0) + runs
+        return counts
+
+
+def owner_alive(owner: str) -> bool:
+    # only runs of this box can be checked, anything else is taken at its word
+    hostname, _, pid = owner.rpartition(":")
+    if hostname != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        pass
+    return True
+
+
+class PhaseHistograms(object):
+    # tails the cohort's trace files, only the lines written since the last scrape are read
+    def __init__(self, trace_dir: str, buckets: List[float] = PHASE_BUCKETS):
+        self.trace_dir = trace_dir
+        self.buckets = buckets
+        self.offsets = {}
+        self.durations: Dict[Tuple[str, str], List[float]] = {}
+        self.lock = threading.Lock()
+
+    def _observe(self, span: Dict):
+        for provider in span_providers(span):
+            self.durations.setdefault((span["name"], provider), []).append(
+                span["seconds"]
+            )
+
+    def update(self):
+        with self.lock:
+            for path in glob.glob(os.path.join(self.trace_dir, "*.jsonl")):
+                offset = self.offsets.get(path, 0)
+                if os.path.getsize(path) <= offset:
+                    continue
+                with open(path, "r", encoding="utf-8") as fp:
+                    fp.seek(offset)
+                    for line in iter(fp.readline, ""):
+                        if not line.endswith("\n"):
+                            # still being written, pick it up next time
+                            break
+                        offset += len(line.encode("utf-8"))
+                        try:
+                            self._observe(json.loads(line))
+                        except (ValueError, KeyError):
+                            continue
+                self.offsets[path] = offset
+
+    def histograms(self) -> Dict[Tuple[str, str], Tuple[List[int], float, int]]:
+        # (name, provider) -> (cumulative bucket counts, sum, count)
+        self.update()
+        with self.lock:
+            histograms = {}
+            for key, seconds in sorted(self.durations.items()):
+                seconds = np.array(seconds)
+                cumulative = [int((seconds <= le).sum()) for le in self.buckets]
+                histograms[key] = (cumulative, float(seconds.sum()), len(seconds))
+            return histograms
+
+    def percentiles(self) -> Dict[str, Dict[str, Dict]]:
+        self.update()
+        with self.lock:
+            phases = {}
+            for (name, provider), seconds in sorted(self.durations.items()):
+                seconds = np.array(seconds)
+                phases.setdefault(name, {})[provider] = {
+                    "count": len(seconds),
+                    "p50": float(np.percentile(seconds, 50)),
+                    "p95": float(np.percentile(seconds, 95)),
+                    "max": float(seconds.max()),
+                }
+            return phases
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{escape_label(v)}"' for k, v in labels.items()) + "}"
+
+
+def render_prometheus(status: Dict, histograms, buckets: List[float]) -> str:
+    lines = [
+        "# HELP pyterra_queue_depth Combos waiting to be started",
+        "# TYPE pyterra_queue_depth gauge",
+        f"pyterra_queue_depth {status['queue_depth']}",
+        "# HELP pyterra_workers Runs the orchestrator keeps in flight",
+        "# TYPE pyterra_workers gauge",
+        f"pyterra_workers {status['workers']}",
+        "# HELP pyterra_runs_in_flight Runs in flight by phase",
+        "# TYPE pyterra_runs_in_flight gauge",
+    ]
+    by_phase = {}
+    for run in status["in_flight"]:
+        by_phase[run["phase"]] = by_phase.get(run["phase"], 0) + 1
+    for phase, runs in sorted(by_phase.items()):
+        lines.append(f"pyterra_runs_in_flight{prometheus_labels(phase=phase)} {runs}")
+
+    lines += [
+        "# HELP pyterra_runs_finished_total Finished runs by provider and status",
+        "# TYPE pyterra_runs_finished_total counter",
+    ]
+    for provider, by_status in sorted(status["finished"].items()):
+        for s, runs in sorted(by_status.items()):
+            lines.append(
+                f"pyterra_runs_finished_total{prometheus_labels(provider=provider, status=s)} {runs}"
+            )
+
+    lines += [
+        "# HELP pyterra_teardowns Handed off destroys by state",
+        "# TYPE pyterra_teardowns gauge",
+    ]
+    for state, count in sorted(status["teardowns"].items()):
+        lines.append(f"pyterra_teardowns{prometheus_labels(state=state)} {count}")
+
+    lines += [
+        "# HELP pyterra_phase_seconds Run phase (trace span) durations",
+        "# TYPE pyterra_phase_seconds histogram",
+    ]
+    for (name, provider), (cumulative, total, count) in histograms.items():
+        for le, c in zip(buckets, cumulative):
+            labels = prometheus_labels(phase=name, provider=provider, le=f"{le:g}")
+            lines.append(f"pyterra_phase_seconds_bucket{labels} {c}")
+        labels = prometheus_labels(phase=name, provider=provider, le="+Inf")
+        lines.append(f"pyterra_phase_seconds_bucket{labels} {count}")
+        labels = prometheus_labels(phase=name, provider=provider)
+        lines.append(f"pyterra_phase_seconds_sum{labels} {total}")
+        lines.append(f"pyterra_phase_seconds_count{labels} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def build_status_app(
+    cohort: str,
+    board: RunStatusBoard,
+    phases: PhaseHistograms,
+    queue_depth: Callable[[], int],
+    workers: int,
+    teardowns: Callable[[], Dict[str, int]],
+) -> Flask:
+    app = Flask("pyterra-status")
+
+    def status() -> Dict:
+        return {
+            "cohort": cohort,
+            "at": time.time(),
+            "queue_depth": queue_depth(),
+            "workers": workers,
+            "in_flight": board.in_flight(),
+            "finished": board.finished(),
+            "teardowns": teardowns(),
+        }
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(
+            render_prometheus(status(), phases.histograms(), phases.buckets),
+            mimetype="text/plain; version=0.0.4",
+        )
+
+    @app.route("/")
+    @app.route("/status")
+    def status_json():
+        return jsonify({**status(), "phases": phases.percentiles()})
+
+    return app
+
+
+class StatusServer(object):
+    # serves the app on a daemon thread for as long as the orchestrator runs
+    def __init__(self, app: Flask, host: str, port: int):
+        # a scraper every few seconds would drown out the runs' own output
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        self.server = make_server(host, port, app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server.host}:{self.server.port}"
+
+    def start(self) -> "StatusServer":
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.thread.join()
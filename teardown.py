@@ -0,0 +1,205 @@
+import concurrent.futures
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+# per worker process, each thread holds one `terraform destroy`
+TEARDOWN_WORKERS = 2
+DESTROY_ATTEMPTS = 3
+# linear backoff between attempts, azure in particular likes to 409 while a NIC is still detaching
+DESTROY_RETRY_SECONDS = 30
+TEARDOWN_DB = "teardown.sqlite"
+# pending rows older than this belong to an orchestrator that died mid-destroy
+STALE_PENDING_SECONDS = 60 * 60
+
+
+class Teardown(NamedTuple):
+    uuid: str
+    combo: str
+    tf_work_dir: str
+    # what the Terraform object needs to destroy again from a fresh process
+    var_file: str
+    variables: Dict
+    state: str
+    owner: str
+    attempts: int
+    handed_off_at: float
+    finished_at: Optional[float]
+    last_error: str
+
+
+class TeardownLedger(object):
+    # every handed off workdir gets a row before its destroy starts, so a crashed orchestrator
+    # leaves "pending" rows behind instead of silently leaking VMs
+    def __init__(self, cohort_dir: str):
+        os.makedirs(cohort_dir, exist_ok=True)
+        self.path = os.path.join(cohort_dir, TEARDOWN_DB)
+        self.db = sqlite3.connect(
+            self.path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS teardowns (
+                uuid TEXT PRIMARY KEY,
+                combo TEXT NOT NULL,
+                tf_work_dir TEXT NOT NULL,
+                var_file TEXT,
+                variables TEXT NOT NULL,
+                state TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                handed_off_at REAL NOT NULL,
+                finished_at REAL,
+                last_error TEXT NOT NULL DEFAULT ''
+            )"""
+        )
+        # the pool's threads share the connection
+        self.lock = threading.Lock()
+
+    def _execute(self, sql: str, params: Tuple = ()):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def add(self, uuid: str, combo: str, tf_work_dir: str, var_file: str, variables):
+        self._execute(
+            "INSERT OR REPLACE INTO teardowns (uuid, combo, tf_work_dir, var_file, variables, state, owner, handed_off_at) "
+            "VALUES (?, ?, ?, ?, ?, 'pending', ?, ?)",
+            (
+                uuid,
+                combo,
+                tf_work_dir,
+                var_file,
+                json.dumps(variables),
+                f"{socket.gethostname()}:{os.getpid()}",
+                time.time(),
+            ),
+        )
+
+    def attempt(self, uuid: str, error: str = ""):
+        self._execute(
+            "UPDATE teardowns SET attempts = attempts + 1, last_error = ? WHERE uuid = ?",
+            (error, uuid),
+        )
+
+    def finish(self, uuid: str, state: str):
+        self._execute(
+            "UPDATE teardowns SET state = ?, finished_at = ? WHERE uuid = ?",
+            (state, time.time(), uuid),
+        )
+
+    def teardowns(self, states: List[str]) -> List[Teardown]:
+        rows = self._execute(
+            "SELECT uuid, combo, tf_work_dir, var_file, variables, state, owner, attempts, "
+            "handed_off_at, finished_at, last_error FROM teardowns "
+            f"WHERE state IN ({', '.join('?' for _ in states)}) ORDER BY handed_off_at",
+            tuple(states),
+        )
+        return [Teardown(*row[:4], json.loads(row[4]), *row[5:]) for row in rows]
+
+    def needing_destroy(self, stale_seconds: float = STALE_PENDING_SECONDS):
+        # leaked, plus pending rows nobody has touched in a while
+        cutoff = time.time() - stale_seconds
+        return [
+            t
+            for t in self.teardowns(["leaked", "pending"])
+            if t.state == "leaked" or t.handed_off_at < cutoff
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        return dict(
+            self._execute("SELECT state, COUNT(*) FROM teardowns GROUP BY state")
+        )
+
+
+def destroy_with_retries(
+    ledger: TeardownLedger,
+    uuid: str,
+    destroy: Callable[[int], int],
+    attempts: int = DESTROY_ATTEMPTS,
+    retry_seconds: float = DESTROY_RETRY_SECONDS,
+) -> bool:
+    # destroy(attempt) returns terraform's return code, anything but 0 (or an exception) is retried
+    error = ""
+    for attempt in range(1, attempts + 1):
+        try:
+            return_code = destroy(attempt)
+            if return_code == 0:
+                ledger.attempt(uuid)
+                ledger.finish(uuid, "destroyed")
+                return True
+            error = f"terraform destroy exited {return_code}"
+        except Exception:
+            error = traceback.format_exc()
+        ledger.attempt(uuid, error)
+        if attempt < attempts:
+            time.sleep(retry_seconds * attempt)
+    ledger.finish(uuid, "leaked")
+    return False
+
+
+class TeardownPool(object):
+    # destroys run on a few background threads so the worker process can start its next combo
+    # hand_off blocks once every thread is busy, which keeps the number of VMs alive per worker bounded
+    def __init__(
+        self,
+        ledger: TeardownLedger,
+        workers: int = TEARDOWN_WORKERS,
+        attempts: int = DESTROY_ATTEMPTS,
+        retry_seconds: float = DESTROY_RETRY_SECONDS,
+    ):
+        self.ledger = ledger
+        self.attempts = attempts
+        self.retry_seconds = retry_seconds
+        self.slots = threading.BoundedSemaphore(workers)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="teardown"
+        )
+
+    def _teardown(self, uuid: str, destroy, after) -> bool:
+        try:
+            destroyed = destroy_with_retries(
+                self.ledger, uuid, destroy, self.attempts, self.retry_seconds
+            )
+            if after is not None:
+                after(destroyed)
+            return destroyed
+        finally:
+            self.slots.release()
+
+    def hand_off(
+        self,
+        uuid: str,
+        combo: str,
+        tf_work_dir: str,
+        var_file: str,
+        variables: Dict,
+        destroy: Callable[[int], int],
+        after: Callable[[bool], None] = None,
+    ) -> concurrent.futures.Future:
+        # after(destroyed) runs once the destroy succeeded or gave up
+        self.ledger.add(uuid, combo, tf_work_dir, var_file, variables)
+        self.slots.acquire()
+        return self.executor.submit(self._teardown, uuid, destroy, after)
+
+    def drain(self):
+        # blocks until every handed off destroy finished (or gave up)
+        self.executor.shutdown(wait=True)
+
+
+def print_teardown_stats(ledger: TeardownLedger):
+    stats = ledger.stats()
+    print(
+        "[*] Teardowns: "
+        + ", ".join(f"{count} {state}" for state, count in sorted(stats.items())),
+        flush=True,
+    )
+    if stats.get("leaked", 0) > 0:
+        print(
+            f"[!] {stats['leaked']} workdirs still hold live resources, see `teardown --retry`",
+            flush=True,
+        )
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# runs the whole hardware/network survey on the node in one invocation, streaming every command's output back
+# as it arrives, one `<name>\t<stream>\t<line>` record per line so nothing is held in memory on either end
+# a command ends with `<name>\texit\t<return code> <seconds>`, the first record is `\thostname\t<hostname>`
+# usage: collect-demographics.py <base64 encoded json of {"name": "command"}>
+import base64
+import concurrent.futures
+import json
+import subprocess
+import sys
+import threading
+import time
+
+write_lock = threading.Lock()
+
+
+def emit(name, stream, text):
+    # one whole record per write, the commands run concurrently
+    with write_lock:
+        sys.stdout.write("%s\t%s\t%s\n" % (name, stream, text.rstrip("\n")))
+        sys.stdout.flush()
+
+
+def pump(name, stream, pipe):
+    for raw in iter(pipe.readline, b""):
+        emit(name, stream, raw.decode("utf-8", errors="replace"))
+    pipe.close()
+
+
+def run_section(name, cmd):
+    start = time.time()
+    p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr_thread = threading.Thread(
+        target=pump, args=(name, "stderr", p.stderr), daemon=True
+    )
+    stderr_thread.start()
+    pump(name, "stdout", p.stdout)
+    stderr_thread.join()
+    emit(name, "exit", "%d %.3f" % (p.wait(), time.time() - start))
+
+
+if __name__ == "__main__":
+    name_cmds = json.loads(base64.b64decode(sys.argv[1]).decode("utf-8"))
+
+    emit("", "hostname", subprocess.getoutput("hostname"))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(name_cmds)) as executor:
+        futures = [executor.submit(run_section, n, c) for n, c in name_cmds.items()]
+        for future in futures:
+            future.result()
@@ -31,6 +31,8 @@ module "src" {
   label_scratch = "${var.uuid_partial}-src"
   provision_script_path = "${path.module}/provision-benchmark-node.sh"
   enable_private_networking = var.enable_private_networking
+  image = var.src_image
+  bake_image = var.bake_images
 }
 
 module "dst" {
@@ -47,6 +49,8 @@ module "dst" {
   label_scratch = "${var.uuid_partial}-dst"
   provision_script_path = "${path.module}/provision-benchmark-node.sh"
   enable_private_networking = var.enable_private_networking
+  image = var.dst_image
+  bake_image = var.bake_images
 }
 
 output "benchmark_targets" {
@@ -72,4 +76,12 @@ output "benchmark_targets" {
       uuid_partial = var.uuid_partial
     }
   }
-}
\ No newline at end of file
+}
+
+# golden images baked by this run, resources named "golden" are removed from state before destroy
+output "baked_images" {
+  value = {
+    src = module.src.image_id,
+    dst = module.dst.image_id,
+  }
+}
@@ -48,8 +48,8 @@ resource "aws_security_group" "benchmark_sg" {
   }
 }
 resource "aws_instance" "benchmark" {
-  # ubuntu 20.10 amd64 provided by Canonical
-  ami = data.aws_ami.ubuntu.id
+  # ubuntu 20.10 amd64 provided by Canonical, or a golden image baked from it
+  ami = var.image != "" ? var.image : data.aws_ami.ubuntu.id
   instance_type = "t2.micro"
   key_name = aws_key_pair.benchmark_key.key_name
   availability_zone = var.zone
@@ -83,4 +83,9 @@ resource "aws_instance" "benchmark" {
       "sudo /tmp/provision-benchmark-node.sh benchmark-testing"
     ]
   }
-}
\ No newline at end of file
+}
+resource "aws_ami_from_instance" "golden" {
+  count = var.bake_image ? 1 : 0
+  name = format("benchmark-golden-%s", var.label_scratch)
+  source_instance_id = aws_instance.benchmark.id
+}
@@ -9,4 +9,7 @@ output "region" {
 }
 output "provider" {
   value = "aws"
+}
+output "image_id" {
+  value = var.bake_image ? aws_ami_from_instance.golden[0].id : ""
 }
\ No newline at end of file
@@ -72,11 +72,16 @@ resource "azurerm_linux_virtual_machine" "benchmark" {
     storage_account_type = "Standard_LRS"
   }
 
-  source_image_reference {
-    publisher = "Canonical"
-    offer = "0001-com-ubuntu-server-groovy"
-    sku = "20_10-gen2"
-    version = "latest"
+  source_image_id = var.image != "" ? var.image : null
+
+  dynamic "source_image_reference" {
+    for_each = var.image != "" ? [] : [1]
+    content {
+      publisher = "Canonical"
+      offer = "0001-com-ubuntu-server-groovy"
+      sku = "20_10-gen2"
+      version = "latest"
+    }
   }
 
     connection {
@@ -9,4 +9,8 @@ output "region" {
 }
 output "provider" {
   value = "azure"
+}
+// azure images need a generalized (waagent -deprovision) VM, nothing is baked yet
+output "image_id" {
+  value = ""
 }
\ No newline at end of file
@@ -6,4 +6,11 @@ variable "label_scratch" {}
 variable "provision_script_path" {}
 variable "enable_private_networking" {type = bool}
 variable "aws_access_key" {}
-variable "aws_secret_key" {}
\ No newline at end of file
+variable "aws_secret_key" {}
+# golden image to boot from, "" boots the stock image and provisions it from scratch
+variable "image" {default = ""}
+# snapshot this node into a golden image once it's provisioned, see imagecache.py
+variable "bake_image" {
+  type = bool
+  default = false
+}
\ No newline at end of file
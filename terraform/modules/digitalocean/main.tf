@@ -3,7 +3,7 @@ resource "digitalocean_ssh_key" "ssh_key" {
   public_key = var.public_key
 }
 resource "digitalocean_droplet" "benchmark" {
-  image = "ubuntu-20-10-x64"
+  image = var.image != "" ? var.image : "ubuntu-20-10-x64"
   name = format("benchmark-%s", var.label_scratch)
   region = var.region
   size = "s-1vcpu-1gb"
@@ -41,4 +41,10 @@ resource "digitalocean_droplet" "benchmark" {
       "/tmp/provision-benchmark-node.sh benchmark-${var.label_scratch}"
     ]
   }
-}
\ No newline at end of file
+}
+
+resource "digitalocean_droplet_snapshot" "golden" {
+  count = var.bake_image ? 1 : 0
+  name = format("benchmark-golden-%s", var.label_scratch)
+  droplet_id = digitalocean_droplet.benchmark.id
+}
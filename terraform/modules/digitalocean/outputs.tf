@@ -9,4 +9,7 @@ output "region" {
 }
 output "provider" {
   value = "digitalocean"
+}
+output "image_id" {
+  value = var.bake_image ? digitalocean_droplet_snapshot.golden[0].id : ""
 }
\ No newline at end of file
@@ -36,7 +36,7 @@ resource "google_compute_instance" "benchmark" {
 
   boot_disk {
     initialize_params {
-      image = "ubuntu-2010-groovy-v20210119a"
+      image = var.image != "" ? var.image : "ubuntu-2010-groovy-v20210119a"
     }
   }
 
@@ -75,4 +75,18 @@ resource "google_compute_instance" "benchmark" {
       "/tmp/provision-benchmark-node.sh benchmark-${var.label_scratch}"
     ]
   }
-}
\ No newline at end of file
+}
+
+// images can't be created from a disk that's still attached, snapshots can
+resource "google_compute_snapshot" "golden_snapshot" {
+  count = var.bake_image ? 1 : 0
+  name = format("benchmark-golden-%s", var.label_scratch)
+  source_disk = google_compute_instance.benchmark.boot_disk.0.source
+  zone = var.zone
+}
+
+resource "google_compute_image" "golden" {
+  count = var.bake_image ? 1 : 0
+  name = format("benchmark-golden-%s", var.label_scratch)
+  source_snapshot = google_compute_snapshot.golden_snapshot[0].self_link
+}
@@ -9,4 +9,7 @@ output "region" {
 }
 output "provider" {
   value = "gcp"
+}
+output "image_id" {
+  value = var.bake_image ? google_compute_image.golden[0].self_link : ""
 }
\ No newline at end of file
@@ -3,7 +3,7 @@ resource "linode_sshkey" "ssh_key" {
   ssh_key = chomp(var.public_key)
 }
 resource "linode_instance" "benchmark" {
-  image = "linode/ubuntu20.10"
+  image = var.image != "" ? var.image : "linode/ubuntu20.10"
   label = format("benchmark-%s", var.label_scratch)
   region = var.region
   type = "g6-nanode-1"
@@ -40,4 +40,11 @@ resource "linode_instance" "benchmark" {
       "~/provision-benchmark-node.sh benchmark-${var.label_scratch}"
     ]
   }
-}
\ No newline at end of file
+}
+
+resource "linode_image" "golden" {
+  count = var.bake_image ? 1 : 0
+  label = format("benchmark-golden-%s", var.label_scratch)
+  linode_id = linode_instance.benchmark.id
+  disk_id = linode_instance.benchmark.disk.0.id
+}
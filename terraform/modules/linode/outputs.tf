@@ -9,4 +9,7 @@ output "region" {
 }
 output "provider" {
   value = "linode"
+}
+output "image_id" {
+  value = var.bake_image ? linode_image.golden[0].id : ""
 }
\ No newline at end of file
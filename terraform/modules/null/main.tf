@@ -1,4 +1,6 @@
-
+# stands in for a cloud module in simulated runs (see simulation.py), both nodes are this box
 resource "null_resource" "benchmark" {
-
-}
\ No newline at end of file
+  triggers = {
+    label = var.label_scratch
+  }
+}
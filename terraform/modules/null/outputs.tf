@@ -5,8 +5,11 @@ output "private_ip_address" {
   value = "127.0.0.1"
 }
 output "region" {
-  value = "localhost"
+  value = var.region
 }
 output "provider" {
   value = "null"
+}
+output "image_id" {
+  value = ""
 }
\ No newline at end of file
@@ -1,6 +1,16 @@
 variable "region" {}
+variable "zone" {default = null}
 variable "public_key" {}
 variable "private_key" {}
 variable "label_scratch" {}
 variable "provision_script_path" {}
-variable "enable_private_networking" {type = bool}
\ No newline at end of file
+variable "enable_private_networking" {type = bool}
+variable "aws_access_key" {default = ""}
+variable "aws_secret_key" {default = ""}
+# golden image to boot from, "" boots the stock image and provisions it from scratch
+variable "image" {default = ""}
+# snapshot this node into a golden image once it's provisioned, see imagecache.py
+variable "bake_image" {
+  type = bool
+  default = false
+}
\ No newline at end of file
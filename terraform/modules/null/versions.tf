@@ -1,6 +1,6 @@
 terraform {
   required_providers {
-    linode = {
+    null = {
       source = "hashicorp/null"
     }
   }
@@ -11,7 +11,8 @@ resource "vultr_instance" "benchmark" {
   # https://api.vultr.com/v2/plans
   plan = "vc2-1c-1gb" # 1024 MB RAM,25 GB SSD,1.00 TB BW
   # https://api.vultr.com/v2/os
-  os_id = "413" # ubuntu 20.10 x64
+  os_id = var.image != "" ? null : "413" # ubuntu 20.10 x64
+  snapshot_id = var.image != "" ? var.image : null
 
 //  tag = "tag"
 
@@ -63,4 +64,10 @@ resource "vultr_instance" "benchmark" {
       "/tmp/provision-benchmark-node.sh benchmark-${var.label_scratch}"
     ]
   }
-}
\ No newline at end of file
+}
+
+resource "vultr_snapshot" "golden" {
+  count = var.bake_image ? 1 : 0
+  description = format("benchmark-golden-%s", var.label_scratch)
+  instance_id = vultr_instance.benchmark.id
+}
@@ -34,4 +34,17 @@ variable "uuid_partial" {
 }
 variable "enable_private_networking" {
   type = bool
-}
\ No newline at end of file
+}
+# golden images from the image catalog, "" provisions the stock image from scratch
+variable "src_image" {
+  type = string
+  default = ""
+}
+variable "dst_image" {
+  type = string
+  default = ""
+}
+variable "bake_images" {
+  type = bool
+  default = false
+}
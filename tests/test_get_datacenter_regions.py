@@ -0,0 +1,181 @@
+import asyncio
+import json
+import os
+import threading
+import types
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+import get_datacenter_regions
+from get_datacenter_regions import fetch_cached
+
+TTL = 60
+BODY = b'{"data": [{"id": "us-east"}]}'
+
+
+class Clock(object):
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class MockProvider(object):
+    # a local provider api, answers with whatever body/etag/status the test set last
+    def __init__(self):
+        self.body = BODY
+        self.etag = '"v1"'
+        self.status = 200
+        self.requests = []
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests.append(dict(request.headers))
+        if self.status != 200:
+            return web.Response(status=self.status)
+        if request.headers.get("If-None-Match") == self.etag:
+            return web.Response(status=304)
+        return web.Response(body=self.body, headers={"ETag": self.etag})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(
+        get_datacenter_regions, "time", types.SimpleNamespace(time=clock.time)
+    )
+    return clock
+
+
+@pytest.fixture
+def cache_dir(monkeypatch, tmp_path):
+    cache_dir = str(tmp_path / "http")
+    monkeypatch.setattr(get_datacenter_regions, "HTTP_CACHE_DIR", cache_dir)
+    return cache_dir
+
+
+class MockServer(object):
+    # serves a MockProvider from its own loop/thread, so the url (and its cache entry) stays the same
+    # across fetches the way a real provider's does
+    def __init__(self, provider: MockProvider):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        app = web.Application()
+        app.router.add_get("/regions", provider.handle)
+        self.runner = web.AppRunner(app)
+        self._call(self.runner.setup())
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        self._call(site.start())
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/regions"
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def stop(self):
+        if self.runner is not None:
+            self._call(self.runner.cleanup())
+            self.runner = None
+
+    def close(self):
+        self.stop()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+@pytest.fixture
+def provider():
+    return MockProvider()
+
+
+@pytest.fixture
+def server(provider):
+    server = MockServer(provider)
+    yield server
+    server.close()
+
+
+def fetch(server: MockServer, ttl: float = TTL) -> bytes:
+    async def run():
+        async with aiohttp.ClientSession() as session:
+            return await fetch_cached(session, "linode", server.url, ttl=ttl)
+
+    return asyncio.run(run())
+
+
+def cached_meta(cache_dir: str) -> dict:
+    with open(os.path.join(cache_dir, "linode.meta.json"), "r") as fp:
+        return json.load(fp)
+
+
+def test_fresh_fetch_is_cached(clock, cache_dir, provider, server):
+    assert fetch(server) == BODY
+    assert len(provider.requests) == 1
+    assert "If-None-Match" not in provider.requests[0]
+    assert cached_meta(cache_dir)["etag"] == '"v1"'
+
+    # within the ttl the provider isn't asked at all
+    clock.advance(TTL - 1)
+    assert fetch(server) == BODY
+    assert len(provider.requests) == 1
+
+
+def test_expired_cache_revalidates_with_etag(clock, cache_dir, provider, server):
+    fetch(server)
+
+    clock.advance(TTL + 1)
+    assert fetch(server) == BODY
+    assert len(provider.requests) == 2
+    assert provider.requests[1]["If-None-Match"] == '"v1"'
+    # a 304 restarts the ttl
+    assert cached_meta(cache_dir)["fetched_at"] == clock.now
+    assert fetch(server) == BODY
+    assert len(provider.requests) == 2
+
+
+def test_expired_cache_picks_up_changes(clock, cache_dir, provider, server):
+    fetch(server)
+
+    provider.body = b'{"data": [{"id": "us-east"}, {"id": "eu-west"}]}'
+    provider.etag = '"v2"'
+    clock.advance(TTL + 1)
+    assert fetch(server) == provider.body
+    assert cached_meta(cache_dir)["etag"] == '"v2"'
+
+
+def test_zero_ttl_always_revalidates(clock, cache_dir, provider, server):
+    fetch(server, ttl=0)
+    fetch(server, ttl=0)
+    assert len(provider.requests) == 2
+
+
+def test_error_falls_back_to_stale_cache(clock, cache_dir, provider, server):
+    fetch(server)
+
+    clock.advance(TTL + 1)
+    provider.status = 500
+    assert fetch(server) == BODY
+    assert len(provider.requests) == 2
+    # the stale copy keeps its age, the next run asks again
+    assert cached_meta(cache_dir)["fetched_at"] == 1000.0
+
+
+def test_unreachable_provider_falls_back_to_stale_cache(clock, cache_dir, server):
+    fetch(server)
+
+    clock.advance(TTL + 1)
+    server.stop()
+    assert fetch(server) == BODY
+
+
+def test_error_without_cache_raises(clock, cache_dir, provider, server):
+    provider.status = 500
+    with pytest.raises(aiohttp.ClientResponseError):
+        fetch(server)
@@ -0,0 +1,147 @@
+import types
+
+import fakeredis
+import pytest
+
+import workqueue
+from workqueue import RedisWorkQueue, SQLiteWorkQueue, backoff_seconds
+
+COMBO = "aws+us-east-1_linode+us-east"
+LEASE = 10
+
+
+class Clock(object):
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(workqueue, "time", types.SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def make_queue(request, tmp_path):
+    def make(max_attempts: int = workqueue.MAX_ATTEMPTS):
+        if request.param == "sqlite":
+            return SQLiteWorkQueue(
+                str(tmp_path / "queue.sqlite"), max_attempts=max_attempts
+            )
+        return RedisWorkQueue(fakeredis.FakeRedis(), "test", max_attempts=max_attempts)
+
+    return make
+
+
+def test_put_is_idempotent(clock, make_queue):
+    queue = make_queue()
+    assert queue.put([COMBO]) == 1
+    assert queue.put([COMBO]) == 0
+    assert queue.outstanding() == 1
+
+
+def test_complete(clock, make_queue):
+    queue = make_queue()
+    queue.put([COMBO])
+    lease = queue.lease("a", lease_seconds=LEASE)
+    assert lease.combo == COMBO and lease.attempt == 1
+    queue.complete(lease)
+    assert queue.outstanding() == 0
+    assert queue.lease("b", lease_seconds=LEASE) is None
+    assert queue.stats()["aws"]["completed"] == 1
+
+
+def test_expired_lease_is_reclaimed(clock, make_queue):
+    queue = make_queue()
+    queue.put([COMBO])
+    lease = queue.lease("a", lease_seconds=LEASE)
+    assert queue.lease("b", lease_seconds=LEASE) is None
+
+    clock.advance(LEASE + 1)
+    stolen = queue.lease("b", lease_seconds=LEASE)
+    assert stolen.combo == COMBO
+    assert stolen.owner == "b"
+    assert stolen.attempt == 2
+    # the crashed owner can no longer keep it alive
+    assert not queue.heartbeat(lease, lease_seconds=LEASE)
+
+
+def test_expired_lease_cannot_complete(clock, make_queue):
+    queue = make_queue()
+    queue.put([COMBO])
+    lease = queue.lease("a", lease_seconds=LEASE)
+
+    clock.advance(LEASE + 1)
+    stolen = queue.lease("b", lease_seconds=LEASE)
+    queue.complete(lease)
+    assert queue.outstanding() == 1
+    assert queue.heartbeat(stolen, lease_seconds=LEASE)
+    queue.complete(stolen)
+    assert queue.outstanding() == 0
+
+
+def test_heartbeat_extends_lease(clock, make_queue):
+    queue = make_queue()
+    queue.put([COMBO])
+    lease = queue.lease("a", lease_seconds=LEASE)
+    for _ in range(3):
+        clock.advance(LEASE - 1)
+        assert queue.heartbeat(lease, lease_seconds=LEASE)
+        assert queue.lease("b", lease_seconds=LEASE) is None
+
+
+def test_failure_backs_off_before_retry(clock, make_queue):
+    queue = make_queue()
+    queue.put([COMBO])
+
+    for attempt in [1, 2]:
+        lease = queue.lease("a", lease_seconds=LEASE)
+        assert lease.attempt == attempt
+        queue.fail(lease, "apply failed")
+        assert queue.outstanding() == 1
+
+        clock.advance(backoff_seconds(attempt) - 1)
+        assert queue.lease("a", lease_seconds=LEASE) is None
+        clock.advance(1)
+
+    assert backoff_seconds(2) == 2 * backoff_seconds(1)
+    assert queue.lease("a", lease_seconds=LEASE).attempt == 3
+
+
+def test_failures_dead_letter_after_max_attempts(clock, make_queue):
+    queue = make_queue(max_attempts=2)
+    queue.put([COMBO])
+
+    queue.fail(queue.lease("a", lease_seconds=LEASE), "apply failed")
+    clock.advance(backoff_seconds(1))
+    queue.fail(queue.lease("a", lease_seconds=LEASE), "ping failed")
+
+    assert queue.dead_letters() == {COMBO: "ping failed"}
+    assert queue.outstanding() == 0
+    clock.advance(workqueue.BACKOFF_MAX_SECONDS)
+    assert queue.lease("a", lease_seconds=LEASE) is None
+    assert queue.stats()["aws"]["dead"] == 1
+
+
+def test_expired_last_attempt_dead_letters(clock, make_queue):
+    queue = make_queue(max_attempts=1)
+    queue.put([COMBO])
+    queue.lease("a", lease_seconds=LEASE)
+
+    clock.advance(LEASE + 1)
+    assert queue.lease("b", lease_seconds=LEASE) is None
+    assert queue.dead_letters() == {COMBO: "lease expired"}
+
+
+def test_release_does_not_count_an_attempt(clock, make_queue):
+    queue = make_queue()
+    queue.put([COMBO])
+    queue.release(queue.lease("a", lease_seconds=LEASE))
+    assert queue.lease("b", lease_seconds=LEASE).attempt == 1
@@ -0,0 +1,226 @@
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import List, NamedTuple, Tuple
+
+from python_terraform import Terraform
+
+try:
+    import fcntl
+except ImportError:
+    # windows
+    fcntl = None
+    import msvcrt
+
+
+# run artifacts and local state that must never leak from the source tree into a template
+SOURCE_EXCLUDES = [
+    "__pycache__",
+    ".terraform",
+    ".terraform.lock.hcl",
+    "terraform.tfstate",
+    "terraform.tfstate.backup",
+    "terraform.tfvars",
+]
+# the only files that get a real per-run copy, everything else is linked to the template
+MATERIALIZED = ["main.tf", "terraform.tfvars"]
+INIT_STATS_FILENAME = ".init_stats.json"
+
+
+class TerraformWorkdir(NamedTuple):
+    path: str
+    template: str
+    init_seconds: float
+    overlay_seconds: float
+    # true when this run had to build (and pay the init for) the template itself
+    built_template: bool = False
+
+    @property
+    def seconds_saved(self) -> float:
+        if self.built_template:
+            return 0.0
+        return max(self.init_seconds - self.overlay_seconds, 0.0)
+
+
+def render_main_tf(main_tf: str, providers: List[str]) -> str:
+    # Do string substitution on the main Terraform file.
+    #
+    # This isn't great but is a "solution" to the problem that Terraform doesn't allow module sources to be variables/interpolated.
+    # An alternative method would be to make main.tf a jinja2 template and render it, but then editing the main.tf becomes
+    # a pain in any IDE since it will be treated either as a jinja2 template and lose intellisense, or like a Terraform file
+    # which has syntax errors onlines like `source = {{ module_src }}`.
+    for provider in providers:
+        main_tf = main_tf.replace(
+            'source = "./modules/null"', f'source = "./modules/{provider}"', 1
+        )
+    return main_tf
+
+
+@contextlib.contextmanager
+def file_lock(lock_path: str):
+    # serializes template builds (and so plugin cache writes, which terraform doesn't make concurrency safe)
+    # across the ProcessPoolExecutor workers
+    with open(lock_path, "a+") as fp:
+        if fcntl is not None:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+        else:
+            fp.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(fp.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+            else:
+                fp.seek(0)
+                msvcrt.locking(fp.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def link_path(src: str, dst: str):
+    try:
+        os.symlink(src, dst, target_is_directory=os.path.isdir(src))
+    except OSError:
+        # windows without developer mode can't symlink, hardlink files and copy directories instead
+        if os.path.isdir(src):
+            shutil.copytree(src, dst, symlinks=True)
+        else:
+            os.link(src, dst)
+
+
+class TerraformWorkdirFactory(object):
+    source_dir: str
+    root_dir: str
+    plugin_cache_dir: str
+
+    def __init__(self, source_dir: str, root_dir: str):
+        self.source_dir = os.path.abspath(source_dir)
+        self.root_dir = os.path.abspath(root_dir)
+        self.templates_dir = os.path.join(self.root_dir, "templates")
+        self.plugin_cache_dir = os.path.join(self.root_dir, "plugin-cache")
+        self._source_hash = None
+
+        for d in [self.templates_dir, self.plugin_cache_dir]:
+            if not os.path.exists(d):
+                os.makedirs(d, exist_ok=True)
+
+        # python_terraform passes our environment through to every terraform call,
+        # so every init shares one provider download cache
+        os.environ.setdefault("TF_PLUGIN_CACHE_DIR", self.plugin_cache_dir)
+
+    def source_files(self):
+        for dirpath, dirnames, filenames in os.walk(self.source_dir):
+            dirnames[:] = sorted(d for d in dirnames if d not in SOURCE_EXCLUDES)
+            for filename in sorted(filenames):
+                if filename in SOURCE_EXCLUDES or filename.startswith("id_rsa"):
+                    continue
+                if filename.endswith(".tfplan"):
+                    continue
+                yield os.path.join(dirpath, filename)
+
+    @property
+    def source_hash(self) -> str:
+        # templates are keyed on the source tree contents, editing a module gets a fresh template
+        if self._source_hash is None:
+            h = hashlib.sha256()
+            for filepath in self.source_files():
+                h.update(os.path.relpath(filepath, self.source_dir).encode("utf-8"))
+                with open(filepath, "rb") as fp:
+                    h.update(fp.read())
+            self._source_hash = h.hexdigest()[:12]
+        return self._source_hash
+
+    def template_dir(self, providers: List[str]) -> str:
+        return os.path.join(
+            self.templates_dir, f"{self.source_hash}-{'_'.join(providers)}"
+        )
+
+    def build_template(self, providers: List[str]) -> Tuple[str, bool]:
+        template_dir = self.template_dir(providers)
+        if os.path.exists(template_dir):
+            return (template_dir, False)
+
+        with file_lock(os.path.join(self.templates_dir, ".lock")):
+            # someone else may have built it while we were waiting on the lock
+            if os.path.exists(template_dir):
+                return (template_dir, False)
+
+            staging_dir = tempfile.mkdtemp(dir=self.templates_dir, prefix=".staging-")
+            try:
+                for filepath in self.source_files():
+                    dst = os.path.join(
+                        staging_dir, os.path.relpath(filepath, self.source_dir)
+                    )
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    shutil.copy2(filepath, dst)
+
+                main_tf_path = os.path.join(staging_dir, "main.tf")
+                with open(main_tf_path, "r") as fp:
+                    main_tf = render_main_tf(fp.read(), providers)
+                with open(main_tf_path, "w") as fp:
+                    fp.write(main_tf)
+
+                start = time.perf_counter()
+                return_code, stdout, stderr = Terraform(working_dir=staging_dir).init(
+                    capture_output=True
+                )
+                init_seconds = time.perf_counter() - start
+                if return_code != 0:
+                    raise Exception(
+                        f"terraform init failed for template {template_dir}: {stderr}"
+                    )
+
+                with open(os.path.join(staging_dir, INIT_STATS_FILENAME), "w") as fp:
+                    json.dump({"init_seconds": init_seconds}, fp)
+
+                # only ever publish a fully initialized template
+                os.rename(staging_dir, template_dir)
+            finally:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+
+        print(
+            f"[*] built terraform template {os.path.basename(template_dir)} in {init_seconds:0.2f} seconds",
+            flush=True,
+        )
+        return (template_dir, True)
+
+    def create(self, run_dir: str, providers: List[str]) -> TerraformWorkdir:
+        template_dir, built_template = self.build_template(providers)
+        with open(os.path.join(template_dir, INIT_STATS_FILENAME), "r") as fp:
+            init_seconds = json.load(fp)["init_seconds"]
+
+        start = time.perf_counter()
+        run_dir = os.path.abspath(run_dir)
+        if not os.path.exists(run_dir):
+            os.makedirs(run_dir)
+
+        for entry in os.listdir(template_dir):
+            if entry in MATERIALIZED or entry == INIT_STATS_FILENAME:
+                continue
+            link_path(os.path.join(template_dir, entry), os.path.join(run_dir, entry))
+
+        # main.tf is already rendered for this provider pair in the template
+        shutil.copy2(
+            os.path.join(template_dir, "main.tf"), os.path.join(run_dir, "main.tf")
+        )
+        # credentials aren't part of the template, always take the current ones
+        tfvars_filepath = os.path.join(self.source_dir, "terraform.tfvars")
+        if os.path.exists(tfvars_filepath):
+            shutil.copy2(tfvars_filepath, os.path.join(run_dir, "terraform.tfvars"))
+        overlay_seconds = time.perf_counter() - start
+
+        return TerraformWorkdir(
+            path=run_dir,
+            template=template_dir,
+            init_seconds=init_seconds,
+            overlay_seconds=overlay_seconds,
+            built_template=built_template,
+        )
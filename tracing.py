@@ -0,0 +1,111 @@
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+
+class Tracer(object):
+    # per-run span writer, base tags (cohort, combo, uuid, providers, regions) go on every span
+    # thread safe, the concurrent directions/traceroute variants share one tracer
+    def __init__(self, path: str = None, **tags):
+        self.path = path
+        self.tags = tags
+        self.lock = threading.Lock()
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    @contextmanager
+    def span(self, name: str, **tags):
+        start = time.time()
+        start_perf = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self.emit(name, start, time.perf_counter() - start_perf, status, tags)
+
+    def emit(self, name: str, start: float, seconds: float, status: str, tags):
+        if self.path is None:
+            return
+        line = json.dumps(
+            {
+                "name": name,
+                "start": start,
+                "seconds": seconds,
+                "status": status,
+                "tags": {**self.tags, **tags},
+            }
+        )
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as fp:
+                fp.write(line + "\n")
+
+
+# for callers outside a BenchmarkRunner, spans go nowhere
+NULL_TRACER = Tracer()
+
+
+def load_spans(trace_dir: str) -> Iterator[Dict]:
+    for path in sorted(glob.glob(os.path.join(trace_dir, "*.jsonl"))):
+        with open(path, "r", encoding="utf-8") as fp:
+            for line in fp:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # a worker killed mid-write leaves half a line
+                    continue
+
+
+def span_providers(span: Dict) -> List[str]:
+    # a span about one host counts for its provider, a span about the run counts for both
+    tags = span["tags"]
+    if "provider" in tags:
+        return [tags["provider"]]
+    return sorted(set(tags.get("providers", [])))
+
+
+def summarize_spans(spans: Iterator[Dict]) -> Dict[Tuple[str, str], Dict]:
+    durations = {}
+    errors = {}
+    for span in spans:
+        for provider in span_providers(span):
+            key = (span["name"], provider)
+            durations.setdefault(key, []).append(span["seconds"])
+            if span["status"] != "ok":
+                errors[key] = errors.get(key, 0) + 1
+
+    summary = {}
+    for key, seconds in sorted(durations.items()):
+        seconds = np.array(seconds)
+        summary[key] = {
+            "count": len(seconds),
+            "errors": errors.get(key, 0),
+            "p50": float(np.percentile(seconds, 50)),
+            "p95": float(np.percentile(seconds, 95)),
+            "max": float(seconds.max()),
+            "total": float(seconds.sum()),
+        }
+    return summary
+
+
+def print_span_summary(summary: Dict[Tuple[str, str], Dict]):
+    print(
+        f"{'phase':<28} {'provider':<14} {'count':>7} {'errors':>6} "
+        f"{'p50':>9} {'p95':>9} {'max':>9} {'total':>11}"
+    )
+    for (name, provider), s in summary.items():
+        print(
+            f"{name:<28} {provider:<14} {s['count']:>7} {s['errors']:>6} "
+            f"{s['p50']:>8.2f}s {s['p95']:>8.2f}s {s['max']:>8.2f}s {s['total']:>10.1f}s"
+        )
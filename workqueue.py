@@ -0,0 +1,455 @@
+import json
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional
+
+# a lease that isn't heartbeated within this window is considered abandoned (crashed orchestrator)
+# and the combo goes back to pending for someone else
+LEASE_SECONDS = 30 * 60
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 60
+BACKOFF_MAX_SECONDS = 60 * 60
+
+
+class Lease(NamedTuple):
+    combo: str
+    owner: str
+    attempt: int
+    expires_at: float
+
+
+def combo_providers(combo: str) -> List[str]:
+    # "aws+us-east-1_linode+us-east" -> ["aws", "linode"]
+    return sorted(set(h.split("+")[0] for h in combo.split("_")))
+
+
+def backoff_seconds(attempt: int) -> float:
+    return min(BACKOFF_BASE_SECONDS * (2 ** (attempt - 1)), BACKOFF_MAX_SECONDS)
+
+
+def summarize_jobs(jobs) -> Dict[str, Dict]:
+    # jobs: iterable of (combo, state, attempts, first_leased_at, completed_at)
+    stats = defaultdict(
+        lambda: {
+            "completed": 0,
+            "dead": 0,
+            "pending": 0,
+            "leased": 0,
+            "attempts": 0,
+            "first_leased_at": None,
+            "last_completed_at": None,
+        }
+    )
+    for combo, state, attempts, first_leased_at, completed_at in jobs:
+        for provider in combo_providers(combo):
+            s = stats[provider]
+            s[state if state != "done" else "completed"] += 1
+            s["attempts"] += attempts
+            if first_leased_at is not None and (
+                s["first_leased_at"] is None or first_leased_at < s["first_leased_at"]
+            ):
+                s["first_leased_at"] = first_leased_at
+            if completed_at is not None and (
+                s["last_completed_at"] is None or completed_at > s["last_completed_at"]
+            ):
+                s["last_completed_at"] = completed_at
+
+    for provider, s in stats.items():
+        # every attempt that didn't complete (and isn't still running) was retried or dead-lettered
+        s["failed_attempts"] = max(s["attempts"] - s["completed"] - s["leased"], 0)
+        s["retry_rate"] = (
+            s["failed_attempts"] / s["attempts"] if s["attempts"] > 0 else 0.0
+        )
+        if s["first_leased_at"] is not None and s["last_completed_at"] is not None:
+            hours = max(s["last_completed_at"] - s["first_leased_at"], 1.0) / 3600.0
+            s["runs_per_hour"] = s["completed"] / hours
+        else:
+            s["runs_per_hour"] = 0.0
+    return dict(stats)
+
+
+class WorkQueue(object):
+    max_attempts: int = MAX_ATTEMPTS
+
+    def put(self, combos: List[str]) -> int:
+        raise NotImplementedError()
+
+    def lease(
+        self, owner: str, lease_seconds: float = LEASE_SECONDS
+    ) -> Optional[Lease]:
+        raise NotImplementedError()
+
+    def heartbeat(self, lease: Lease, lease_seconds: float = LEASE_SECONDS) -> bool:
+        raise NotImplementedError()
+
+    def complete(self, lease: Lease):
+        raise NotImplementedError()
+
+    def fail(self, lease: Lease, error: str = ""):
+        raise NotImplementedError()
+
+    def release(self, lease: Lease):
+        # hand a combo back without counting it as an attempt
+        raise NotImplementedError()
+
+    def outstanding(self) -> int:
+        # pending (including backing off) + leased, i.e. "is there anything left to wait for"
+        raise NotImplementedError()
+
+    def dead_letters(self) -> Dict[str, str]:
+        raise NotImplementedError()
+
+    def stats(self) -> Dict[str, Dict]:
+        raise NotImplementedError()
+
+
+class SQLiteWorkQueue(WorkQueue):
+    # single box, any number of orchestrator processes
+    def __init__(self, path: str, max_attempts: int = MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                combo TEXT PRIMARY KEY,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL DEFAULT 0,
+                owner TEXT,
+                lease_expires_at REAL,
+                last_error TEXT,
+                first_leased_at REAL,
+                completed_at REAL
+            )"""
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, available_at)"
+        )
+
+    def put(self, combos: List[str]) -> int:
+        # re-putting a cohort is idempotent, existing combos keep their progress
+        before = self.db.total_changes
+        self.db.execute("BEGIN IMMEDIATE")
+        self.db.executemany(
+            "INSERT OR IGNORE INTO jobs (combo) VALUES (?)", [(c,) for c in combos]
+        )
+        self.db.execute("COMMIT")
+        return self.db.total_changes - before
+
+    def _reclaim_expired(self, now: float):
+        self.db.execute(
+            "UPDATE jobs SET state = 'dead', owner = NULL, last_error = 'lease expired' "
+            "WHERE state = 'leased' AND lease_expires_at < ? AND attempts >= ?",
+            (now, self.max_attempts),
+        )
+        self.db.execute(
+            "UPDATE jobs SET state = 'pending', owner = NULL, available_at = ? "
+            "WHERE state = 'leased' AND lease_expires_at < ?",
+            (now, now),
+        )
+
+    def lease(
+        self, owner: str, lease_seconds: float = LEASE_SECONDS
+    ) -> Optional[Lease]:
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self._reclaim_expired(now)
+            row = self.db.execute(
+                "SELECT combo, attempts FROM jobs WHERE state = 'pending' AND available_at <= ? "
+                "ORDER BY available_at, rowid LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                self.db.execute("COMMIT")
+                return None
+            combo, attempts = row
+            lease = Lease(
+                combo=combo,
+                owner=owner,
+                attempt=attempts + 1,
+                expires_at=now + lease_seconds,
+            )
+            self.db.execute(
+                "UPDATE jobs SET state = 'leased', owner = ?, attempts = ?, lease_expires_at = ?, "
+                "first_leased_at = COALESCE(first_leased_at, ?) WHERE combo = ?",
+                (owner, lease.attempt, lease.expires_at, now, combo),
+            )
+            self.db.execute("COMMIT")
+            return lease
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def heartbeat(self, lease: Lease, lease_seconds: float = LEASE_SECONDS) -> bool:
+        cur = self.db.execute(
+            "UPDATE jobs SET lease_expires_at = ? WHERE combo = ? AND owner = ? AND state = 'leased'",
+            (time.time() + lease_seconds, lease.combo, lease.owner),
+        )
+        return cur.rowcount == 1
+
+    def complete(self, lease: Lease):
+        # a lease that expired and went to someone else isn't ours to finish
+        self.db.execute(
+            "UPDATE jobs SET state = 'done', owner = NULL, completed_at = ? "
+            "WHERE combo = ? AND owner = ? AND state = 'leased'",
+            (time.time(), lease.combo, lease.owner),
+        )
+
+    def fail(self, lease: Lease, error: str = ""):
+        now = time.time()
+        if lease.attempt >= self.max_attempts:
+            self.db.execute(
+                "UPDATE jobs SET state = 'dead', owner = NULL, last_error = ? WHERE combo = ? AND owner = ?",
+                (error, lease.combo, lease.owner),
+            )
+        else:
+            self.db.execute(
+                "UPDATE jobs SET state = 'pending', owner = NULL, last_error = ?, available_at = ? "
+                "WHERE combo = ? AND owner = ?",
+                (error, now + backoff_seconds(lease.attempt), lease.combo, lease.owner),
+            )
+
+    def release(self, lease: Lease):
+        self.db.execute(
+            "UPDATE jobs SET state = 'pending', owner = NULL, attempts = attempts - 1 "
+            "WHERE combo = ? AND owner = ?",
+            (lease.combo, lease.owner),
+        )
+
+    def outstanding(self) -> int:
+        return self.db.execute(
+            "SELECT COUNT(*) FROM jobs WHERE state IN ('pending', 'leased')"
+        ).fetchone()[0]
+
+    def dead_letters(self) -> Dict[str, str]:
+        return dict(
+            self.db.execute("SELECT combo, last_error FROM jobs WHERE state = 'dead'")
+        )
+
+    def stats(self) -> Dict[str, Dict]:
+        return summarize_jobs(
+            self.db.execute(
+                "SELECT combo, state, attempts, first_leased_at, completed_at FROM jobs"
+            )
+        )
+
+
+class RedisWorkQueue(WorkQueue):
+    # several orchestrator machines pulling from one cohort
+    # takes any redis-py compatible client so it can be pointed at a local stand-in
+    def __init__(self, client, cohort: str, max_attempts: int = MAX_ATTEMPTS):
+        self.redis = client
+        self.max_attempts = max_attempts
+        prefix = f"pyterra:{cohort}"
+        # combo -> available_at
+        self.pending_key = f"{prefix}:pending"
+        # combo -> lease expiry
+        self.leased_key = f"{prefix}:leased"
+        self.owners_key = f"{prefix}:owners"
+        self.attempts_key = f"{prefix}:attempts"
+        self.errors_key = f"{prefix}:errors"
+        self.first_leased_key = f"{prefix}:first_leased_at"
+        self.completed_key = f"{prefix}:completed_at"
+        self.dead_key = f"{prefix}:dead"
+        self.all_key = f"{prefix}:all"
+        self.seq_key = f"{prefix}:seq"
+
+    @staticmethod
+    def from_url(url: str, cohort: str, max_attempts: int = MAX_ATTEMPTS):
+        import redis
+
+        return RedisWorkQueue(redis.Redis.from_url(url), cohort, max_attempts)
+
+    @staticmethod
+    def _str(value) -> Optional[str]:
+        if isinstance(value, bytes):
+            return value.decode("utf-8")
+        return value
+
+    def put(self, combos: List[str]) -> int:
+        added = []
+        for combo in combos:
+
+            def add(pipe):
+                if pipe.sismember(self.all_key, combo):
+                    return False
+                # a small increasing score keeps insertion order and is always "available now",
+                # a crash after the incr only leaves a gap in the sequence
+                seq = pipe.incr(self.seq_key)
+                pipe.multi()
+                # known and pending together, or neither, so a combo is never known but unqueueable
+                pipe.sadd(self.all_key, combo)
+                pipe.zadd(self.pending_key, {combo: seq})
+                return True
+
+            added.append(
+                self.redis.transaction(add, self.all_key, value_from_callable=True)
+            )
+        return sum(added)
+
+    def _reclaim_expired(self, now: float):
+        for combo in self.redis.zrangebyscore(self.leased_key, "-inf", now):
+            combo = self._str(combo)
+
+            def reclaim(pipe):
+                score = pipe.zscore(self.leased_key, combo)
+                if score is None or score >= now:
+                    return
+                attempts = int(pipe.hget(self.attempts_key, combo) or 0)
+                pipe.multi()
+                pipe.zrem(self.leased_key, combo)
+                pipe.hdel(self.owners_key, combo)
+                if attempts >= self.max_attempts:
+                    pipe.hset(self.errors_key, combo, "lease expired")
+                    pipe.sadd(self.dead_key, combo)
+                else:
+                    pipe.zadd(self.pending_key, {combo: now})
+
+            self.redis.transaction(reclaim, self.leased_key, self.attempts_key)
+
+    def lease(
+        self, owner: str, lease_seconds: float = LEASE_SECONDS
+    ) -> Optional[Lease]:
+        now = time.time()
+        self._reclaim_expired(now)
+        leased = {}
+
+        def claim(pipe):
+            leased.clear()
+            candidates = pipe.zrangebyscore(
+                self.pending_key, "-inf", now, start=0, num=1
+            )
+            if len(candidates) == 0:
+                return
+            combo = self._str(candidates[0])
+            attempt = int(pipe.hget(self.attempts_key, combo) or 0) + 1
+            pipe.multi()
+            pipe.zrem(self.pending_key, combo)
+            pipe.zadd(self.leased_key, {combo: now + lease_seconds})
+            pipe.hset(self.owners_key, combo, owner)
+            pipe.hset(self.attempts_key, combo, attempt)
+            pipe.hsetnx(self.first_leased_key, combo, now)
+            leased["lease"] = Lease(combo, owner, attempt, now + lease_seconds)
+
+        # WATCH on pending means two orchestrators can't both claim the head,
+        # redis-py re-runs claim() if someone else got there first
+        self.redis.transaction(claim, self.pending_key)
+        return leased.get("lease")
+
+    def _owned(self, lease: Lease) -> bool:
+        return self._str(self.redis.hget(self.owners_key, lease.combo)) == lease.owner
+
+    def heartbeat(self, lease: Lease, lease_seconds: float = LEASE_SECONDS) -> bool:
+        if not self._owned(lease):
+            return False
+        self.redis.zadd(
+            self.leased_key, {lease.combo: time.time() + lease_seconds}, xx=True
+        )
+        return True
+
+    def complete(self, lease: Lease):
+        if not self._owned(lease):
+            return
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.leased_key, lease.combo)
+        pipe.zrem(self.pending_key, lease.combo)
+        pipe.hdel(self.owners_key, lease.combo)
+        pipe.hset(self.completed_key, lease.combo, time.time())
+        pipe.execute()
+
+    def fail(self, lease: Lease, error: str = ""):
+        if not self._owned(lease):
+            return
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.leased_key, lease.combo)
+        pipe.hdel(self.owners_key, lease.combo)
+        pipe.hset(self.errors_key, lease.combo, error)
+        if lease.attempt >= self.max_attempts:
+            pipe.sadd(self.dead_key, lease.combo)
+        else:
+            pipe.zadd(
+                self.pending_key,
+                {lease.combo: time.time() + backoff_seconds(lease.attempt)},
+            )
+        pipe.execute()
+
+    def release(self, lease: Lease):
+        if not self._owned(lease):
+            return
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.leased_key, lease.combo)
+        pipe.hdel(self.owners_key, lease.combo)
+        pipe.hincrby(self.attempts_key, lease.combo, -1)
+        pipe.zadd(self.pending_key, {lease.combo: time.time()})
+        pipe.execute()
+
+    def outstanding(self) -> int:
+        return self.redis.zcard(self.pending_key) + self.redis.zcard(self.leased_key)
+
+    def dead_letters(self) -> Dict[str, str]:
+        return {
+            self._str(c): self._str(self.redis.hget(self.errors_key, c))
+            for c in self.redis.smembers(self.dead_key)
+        }
+
+    def stats(self) -> Dict[str, Dict]:
+        completed = {
+            self._str(k): float(v)
+            for k, v in self.redis.hgetall(self.completed_key).items()
+        }
+        attempts = {
+            self._str(k): int(v)
+            for k, v in self.redis.hgetall(self.attempts_key).items()
+        }
+        first_leased = {
+            self._str(k): float(v)
+            for k, v in self.redis.hgetall(self.first_leased_key).items()
+        }
+        dead = set(self._str(c) for c in self.redis.smembers(self.dead_key))
+        leased = set(self._str(c) for c in self.redis.zrange(self.leased_key, 0, -1))
+
+        jobs = []
+        for combo in self.redis.smembers(self.all_key):
+            combo = self._str(combo)
+            if combo in completed:
+                state = "done"
+            elif combo in dead:
+                state = "dead"
+            elif combo in leased:
+                state = "leased"
+            else:
+                state = "pending"
+            jobs.append(
+                (
+                    combo,
+                    state,
+                    attempts.get(combo, 0),
+                    first_leased.get(combo),
+                    completed.get(combo),
+                )
+            )
+        return summarize_jobs(jobs)
+
+
+def open_work_queue(spec: str, cohort: str) -> WorkQueue:
+    # "redis://host:6379/0" or a path to a sqlite file
+    if spec.startswith("redis://") or spec.startswith("rediss://"):
+        return RedisWorkQueue.from_url(spec, cohort)
+    if spec.startswith("sqlite://"):
+        spec = spec[len("sqlite://") :]
+    return SQLiteWorkQueue(spec)
+
+
+def print_queue_stats(work_queue: WorkQueue):
+    print(json.dumps(work_queue.stats(), indent=2, sort_keys=True), flush=True)
+    dead = work_queue.dead_letters()
+    if len(dead) > 0:
+        print(f"[!] {len(dead)} dead-lettered combos:", flush=True)
+        for combo, error in sorted(dead.items()):
+            print(f"    {combo}: {error}", flush=True)